@@ -0,0 +1,429 @@
+"""Benchmark layout, file I/O, undo history, picking and drawing on synthetic graphs.
+
+    python3 benchmark.py -o results.json
+    python3 benchmark.py --sizes 100,1000,10000 --graphs random,grid -o new.json --compare results.json
+
+Every benchmark runs on graphs from each generator at each size (10^2 to 10^6 vertices by
+default), repeated until --repeat runs or --time-budget seconds per case. Results are
+written as JSON, together with the commit and machine they were measured on, so runs from
+two commits can be compared with --compare, which logs the ratio of the median times and
+exits with status 1 if any case got slower than the threshold.
+
+The layout (force and stress), I/O and history benchmarks time the GraphModel methods the
+renderer delegates to (run_force_directed_algorithm, load_graph/save_graph, save_state/undo)
+and need neither Qt nor a display. Picking and painting time GraphRenderer itself in an offscreen OpenGL
+context and are skipped when no context can be created.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from force_kernels import get_kernels, DEFAULT_KERNELS
+from graph_io import load_graph_file, save_binary_graph, BINARY_EXTENSION
+from graph_model import GraphModel, INITIAL_POSITION_RANGE
+from graph_store import GraphStore
+from stress_layout import DEFAULT_PIVOTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIM = 3  # Dimension of the layouts this app draws
+DEFAULT_SIZES = (100, 1000, 10000, 100000, 1000000)
+# Above this many vertices the layout benchmark uses Barnes-Hut repulsion; exact repulsion is O(N^2)
+EXACT_LAYOUT_LIMIT = 10000
+# Side, in pixels, of the offscreen view that picking and painting are timed in
+VIEW_PIXELS = 800
+# --compare reports a case as a regression when its median time grew by more than this factor
+REGRESSION_THRESHOLD = 1.2
+
+
+def random_graph(size, rng):
+    """Return (num_vertices, edges) of a uniform random graph with two edges per vertex."""
+    edges = rng.integers(0, size, size=(2 * size, 2))
+    return size, edges[edges[:, 0] != edges[:, 1]]
+
+
+def grid_graph(size, rng):
+    """Return (num_vertices, edges) of a square grid with about `size` vertices."""
+    side = max(2, int(round(np.sqrt(size))))
+    rows = np.arange(side * side).reshape(side, side)
+    edges = [np.column_stack([rows[:, :-1].ravel(), rows[:, 1:].ravel()]),
+             np.column_stack([rows[:-1, :].ravel(), rows[1:, :].ravel()])]
+    return side * side, np.concatenate(edges)
+
+
+def lattice_graph(size, rng):
+    """Return (num_vertices, edges) of a cubic 3D lattice with about `size` vertices, like 3d.json."""
+    side = max(2, int(round(size ** (1 / 3))))
+    rows = np.arange(side ** 3).reshape(side, side, side)
+    edges = [np.column_stack([rows[:, :, :-1].ravel(), rows[:, :, 1:].ravel()]),
+             np.column_stack([rows[:, :-1, :].ravel(), rows[:, 1:, :].ravel()]),
+             np.column_stack([rows[:-1, :, :].ravel(), rows[1:, :, :].ravel()])]
+    return side ** 3, np.concatenate(edges)
+
+
+def tree_graph(size, rng, merge_fraction=0.1):
+    """Return (num_vertices, edges) of a binary tree in which some branches merge again, like sample_input_graph.json.
+
+    Besides its parent edge, `merge_fraction` of the vertices get an edge to a random
+    vertex on the next level down.
+    """
+    children = np.arange(1, size)
+    edges = [np.column_stack([(children - 1) // 2, children])]
+    depth = np.floor(np.log2(np.arange(size) + 1)).astype(np.int64)
+    merging = np.flatnonzero(rng.random(size) < merge_fraction)
+    first = 2 ** (depth[merging] + 1) - 1  # First row on the next level
+    merging, first = merging[first < size], first[first < size]
+    last = np.minimum(2 * first + 1, size)  # One past the last row on the next level
+    targets = first + (rng.random(len(first)) * (last - first)).astype(np.int64)
+    edges.append(np.column_stack([merging, targets]))
+    return size, np.concatenate(edges)
+
+
+def scale_free_graph(size, rng, edges_per_vertex=2):
+    """Return (num_vertices, edges) of a Barabasi-Albert preferential attachment graph.
+
+    Each new vertex links to `edges_per_vertex` earlier vertices, picked by choosing a random
+    end of an earlier edge, so targets are chosen in proportion to their degree. The choices
+    are made for all edges at once and then resolved by following them back to a source end.
+    """
+    m = edges_per_vertex
+    sources = np.repeat(np.arange(1, size), m)
+    # Slot 2e is the source of edge e and slot 2e+1 its target; each target copies an earlier slot
+    pick = (rng.random(len(sources)) * 2 * m * (sources - 1)).astype(np.int64)
+    pick[sources == 1] = -1  # The second vertex can only link to the first
+    while True:
+        chained = (pick >= 0) & (pick % 2 == 1)
+        if not chained.any():
+            break
+        pick[chained] = pick[pick[chained] // 2]
+    targets = np.where(pick < 0, 0, sources[np.maximum(pick, 0) // 2])
+    edges = np.unique(np.column_stack([targets, sources]), axis=0)
+    return size, edges
+
+
+GENERATORS = {
+    "random": random_graph,
+    "grid": grid_graph,
+    "scale_free": scale_free_graph,
+    "tree": tree_graph,
+    "lattice": lattice_graph,
+}
+
+
+def make_store(generator, size, dim, seed):
+    """Return a GraphStore of the named generator's graph with uniformly random positions."""
+    rng = np.random.default_rng(seed)
+    num_vertices, edges = GENERATORS[generator](size, rng)
+    positions = rng.uniform(-INITIAL_POSITION_RANGE, INITIAL_POSITION_RANGE, size=(num_vertices, dim))
+    return GraphStore.from_arrays(np.arange(num_vertices), positions, edges)
+
+
+def time_runs(run, setup=None, repeat=5, time_budget=1.0):
+    """Return the times of calls to run(), each after an untimed setup().
+
+    Stops after `repeat` runs, or earlier once the runs took `time_budget` seconds in total.
+    """
+    times = []
+    while len(times) < repeat:
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+        if sum(times) >= time_budget:
+            break
+    return times
+
+
+def load_model(store):
+    """Return a GraphModel holding a copy of `store`, as after loading it in the app."""
+    model = GraphModel(store.dim)
+    model.load_store(store.copy())
+    return model
+
+
+def bench_layout(store, options):
+    """Time a fixed number of force-directed layout iterations."""
+    model = load_model(store)
+    model.force_iterations = options.layout_iterations
+    model.layout_tolerance = 0.0  # Never converge early, so every run does the same work
+    model.repulsion_mode = "exact" if store.num_vertices <= EXACT_LAYOUT_LIMIT else "barnes_hut"
+    model.force_kernels = options.kernels
+    initial = store.positions.copy()
+
+    def setup():
+        model.store.positions[:] = initial
+    yield "layout", time_runs(model.run_layout, setup, options.repeat, options.time_budget), {
+        "iterations": options.layout_iterations, "repulsion": model.repulsion_mode,
+        "kernels": get_kernels(options.kernels).name}
+
+
+def bench_stress_layout(store, options):
+    """Time pivot selection and MDS followed by up to --layout-iterations stress majorization sweeps."""
+    model = load_model(store)
+    model.layout_mode = "stress"
+    model.stress_iterations = options.layout_iterations
+    model.stress_pivots = options.pivots
+    yield "stress_layout", time_runs(model.run_layout, None, options.repeat, options.time_budget), {
+        "iterations": options.layout_iterations, "pivots": model.stress_pivots,
+        "stress": model.last_layout_stats["stress"]}
+
+
+def bench_io(store, options):
+    """Time saving and loading the graph as JSON (as the app writes it) and as a binary file."""
+    model = load_model(store)
+    with tempfile.TemporaryDirectory() as directory:
+        for file_format, extension in (("json", ".json"), ("binary", BINARY_EXTENSION)):
+            path = os.path.join(directory, "graph" + extension)
+
+            def save():
+                if file_format == "binary":
+                    save_binary_graph(path, model.store)
+                else:
+                    with open(path, "w") as file:
+                        json.dump(model.save_graph(), file, indent=4)
+
+            def load():
+                model.load_store(load_graph_file(path, store.dim))
+            yield "save_" + file_format, time_runs(save, None, options.repeat, options.time_budget), {}
+            yield "load_" + file_format, time_runs(load, None, options.repeat, options.time_budget), {
+                "bytes": os.path.getsize(path)}
+
+
+def bench_history(store, options):
+    """Time recording a move of every vertex as an undo step, and undoing it."""
+    model = load_model(store)
+    rng = np.random.default_rng(options.seed)
+    before = {}
+
+    def move():
+        before["positions"] = model.store.positions.copy()
+        model.store.positions[:] += rng.normal(scale=0.01, size=model.store.positions.shape)
+
+    def move_and_save():
+        move()
+        model.save_moves(before["positions"])
+    yield "save_state", time_runs(lambda: model.save_moves(before["positions"]), move, options.repeat,
+                                  options.time_budget), {}
+    yield "undo", time_runs(model.undo, move_and_save, options.repeat, options.time_budget), {}
+
+
+# Makes an offscreen OpenGL context current with a framebuffer to draw into; returns the Qt objects
+# that must be kept alive, or None if no context can be created (for example without a display)
+def open_gl_context(width, height):
+    from PyQt5.QtGui import QOffscreenSurface, QOpenGLContext, QOpenGLFramebufferObject
+    context = QOpenGLContext()
+    if not context.create():
+        return None
+    surface = QOffscreenSurface()
+    surface.setFormat(context.format())
+    surface.create()
+    if not context.makeCurrent(surface):
+        return None
+    framebuffer = QOpenGLFramebufferObject(width, height, QOpenGLFramebufferObject.CombinedDepthStencil)
+    framebuffer.bind()
+    return context, surface, framebuffer
+
+
+def bench_renderer(store, options):
+    """Time drawing frames and picking vertices with the renderer, in the current OpenGL context."""
+    from OpenGL.GL import glFinish
+    from graph_renderer import GraphRenderer
+    from spatial_index import project_to_screen
+    renderer = GraphRenderer()
+    renderer.resize(VIEW_PIXELS, VIEW_PIXELS)
+    renderer.load_store(store.copy())
+    renderer.initializeGL()
+    renderer.resizeGL(VIEW_PIXELS, VIEW_PIXELS)
+
+    def paint():
+        renderer.paintGL()
+        glFinish()
+
+    def invalidate():
+        renderer.positions_changed()
+        renderer.topology_changed()
+    details = {"level_of_detail": renderer.use_level_of_detail()}
+    # A frame after every row changed re-sends the buffers (or rebuilds the level of detail)
+    yield "paint_upload", time_runs(paint, invalidate, options.repeat, options.time_budget), details
+    yield "paint", time_runs(paint, None, options.repeat, options.time_budget), details
+
+    # Clicks land on random vertices; the selection is cleared first so no edge is ever added
+    rows = iter(np.random.default_rng(options.seed).integers(0, store.num_vertices, size=options.repeat))
+    click = {}
+
+    def aim():
+        renderer.selected_vertices = []
+        row = next(rows)
+        if store.dim == 2:
+            click["at"] = renderer.model.store.positions[row]
+        else:
+            click["at"] = project_to_screen(renderer.model.store.positions[row:row + 1], *renderer.view_matrices)[0]
+    select = renderer.select_vertex if store.dim == 2 else renderer.select_vertex_at_screen_pos
+    yield "select_vertex", time_runs(lambda: select(*click["at"][:2]), aim, options.repeat, options.time_budget), {}
+
+
+BENCHMARKS = {
+    "layout": bench_layout,
+    "stress_layout": bench_stress_layout,
+    "io": bench_io,
+    "history": bench_history,
+    "render": bench_renderer,
+}
+
+
+# Returns the commit the benchmarked code is at, marked "+dirty" if the tree has changes, or None outside git
+def git_revision():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=directory, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=directory, capture_output=True,
+                                text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+dirty" if status.strip() else "")
+
+
+def run_benchmarks(benchmarks, generators, sizes, dim, options):
+    """Run every benchmark on every generator and size; returns the list of result dicts."""
+    results = []
+    gl_context = None
+    if "render" in benchmarks:
+        try:
+            from PyQt5.QtWidgets import QApplication
+            application = QApplication.instance() or QApplication(sys.argv[:1])
+            gl_context = open_gl_context(VIEW_PIXELS, VIEW_PIXELS)
+        except ImportError as e:
+            logger.warning("Skipping the render benchmarks: %s", e)
+        else:
+            if gl_context is None:
+                logger.warning("Skipping the render benchmarks: no OpenGL context could be created.")
+        if gl_context is None:
+            benchmarks = [name for name in benchmarks if name != "render"]
+
+    for generator in generators:
+        for size in sizes:
+            store = make_store(generator, size, dim, options.seed)
+            for benchmark in benchmarks:
+                for name, times, details in BENCHMARKS[benchmark](store, options):
+                    result = {
+                        "benchmark": name,
+                        "graph": generator,
+                        "size": size,
+                        "vertices": store.num_vertices,
+                        "edges": store.num_edges,
+                        "runs": len(times),
+                        "min": min(times),
+                        "median": float(np.median(times)),
+                        "mean": float(np.mean(times)),
+                        "times": times,
+                    }
+                    result.update(details)
+                    results.append(result)
+                    logger.info("%-13s %-10s %8d vertices %8d edges: median %.6f s over %d runs",
+                                name, generator, store.num_vertices, store.num_edges, result["median"], len(times))
+    return results
+
+
+def compare_results(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Log the median time of each case against `baseline` results; returns the cases slower than `threshold`."""
+    previous = {(result["benchmark"], result["graph"], result["size"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = (result["benchmark"], result["graph"], result["size"])
+        if key not in previous:
+            continue
+        ratio = result["median"] / max(previous[key]["median"], 1e-12)
+        slower = ratio > threshold
+        if slower:
+            regressions.append(dict(result, baseline_median=previous[key]["median"], ratio=ratio))
+        (logger.warning if slower else logger.info)("%-13s %-10s %8d: %.6f s -> %.6f s (x%.2f)%s", *key,
+                                                    previous[key]["median"], result["median"], ratio,
+                                                    " REGRESSION" if slower else "")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark layout, I/O, history, picking and drawing.")
+    parser.add_argument("-o", "--output", help="file to write the JSON results to (default: standard output)")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS),
+                        help="comma-separated benchmarks to run (%s)" % ", ".join(BENCHMARKS))
+    parser.add_argument("--graphs", default=",".join(GENERATORS),
+                        help="comma-separated graph generators (%s)" % ", ".join(GENERATORS))
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated numbers of vertices")
+    parser.add_argument("--dim", type=int, choices=(2, 3), default=DEFAULT_DIM, help="layout dimension")
+    parser.add_argument("--repeat", type=int, default=5, help="maximum runs of each case")
+    parser.add_argument("--time-budget", type=float, default=1.0,
+                        help="seconds after which a case is not repeated further")
+    parser.add_argument("--layout-iterations", type=int, default=3, help="layout iterations per run")
+    parser.add_argument("--pivots", type=int, default=DEFAULT_PIVOTS, help="pivot vertices of the stress layout")
+    parser.add_argument("--kernels", choices=("numpy", "numba", "auto"), default=DEFAULT_KERNELS,
+                        help="force kernel backend of the layout benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the graph generators")
+    parser.add_argument("--compare", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown factor reported as a regression by --compare")
+    parser.add_argument("--log-level", default=os.environ.get("GRAPH_LOG_LEVEL", "INFO"), help="logging level")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if logging.getLogger().getEffectiveLevel() > logging.DEBUG:
+        # Every run loads, lays out or selects; the app's own messages would drown the results
+        for name in ("graph_model", "graph_renderer"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    benchmarks = [name for name in args.benchmarks.split(",") if name]
+    generators = [name for name in args.graphs.split(",") if name]
+    unknown = [name for name in benchmarks if name not in BENCHMARKS] + [name for name in generators
+                                                                         if name not in GENERATORS]
+    if unknown:
+        parser.error("unknown benchmark or graph: %s" % ", ".join(unknown))
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+
+    started = time.perf_counter()
+    results = run_benchmarks(benchmarks, generators, sizes, args.dim, args)
+    report = {
+        "metadata": {
+            "commit": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "dim": args.dim,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "time_budget": args.time_budget,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "elapsed": time.perf_counter() - started,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        logger.info("Wrote %d results to %s", len(results), args.output)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare_results(results, json.load(file), args.threshold)
+        if regressions:
+            logger.warning("%d of %d cases are more than x%.2f slower than %s.", len(regressions), len(results),
+                           args.threshold, args.compare)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
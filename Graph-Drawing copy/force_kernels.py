@@ -0,0 +1,189 @@
+import logging
+import os
+import numpy as np
+from adjacency import CSRAdjacency
+
+try:
+    import numba  # Optional; without it the NumPy kernels are used
+except ImportError:
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the size of the temporary (rows, N, dim) block used by the
+# all-pairs repulsion pass, so memory stays flat as the graph grows
+MAX_BLOCK_BYTES = 32 * 1024 * 1024
+
+# Kernels used when a layout does not name any: "numpy", "numba" or "auto" (the fastest installed)
+DEFAULT_KERNELS = os.environ.get("GRAPH_FORCE_KERNELS", "numpy")
+
+# A backend whose forces differ from the NumPy reference by more than this (relative to the
+# size of the reference forces) on the check graph is not used
+VERIFY_TOLERANCE = 1e-9
+
+# Size of the random graph backends are checked on before first use
+VERIFY_VERTICES = 300
+
+
+# Computes the all-pairs repulsive forces in row blocks of bounded size
+def repulsive_forces(positions, c_repulse, max_block_bytes=MAX_BLOCK_BYTES, rows=None, columns=None):
+    """Return the repulsive force on every vertex (or only on `rows`) from every other vertex.
+
+    `columns` restricts the vertices doing the repelling; by default all of them do.
+    """
+    n, dim = positions.shape
+    rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.int64)
+    sources = positions if columns is None else positions[np.asarray(columns, dtype=np.int64)]
+    forces = np.zeros((len(rows), dim), dtype=positions.dtype)
+    rows_per_block = max(1, max_block_bytes // max(1, len(sources) * dim * positions.itemsize))
+    for start in range(0, len(rows), rows_per_block):
+        stop = min(start + rows_per_block, len(rows))
+        delta = positions[rows[start:stop], None, :] - sources[None, :, :]
+        distance = np.sqrt(np.einsum("ijk,ijk->ij", delta, delta)) + 0.01  # Avoid division by zero
+        # The self pair has delta == 0 and contributes nothing, as in the original loop
+        forces[start:stop] = c_repulse * (delta / (distance**2)[:, :, None]).sum(axis=1)
+    return forces
+
+
+class NumpyKernels:
+    """Reference force kernels: blocked all-pairs repulsion and CSR segment-sum attraction as array operations."""
+
+    name = "numpy"
+
+    def repulsion(self, positions, c_repulse, rows=None, columns=None, max_block_bytes=MAX_BLOCK_BYTES):
+        """Return the exact repulsive force on every vertex (or `rows`) from every vertex (or `columns`)."""
+        return repulsive_forces(positions, c_repulse, max_block_bytes, rows=rows, columns=columns)
+
+    def attraction(self, adjacency, positions, c_attract, k, rows=None):
+        """Return the attractive force on every row (or `rows`) from its incident edges in `adjacency`."""
+        return adjacency.attractive_forces(positions, c_attract, k, rows=rows)
+
+
+if numba is not None:
+    # Each row sums its pairs in a private accumulator, so rows run in parallel without temporaries
+    @numba.njit(parallel=True, cache=True)
+    def _numba_repulsion(positions, rows, sources, c_repulse):
+        dim = positions.shape[1]
+        forces = np.zeros((len(rows), dim))
+        for i in numba.prange(len(rows)):
+            row = rows[i]
+            for j in range(len(sources)):
+                squared = 0.0
+                for axis in range(dim):
+                    delta = positions[row, axis] - sources[j, axis]
+                    squared += delta * delta
+                distance = np.sqrt(squared) + 0.01
+                scale = c_repulse / (distance * distance)
+                for axis in range(dim):
+                    forces[i, axis] += (positions[row, axis] - sources[j, axis]) * scale
+        return forces
+
+    # Walks each row's CSR segment, as CSRAdjacency.attractive_forces does with reduceat
+    @numba.njit(parallel=True, cache=True)
+    def _numba_attraction(positions, offsets, targets, rows, c_attract, k):
+        dim = positions.shape[1]
+        forces = np.zeros((len(rows), dim))
+        for i in numba.prange(len(rows)):
+            row = rows[i]
+            for entry in range(offsets[row], offsets[row + 1]):
+                target = targets[entry]
+                squared = 0.0
+                for axis in range(dim):
+                    delta = positions[target, axis] - positions[row, axis]
+                    squared += delta * delta
+                scale = c_attract * (np.sqrt(squared) + 0.01 - k)
+                for axis in range(dim):
+                    forces[i, axis] += (positions[target, axis] - positions[row, axis]) * scale
+        return forces
+
+
+class NumbaKernels:
+    """JIT-compiled force kernels (needs numba): one loop over the rows, split across all cores.
+
+    Compiled on first use and cached on disk. Forces match the NumPy reference up to
+    floating-point summation order.
+    """
+
+    name = "numba"
+
+    def repulsion(self, positions, c_repulse, rows=None, columns=None, max_block_bytes=MAX_BLOCK_BYTES):
+        """Return the exact repulsive force on every vertex (or `rows`) from every vertex (or `columns`)."""
+        positions = np.ascontiguousarray(positions, dtype=np.float64)
+        rows = np.arange(len(positions)) if rows is None else np.asarray(rows, dtype=np.int64)
+        sources = positions if columns is None else positions[np.asarray(columns, dtype=np.int64)]
+        return _numba_repulsion(positions, rows, sources, float(c_repulse))
+
+    def attraction(self, adjacency, positions, c_attract, k, rows=None):
+        """Return the attractive force on every row (or `rows`) from its incident edges in `adjacency`."""
+        positions = np.ascontiguousarray(positions, dtype=np.float64)
+        rows = np.arange(adjacency.num_rows) if rows is None else np.asarray(rows, dtype=np.int64)
+        return _numba_attraction(positions, adjacency.offsets, np.asarray(adjacency.targets, dtype=np.int64),
+                                 rows, float(c_attract), float(k))
+
+
+KERNELS = {"numpy": NumpyKernels, "numba": NumbaKernels}
+_REFERENCE = NumpyKernels()
+_checked = {}  # Backend name -> verified instance, or None if it cannot be used
+
+
+def available_kernels():
+    """Return the names of the backends that can run here."""
+    return [name for name in KERNELS if name == "numpy" or numba is not None]
+
+
+def verify_kernels(kernels, num_vertices=VERIFY_VERTICES, seed=0):
+    """Return the largest relative difference between `kernels` and the NumPy reference on random graphs.
+
+    Both kernels are run in 2D and 3D, on all rows and on a subset of rows and columns.
+    """
+    rng = np.random.default_rng(seed)
+    error = 0.0
+    for dim in (2, 3):
+        positions = rng.uniform(-5, 5, size=(num_vertices, dim))
+        adjacency = CSRAdjacency.from_edges(num_vertices, rng.integers(0, num_vertices, size=(2 * num_vertices, 2)))
+        rows = np.sort(rng.choice(num_vertices, num_vertices // 3, replace=False))
+        columns = np.sort(rng.choice(num_vertices, num_vertices // 2, replace=False))
+        pairs = [
+            (kernels.repulsion(positions, 0.5), _REFERENCE.repulsion(positions, 0.5)),
+            (kernels.repulsion(positions, 0.5, rows=rows, columns=columns),
+             _REFERENCE.repulsion(positions, 0.5, rows=rows, columns=columns)),
+            (kernels.attraction(adjacency, positions, 0.1, 0.3), _REFERENCE.attraction(adjacency, positions, 0.1, 0.3)),
+            (kernels.attraction(adjacency, positions, 0.1, 0.3, rows=rows),
+             _REFERENCE.attraction(adjacency, positions, 0.1, 0.3, rows=rows)),
+        ]
+        for forces, reference in pairs:
+            error = max(error, float(np.linalg.norm(forces - reference) / max(np.linalg.norm(reference), 1e-300)))
+    return error
+
+
+def get_kernels(name=None):
+    """Return the force kernels called `name` ("numpy", "numba" or "auto"; default DEFAULT_KERNELS).
+
+    "auto" picks the fastest installed backend. A backend other than NumPy is checked against
+    the NumPy reference on first use; if it is not installed or fails the check, a warning is
+    logged and the NumPy kernels are returned instead.
+    """
+    name = name or DEFAULT_KERNELS
+    if name == "auto":
+        name = "numba" if numba is not None else "numpy"
+    if name not in KERNELS:
+        raise ValueError(f"Unknown force kernels: {name}")
+    if name == "numpy":
+        return _REFERENCE
+    if name not in _checked:
+        kernels = None
+        if numba is None:
+            logger.warning("Force kernels %r need numba, which is not installed; using NumPy.", name)
+        else:
+            try:
+                error = verify_kernels(KERNELS[name]())
+            except Exception as e:
+                logger.warning("Force kernels %r failed to run (%s); using NumPy.", name, e)
+            else:
+                if error > VERIFY_TOLERANCE:
+                    logger.warning("Force kernels %r differ from NumPy by %.3g; using NumPy.", name, error)
+                else:
+                    kernels = KERNELS[name]()
+                    logger.info("Using %s force kernels (relative difference from NumPy %.3g).", name, error)
+        _checked[name] = kernels
+    return _checked[name] or _REFERENCE
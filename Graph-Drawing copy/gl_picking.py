@@ -0,0 +1,111 @@
+import numpy as np
+from OpenGL.GL import *
+from gl_buffers import decode_vertex_ids
+
+
+class ColourPicker:
+    """Picks vertices by drawing their ids as colours into an offscreen framebuffer.
+
+    The id image is drawn with the camera of the last visible frame and depth testing on, so
+    only vertices that are actually visible can be picked, and edges in front of a vertex hide
+    it as they do on screen. A click then reads back the pixels within the pick radius and
+    takes the one nearest the cursor, which costs the same however many vertices there are.
+    The id image is redrawn only when the scene changed since the previous pick.
+    """
+
+    def __init__(self):
+        self.framebuffer = None
+        self.renderbuffers = None
+        self.size = (0, 0)
+        self.dirty = True  # The scene changed since the id image was drawn
+
+    def invalidate(self):
+        """Redraw the id image on the next pick."""
+        self.dirty = True
+
+    # (Re)allocates the framebuffer at the viewport size; needs a current GL context
+    def _ensure_framebuffer(self, width, height):
+        if self.framebuffer is not None and self.size == (width, height):
+            return
+        if self.framebuffer is None:
+            self.framebuffer = glGenFramebuffers(1)
+            self.renderbuffers = glGenRenderbuffers(2)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        for renderbuffer, storage, attachment in zip(self.renderbuffers, (GL_RGBA8, GL_DEPTH_COMPONENT24),
+                                                     (GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT)):
+            glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, storage, width, height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, renderbuffer)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Picking framebuffer is incomplete.")
+        self.size = (width, height)
+        self.dirty = True
+
+    # Draws the vertex ids with the given camera; edges only write depth, so they still occlude
+    def _draw_ids(self, buffers, view, point_size, line_width):
+        modelview, projection, viewport = view
+        glViewport(*[int(value) for value in viewport])
+        glClearColor(0.0, 0.0, 0.0, 0.0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glEnable(GL_DEPTH_TEST)
+        glDisable(GL_DITHER)
+        glDisable(GL_BLEND)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadMatrixd(projection)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadMatrixd(modelview)
+        glPointSize(point_size)
+        buffers.draw_vertex_ids()
+        glColorMask(GL_FALSE, GL_FALSE, GL_FALSE, GL_FALSE)
+        glLineWidth(line_width)
+        buffers.draw_edges()
+        glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+
+    def pick(self, buffers, view, x, y, radius, point_size, line_width):
+        """Return the row of the visible vertex nearest to window point (x, y) within `radius` pixels, or None.
+
+        `buffers` must be synced with the graph and `view` is the (modelview, projection,
+        viewport) the visible frame was drawn with. Needs a current GL context.
+        """
+        _, _, viewport = view
+        width, height = int(viewport[2]), int(viewport[3])
+        if width <= 0 or height <= 0:
+            return None
+        previous_framebuffer = glGetIntegerv(GL_FRAMEBUFFER_BINDING)
+        glPushAttrib(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT | GL_ENABLE_BIT | GL_VIEWPORT_BIT
+                     | GL_POINT_BIT | GL_LINE_BIT)
+        try:
+            self._ensure_framebuffer(width, height)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+            if self.dirty:
+                self._draw_ids(buffers, view, point_size, line_width)
+                self.dirty = False
+
+            # Only the window around the cursor is read back
+            x, y, radius = int(round(x)), int(round(y)), int(np.ceil(radius))
+            left, bottom = max(0, x - radius), max(0, y - radius)
+            right, top = min(width, x + radius + 1), min(height, y + radius + 1)
+            if left >= right or bottom >= top:
+                return None
+            glPixelStorei(GL_PACK_ALIGNMENT, 1)
+            pixels = glReadPixels(left, bottom, right - left, top - bottom, GL_RGBA, GL_UNSIGNED_BYTE)
+        finally:
+            glBindFramebuffer(GL_FRAMEBUFFER, int(previous_framebuffer))
+            glPopAttrib()
+
+        rows = decode_vertex_ids(np.frombuffer(pixels, dtype=np.uint8).reshape(top - bottom, right - left, 4))
+        pixel_y, pixel_x = np.nonzero((rows >= 0) & (rows < buffers.positions.count))
+        if len(pixel_x) == 0:
+            return None
+        distances = (pixel_x + left - x) ** 2 + (pixel_y + bottom - y) ** 2
+        best = np.argmin(distances)
+        if distances[best] > radius * radius:
+            return None
+        return int(rows[pixel_y[best], pixel_x[best]])
@@ -0,0 +1,558 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+import numpy as np
+from force_kernels import DEFAULT_KERNELS, get_kernels
+from layout_engine import ForceLayout, LocalField
+from graph_store import GraphStore
+from initial_placement import spectral_positions, place_at_barycentres
+from history import History, AddVertex, AddEdge, MovePositions, ReplaceGraph, CompoundCommand, DEFAULT_MAX_BYTES
+from layout_quality import sampled_stress
+from multilevel import MultilevelLayout
+from stress_layout import PivotStressLayout, DEFAULT_PIVOTS
+
+logger = logging.getLogger(__name__)
+
+# Force constants of the 2D and 3D apps, keyed by dimension; the ideal edge length is
+# k = k_scale * sqrt(1 / N)
+FORCE_CONSTANTS = {
+    2: {"k_scale": 5.0, "c_attract": 0.1, "c_repulse": 0.5, "c_center": 0.0},
+    3: {"k_scale": 2.5, "c_attract": 0.1, "c_repulse": 0.15, "c_center": 0.01},  # Repulsion reduced for 3D
+}
+# Vertices loaded without a position are placed uniformly in [-5, 5] on every axis
+INITIAL_POSITION_RANGE = 5
+# New vertices without a given position are placed uniformly in this range on every axis
+NEW_VERTEX_RANGE = {2: 10, 3: 7}
+# Seconds between checks for new snapshots of a layout running in a worker process
+PROCESS_POLL_SECONDS = 0.01
+# Settings a multi-start or layout_process layout copies into its worker processes, so they run the same layout
+LAYOUT_SETTINGS = ("force_iterations", "layout_tolerance", "layout_cooling", "repulsion_mode", "barnes_hut_theta",
+                   "layout_mode", "multilevel_refine_iterations", "multi_start_score", "force_kernels",
+                   "stress_pivots", "stress_iterations")
+
+
+# Runs in a worker process of a multi-start layout: lays out the graph from the start given by `seed`
+def _layout_from_seed(dim, num_vertices, edges, settings, seed):
+    model = GraphModel(dim, keep_history=False)
+    for name, value in settings.items():
+        setattr(model, name, value)
+    model.store = GraphStore.from_arrays(np.arange(num_vertices), np.zeros((num_vertices, dim)), edges)
+    positions, stats = model.layout_from_seed(seed)
+    return seed, positions, stats
+
+
+# Pause and cancel events of the layout_process layout in this worker process, set by _set_layout_controls
+_resume_layout = _cancel_layout = None
+
+
+# Runs when a layout_process worker starts; events can only reach a process when it is created
+def _set_layout_controls(resume, cancel):
+    global _resume_layout, _cancel_layout
+    _resume_layout, _cancel_layout = resume, cancel
+
+
+# Runs in the worker process of a layout_process layout: lays out the positions last published in
+# `shared`, publishing a snapshot every `callback_every` iterations; at each one it waits while the
+# layout is paused and stops if it was cancelled
+def _layout_into_shared(dim, edges, settings, seed, shared, callback_every):
+    model = GraphModel(dim, keep_history=False)
+    for name, value in settings.items():
+        setattr(model, name, value)
+    positions = shared.latest()[0].copy()
+    model.store = GraphStore.from_arrays(np.arange(len(positions)), positions, edges)
+
+    def snapshot(iteration, positions):
+        shared.publish(positions, iteration)
+        _resume_layout.wait()
+        return not _cancel_layout.is_set()
+
+    positions = model.make_layout_run(model.store.positions, edges, seed=seed)(snapshot, callback_every)
+    shared.publish(positions, shared.iteration)
+    return model.last_layout_stats
+
+
+# Wraps run(callback, callback_every) so its snapshots and result are published into `shared`
+# and the callback sees views of the shared buffers rather than the layout's own array
+def _publishing(run, shared):
+    def publishing_run(callback, callback_every):
+        def publish(iteration, positions):
+            shared.publish(positions, iteration)
+            return None if callback is None else callback(iteration, shared.latest()[0])
+
+        shared.publish(run(publish, callback_every), shared.iteration)
+        return shared.latest()[0]
+    return publishing_run
+
+
+class GraphModel:
+    """The graph being edited and laid out, with undo/redo, free of Qt and OpenGL.
+
+    GraphRenderer wraps a model and draws it; batch tools use one directly. Whoever caches
+    derived data (such as GPU buffers) passes itself as `listener` and is told which rows
+    and edges changed through its positions_changed(rows) and topology_changed(edges)
+    methods, where None means everything.
+    """
+
+    def __init__(self, dim, listener=None, seed=None, keep_history=True):
+        self.dim = dim
+        self.store = GraphStore(dim=dim)  # Vertex ids, positions and edges in contiguous arrays
+        self.history = History(max_bytes=DEFAULT_MAX_BYTES)  # Undo/redo commands, capped by the memory they hold
+        self.keep_history = keep_history  # Record undo steps and the reset state; off for one-shot batch jobs
+        self.initial_graph_state = None
+        self.listener = listener
+        self.rng = np.random.default_rng(seed)  # Source of random initial and new-vertex positions
+        self.force_iterations = 200  # Maximum iterations for force-directed layout; stops earlier once converged
+        self.layout_tolerance = 1e-3  # Converged once no vertex moves further than this in one iteration
+        self.layout_cooling = "adaptive"  # "adaptive" (Hu-style step control) or "fixed" (forces * 0.1)
+        self.last_layout_stats = None  # Iterations, final energy and wall time of the last layout run
+        self.incremental_layout = True  # Relax the neighbourhood of each added edge and randomly placed vertex
+        self.incremental_hops = 2  # Size of the relaxed neighbourhood, in edges
+        self.incremental_iterations = 30  # Maximum iterations of each local relayout
+        self.local_field = LocalField()  # Near-field grid and far-field tree of local relayouts, reused between edits
+        self.repulsion_mode = "exact"  # "exact" or "barnes_hut" (approximate, for large graphs)
+        self.barnes_hut_theta = 0.8  # Barnes-Hut opening angle; smaller is more accurate
+        self.force_kernels = DEFAULT_KERNELS  # "numpy", "numba" (JIT, all cores; falls back to NumPy) or "auto"
+        self.layout_mode = "force"  # "force", "multilevel" (coarsen, lay out, refine) or "stress" (pivot MDS + stress)
+        self.multilevel_refine_iterations = 10  # Iterations spent refining each finer level
+        self.stress_pivots = DEFAULT_PIVOTS  # Pivot vertices of the "stress" layout; more is slower but more faithful
+        self.stress_iterations = 100  # Maximum stress majorization sweeps after pivot MDS; 0 keeps the MDS layout
+        self.profiler = None  # LayoutProfiler timing the phases of full layout runs, if profiling
+        self.multi_start = 1  # Layouts run from this many random starts, keeping the best; 1 lays out the current positions
+        self.multi_start_workers = None  # Processes running the starts of a multi-start layout (default: one per CPU)
+        self.multi_start_score = "stress"  # "stress" (sampled_stress) or "energy" (final sum of squared forces); lower wins
+        self.layout_process = False  # Run shared-memory background layouts in a worker process instead of the calling thread
+        self.initial_placement = "random"  # "random" or "spectral" (low Laplacian eigenvectors; new vertices at their neighbours' barycentre)
+
+    def positions_changed(self, rows=None):
+        """Tell the listener that the positions of `rows` (default: all rows) changed."""
+        if self.listener is not None:
+            self.listener.positions_changed(rows)
+
+    def topology_changed(self, edges=None):
+        """Tell the listener that the given edges (default: all edges) changed."""
+        if self.listener is not None:
+            self.listener.topology_changed(edges)
+
+    # Records an edit as a command holding only what changed, so it can be undone
+    def save_state(self, command):
+        """Push an edit onto the undo/redo history."""
+        if self.keep_history:
+            self.history.push(command)
+
+    # Records moved positions as one undoable step
+    def save_moves(self, before, rows=None):
+        """Push the move from `before` to the current positions (of `rows`, if given)."""
+        if self.keep_history:
+            after = self.store.positions if rows is None else self.store.positions[rows]
+            self.history.push(MovePositions.between(before, after, rows=rows))
+
+    def undo(self):
+        """Undo the last action and return its command, or None if there is nothing to undo."""
+        if not self.history.can_undo():
+            logger.info("No more actions to undo.")
+            return None
+        command = self.history.undo(self.store)
+        self.command_changed(command)
+        logger.info("Undo performed.")
+        return command
+
+    def redo(self):
+        """Redo the last undone action and return its command, or None if there is nothing to redo."""
+        if not self.history.can_redo():
+            logger.info("No more actions to redo.")
+            return None
+        command = self.history.redo(self.store)
+        self.command_changed(command)
+        logger.info("Redo performed.")
+        return command
+
+    # Maps a history command to the rows and edges it changed, so undo/redo reports only those
+    def command_changed(self, command):
+        """Tell the listener what an undone or redone command changed."""
+        if isinstance(command, CompoundCommand):
+            for part in command.commands:
+                self.command_changed(part)
+        elif isinstance(command, MovePositions):
+            self.positions_changed(command.rows)
+        elif isinstance(command, AddVertex):
+            self.positions_changed([self.store.num_vertices - 1])
+        elif isinstance(command, AddEdge):
+            self.topology_changed([self.store.num_edges - 1])
+        else:
+            self.positions_changed()
+            self.topology_changed()
+
+    # Swaps in a new store as one undoable step and starts the reset state from it
+    def replace_store(self, store):
+        previous, self.store = self.store, store
+        if self.initialize_vertex_positions():
+            store.remap = None  # Placed vertices make it differ from the file it was mapped from
+        self.positions_changed()
+        self.topology_changed()
+        self.save_state(ReplaceGraph(previous, self.store))
+        self.save_initial_state()
+        store.remap = None  # Edited from here on; the history and reset state keep their own mappings
+
+    def set_graph(self, graph):
+        """Replace the graph with the given graph data; vertices without positions are placed randomly."""
+        self.replace_store(GraphStore.from_dict(graph, dim=self.dim))
+
+    def load_graph(self, graph_data):
+        """Replace the graph with graph data loaded from JSON, which must include positions.
+
+        Raises KeyError for missing keys and ValueError for malformed data.
+        """
+        if "vertices" not in graph_data or "edges" not in graph_data or "positions" not in graph_data:
+            raise KeyError("The JSON file must contain 'vertices', 'edges', and 'positions' keys.")
+        self.load_store(GraphStore.from_dict(graph_data, dim=self.dim))
+
+    # Takes a store that was built elsewhere, such as by the streaming loader in graph_io
+    def load_store(self, store):
+        """Replace the graph with the given GraphStore."""
+        self.replace_store(store)
+        logger.info("Graph loaded successfully: %d vertices, %d edges.", self.store.num_vertices, self.store.num_edges)
+
+    # Assigns positions to any vertices that don't have them: in "spectral" placement a graph with no
+    # positions at all is drawn by its Laplacian eigenvectors, and vertices joined to positioned ones
+    # start at their neighbours' barycentre; everything else is placed randomly
+    def initialize_vertex_positions(self):
+        """Initialize vertex positions if not already set and return how many were placed."""
+        missing = np.isnan(self.store.positions).any(axis=1)
+        count = int(missing.sum())
+        if self.initial_placement == "spectral" and count:
+            adjacency = self.store.adjacency()
+            if missing.all():
+                started = time.perf_counter()
+                self.store.positions[:], iterations = spectral_positions(adjacency, self.dim, self.rng,
+                                                                         INITIAL_POSITION_RANGE)
+                logger.info("Spectral placement took %d eigensolver iterations and %.3f s.", iterations,
+                            time.perf_counter() - started)
+            else:
+                place_at_barycentres(adjacency, self.store.positions, missing, self.rng, self.placement_spread())
+            missing = np.isnan(self.store.positions).any(axis=1)
+        self.store.positions[missing] = self.rng.uniform(-INITIAL_POSITION_RANGE, INITIAL_POSITION_RANGE,
+                                                         size=(int(missing.sum()), self.dim))
+        logger.info("Initialized positions of %d of %d vertices.", count, self.store.num_vertices)
+        return count
+
+    def save_initial_state(self):
+        """Save the initial state of the graph for resetting."""
+        if self.keep_history:
+            self.initial_graph_state = self.store.snapshot()
+            logger.debug("Initial graph state saved.")
+
+    def reset_graph(self):
+        """Reset the graph to its initial state; returns False if there is none."""
+        if self.initial_graph_state is None:
+            logger.warning("Graph has no initial state to reset to.")
+            return False
+        previous = self.store
+        self.store = self.initial_graph_state.snapshot()
+        self.store.remap = None
+        self.positions_changed()
+        self.topology_changed()
+        self.save_state(ReplaceGraph(previous, self.store))
+        logger.info("Graph reset to initial state.")
+        return True
+
+    def add_vertex(self, position=None):
+        """Add a new vertex and return its id.
+
+        A vertex given a position stays there; otherwise it is placed at random and, with
+        `incremental_layout`, its neighbourhood is relaxed.
+        """
+        new_id = self.store.next_id()
+        relax = position is None and self.incremental_layout
+        if position is None:
+            position = self.rng.uniform(-NEW_VERTEX_RANGE[self.dim], NEW_VERTEX_RANGE[self.dim], size=self.dim)
+        else:
+            position = np.array(position, dtype=float)
+        new_row = self.store.add_vertex(new_id, position)
+        moved = self.relayout_around([new_id]) if relax else None
+        self.positions_changed([new_row])
+        self.save_state(CompoundCommand([AddVertex(new_id, position), moved]))
+        logger.info("Added vertex: %s at %s", new_id, position)
+        return new_id
+
+    def add_edge(self, start_id, end_id):
+        """Add a new edge between two existing vertices; returns False if either does not exist."""
+        if not self.store.has_vertex(start_id) or not self.store.has_vertex(end_id):
+            logger.warning("Cannot add edge: Vertex %s or %s does not exist.", start_id, end_id)
+            return False
+        placed = self.place_new_endpoint(start_id, end_id) if self.initial_placement == "spectral" else None
+        edge_index = self.store.add_edge(start_id, end_id)
+        moved = self.relayout_around([start_id, end_id]) if self.incremental_layout else None
+        self.topology_changed([edge_index])
+        self.save_state(CompoundCommand([AddEdge(start_id, end_id), placed, moved]))
+        logger.info("Added edge: %s -> %s", start_id, end_id)
+        return True
+
+    # Moves an endpoint that has no edges yet next to the other one, the barycentre of its only
+    # neighbour; when both have none, the end vertex moves
+    def place_new_endpoint(self, start_id, end_id):
+        """Place a vertex getting its first edge beside its neighbour and return the MovePositions, or None."""
+        if start_id == end_id:
+            return None
+        if self.store.degree(end_id) == 0:
+            vertex_id, neighbour_id = end_id, start_id
+        elif self.store.degree(start_id) == 0:
+            vertex_id, neighbour_id = start_id, end_id
+        else:
+            return None
+        row = self.store.row_of[vertex_id]
+        before = self.store.positions[[row]].copy()
+        self.store.positions[row] = self.store.position(neighbour_id) + self.rng.normal(scale=self.placement_spread(),
+                                                                                      size=self.dim)
+        self.positions_changed([row])
+        return MovePositions.between(before, self.store.positions[[row]], rows=[row])
+
+    # Relaxes the neighbourhood of edited vertices while the rest of the layout stays pinned
+    def relayout_around(self, vertex_ids):
+        """Run a local force layout around the given vertices and return the resulting MovePositions."""
+        seeds = [self.store.row_of[vertex_id] for vertex_id in vertex_ids]
+        adjacency = self.store.adjacency()
+        active = adjacency.k_hop(seeds, self.incremental_hops)
+        layout = self.make_force_layout(self.store.positions, self.store.edges, active=active, adjacency=adjacency)
+        stats = layout.run(self.incremental_iterations)
+        moved = MovePositions.between(self.store.positions[active], layout.positions[active], rows=active)
+        self.store.positions[active] = layout.positions[active]
+        self.positions_changed(active)
+        logger.debug("Relaxed %d vertices around %s: %s", len(active), vertex_ids, stats)
+        return moved
+
+    def ideal_edge_length(self):
+        """Return the edge length the force model settles towards, k_scale * sqrt(1 / N)."""
+        return np.sqrt(1 / max(self.store.num_vertices, 1)) * FORCE_CONSTANTS[self.dim]["k_scale"]
+
+    # Per-axis jitter of vertices placed at a barycentre, so one placed beside a single neighbour
+    # lands about one ideal edge length from it
+    def placement_spread(self):
+        return self.ideal_edge_length() / np.sqrt(self.dim)
+
+    # Builds a layout engine configured with this model's force constants and settings
+    def make_force_layout(self, positions, edge_index, active=None, adjacency=None):
+        """Return a ForceLayout (optionally moving only `active` rows) using the force constants for `dim`."""
+        constants = FORCE_CONSTANTS[self.dim]
+        return ForceLayout(
+            positions, edge_index,
+            c_attract=constants["c_attract"],
+            c_repulse=constants["c_repulse"],
+            c_center=constants["c_center"],
+            k=np.sqrt(1 / len(positions)) * constants["k_scale"],  # Ideal distance between vertices
+            repulsion=self.repulsion_mode,
+            theta=self.barnes_hut_theta,
+            cooling=self.layout_cooling,
+            tolerance=self.layout_tolerance,
+            active=active,
+            adjacency=adjacency,
+            profiler=self.profiler if active is None else None,  # Local relayouts around edits are not profiled
+            kernels=self.force_kernels,
+            local_field=self.local_field if active is not None else None,
+        )
+
+    # Wraps the configured layout mode, run on the given arrays, in run(callback, callback_every);
+    # `seed` seeds the coarsening of a multilevel layout and the first pivot of a stress layout
+    def make_layout_run(self, positions, edge_index, seed=None):
+        profiler = self.profiler
+
+        if self.layout_mode == "multilevel":
+            multilevel = MultilevelLayout(
+                self.make_force_layout,
+                coarsest_iterations=self.force_iterations,
+                refine_iterations=self.multilevel_refine_iterations,
+                seed=seed,
+                profiler=profiler,
+            )
+
+            def run(callback, callback_every):
+                result = multilevel.run(positions, edge_index, callback, callback_every)
+                self.last_layout_stats = multilevel.stats
+                logger.info("Multilevel layout finished: %s", multilevel.stats)
+                return result
+        elif self.layout_mode == "stress":
+            stress = PivotStressLayout(
+                num_pivots=self.stress_pivots,
+                iterations=self.stress_iterations,
+                edge_length=np.sqrt(1 / len(positions)) * FORCE_CONSTANTS[self.dim]["k_scale"],  # As in the force model
+                seed=seed,
+                profiler=profiler,
+            )
+
+            def run(callback, callback_every):
+                result = stress.run(positions, self.store.adjacency(), callback, callback_every)
+                self.last_layout_stats = stress.stats
+                logger.info("Pivot stress layout finished: %s", stress.stats)
+                return result
+        else:
+            layout = self.make_force_layout(positions, edge_index, adjacency=self.store.adjacency())
+
+            def run(callback, callback_every):
+                self.last_layout_stats = layout.run(self.force_iterations, callback, callback_every)
+                logger.info("Layout finished: %s", self.last_layout_stats)
+                if self.repulsion_mode == "barnes_hut" and logger.isEnabledFor(logging.DEBUG):
+                    # Measuring the error takes an exact O(N^2) force pass, so only when it is logged
+                    logger.debug("Barnes-Hut repulsion error against exact forces: %s", layout.repulsion_error())
+                return layout.positions
+        return run
+
+    # Runs a single layout in a worker process that writes its snapshots straight into `shared`; the
+    # calling thread watches the generation counter and hands the callback a view of each new snapshot.
+    # While the callback blocks (a paused layout) the worker waits at its next snapshot
+    def make_process_layout_run(self, shared, seed):
+        settings = {name: getattr(self, name) for name in LAYOUT_SETTINGS}
+        arguments = (self.dim, self.store.edges.copy(), settings, seed, shared)
+
+        def run(callback, callback_every):
+            context = multiprocessing.get_context("spawn")  # A fork could inherit locks held by other threads
+            resume, cancel = context.Event(), context.Event()
+            resume.set()
+            with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_set_layout_controls,
+                                     initargs=(resume, cancel)) as pool:
+                future = pool.submit(_layout_into_shared, *arguments, callback_every)
+                seen = shared.generation
+                while True:
+                    finished = future.done()  # Checked first, so the final snapshot is never missed
+                    if callback is not None and shared.generation != seen:
+                        positions, seen = shared.latest()
+                        resume.clear()
+                        if callback(shared.iteration, positions) is False:
+                            cancel.set()
+                        resume.set()
+                    if finished:
+                        break
+                    wait([future], timeout=PROCESS_POLL_SECONDS)
+                self.last_layout_stats = future.result()
+            logger.info("Layout finished in a worker process: %s", self.last_layout_stats)
+            return shared.latest()[0]
+        return run
+
+    # Converts the graph to layout arrays and wraps the configured layout mode in a job
+    def prepare_layout_job(self, shared=None):
+        """Return job(callback, callback_every), which runs the layout and returns the positions.
+
+        Given a SharedPositions holding the current positions, the job publishes every snapshot
+        and the result into it and passes the callback views of it instead of its own arrays.
+        With layout_process set, a single-start layout then runs in a worker process writing
+        there directly (unprofiled), so the calling thread only watches it.
+        """
+        profiler = self.profiler
+        if self.multi_start > 1:
+            run = self.make_multi_start_run()
+        elif shared is not None and self.layout_process:
+            run = self.make_process_layout_run(shared, seed=int(self.rng.integers(2 ** 63)))
+            shared = None  # The worker process publishes by itself
+        else:
+            positions, edge_index = self.store.positions.copy(), self.store.edges.copy()
+            run = self.make_layout_run(positions, edge_index, seed=int(self.rng.integers(2 ** 63)))
+        if shared is not None:
+            run = _publishing(run, shared)
+
+        def job(callback=None, callback_every=1):
+            if profiler is None:
+                return run(callback, callback_every)
+            profiler.start_run()
+            try:
+                return run(callback, callback_every)
+            finally:
+                profiler.finish_run()
+                logger.info("Layout profile: %s", profiler.snapshot())
+        return job
+
+    def score_layout(self, positions, stats):
+        """Return the multi_start_score of a layout of this graph, given its run statistics; lower is better."""
+        if self.multi_start_score == "energy":
+            return float(stats["energy"])
+        return sampled_stress(positions, self.store.adjacency())
+
+    # Everything random about a layout comes from `seed`, so the same seed, graph and settings
+    # always give the same result; this is how a multi-start layout's winner can be reproduced
+    def layout_from_seed(self, seed):
+        """Lay out the graph from uniformly random positions drawn with `seed`; returns (positions, stats).
+
+        The store is left unchanged. The stats include the seed and the layout's score.
+        """
+        rng = np.random.default_rng(seed)
+        start = rng.uniform(-INITIAL_POSITION_RANGE, INITIAL_POSITION_RANGE, size=(self.store.num_vertices, self.dim))
+        positions = self.make_layout_run(start, self.store.edges.copy(), seed=int(rng.integers(2 ** 63)))(None, 1)
+        stats = dict(self.last_layout_stats, seed=seed)
+        stats["score"] = self.score_layout(positions, stats)
+        return positions, stats
+
+    # Lays out from `multi_start` seeded random starts in a process pool and keeps the lowest score.
+    # The callback sees the best layout so far after every finished start; returning False stops
+    # the starts that have not begun (those already running finish in the background).
+    def make_multi_start_run(self):
+        seeds = [int(seed) for seed in self.rng.integers(2 ** 32, size=self.multi_start)]
+        workers = min(self.multi_start_workers or os.cpu_count() or 1, len(seeds))
+        settings = {name: getattr(self, name) for name in LAYOUT_SETTINGS}
+        arguments = (self.dim, self.store.num_vertices, self.store.edges.copy(), settings)
+
+        def run(callback, callback_every):
+            started = time.perf_counter()
+            scores = {}
+            best = None
+            cancelled = False
+
+            def finished(seed, positions, stats):
+                nonlocal best, cancelled
+                scores[seed] = stats["score"]
+                logger.debug("Start with seed %d scored %.6g", seed, stats["score"])
+                if best is None or stats["score"] < best[1]["score"]:
+                    best = (positions, stats)
+                if callback is not None and callback(len(scores), best[0]) is False:
+                    cancelled = True
+
+            if workers <= 1:
+                for seed in seeds:
+                    finished(*_layout_from_seed(*arguments, seed))
+                    if cancelled:
+                        break
+            else:
+                # Numba's worker threads do not survive a fork, so pools running its kernels spawn fresh processes
+                spawn = get_kernels(self.force_kernels).name != "numpy"
+                pool = ProcessPoolExecutor(max_workers=workers,
+                                           mp_context=multiprocessing.get_context("spawn") if spawn else None)
+                try:
+                    futures = [pool.submit(_layout_from_seed, *arguments, seed) for seed in seeds]
+                    for future in as_completed(futures):
+                        finished(*future.result())
+                        if cancelled:
+                            break
+                finally:
+                    pool.shutdown(wait=not cancelled, cancel_futures=True)
+
+            self.last_layout_stats = {
+                "starts": len(scores),
+                "seeds": seeds,
+                "scores": [scores.get(seed) for seed in seeds],  # None for starts that were cancelled
+                "score": self.multi_start_score,
+                "best_seed": best[1]["seed"],
+                "best_score": best[1]["score"],
+                "best": best[1],
+                "workers": workers,
+                "wall_time": time.perf_counter() - started,
+            }
+            logger.info("Multi-start layout finished: seed %d scored best (%s %.6g) of %d starts in %.2f s",
+                        best[1]["seed"], self.multi_start_score, best[1]["score"], len(scores),
+                        self.last_layout_stats["wall_time"])
+            return best[0]
+        return run
+
+    def run_layout(self):
+        """Run the configured layout to completion as one undoable step; returns False if there was nothing to lay out."""
+        if not self.store.num_vertices or not self.store.num_edges:
+            logger.warning("Graph is empty or has no edges. Layout algorithm skipped.")
+            return False
+        logger.info("Running force-directed algorithm...")
+        before = self.store.positions.copy() if self.keep_history else None
+        self.store.positions[:] = self.prepare_layout_job()()
+        self.positions_changed()
+        self.save_moves(before)
+        logger.debug("Final vertex positions: %s", self.store.positions)
+        return True
+
+    def save_graph(self):
+        """Return the graph data including positions for saving."""
+        return self.store.to_dict()
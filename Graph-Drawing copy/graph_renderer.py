@@ -1,24 +1,73 @@
 from PyQt5.QtOpenGL import QGLWidget
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSlot
 from OpenGL.GL import *
 from OpenGL.GLU import *
 import numpy as np
-import random
-import copy
+import logging
+import time
+from graph_model import GraphModel
+from graph_io import save_binary_graph
+from layout_worker import LayoutWorker
+from shared_positions import SharedPositions
+from gl_buffers import GraphBuffers, DetailBuffers
+from level_of_detail import build_detail_level
+from spatial_index import ScreenIndex
+from gl_picking import ColourPicker
+
+logger = logging.getLogger(__name__)
+
+
+# The graph and its layout settings live on the GraphModel; the renderer exposes them under their old names
+def _model_attribute(name):
+    return property(lambda self: getattr(self.model, name), lambda self, value: setattr(self.model, name, value))
 
 
 class GraphRenderer(QGLWidget):
+    store = _model_attribute("store")
+    history = _model_attribute("history")
+    initial_graph_state = _model_attribute("initial_graph_state")
+    force_iterations = _model_attribute("force_iterations")
+    layout_tolerance = _model_attribute("layout_tolerance")
+    layout_cooling = _model_attribute("layout_cooling")
+    last_layout_stats = _model_attribute("last_layout_stats")
+    incremental_layout = _model_attribute("incremental_layout")
+    incremental_hops = _model_attribute("incremental_hops")
+    incremental_iterations = _model_attribute("incremental_iterations")
+    repulsion_mode = _model_attribute("repulsion_mode")
+    barnes_hut_theta = _model_attribute("barnes_hut_theta")
+    layout_mode = _model_attribute("layout_mode")
+    multilevel_refine_iterations = _model_attribute("multilevel_refine_iterations")
+    stress_pivots = _model_attribute("stress_pivots")
+    stress_iterations = _model_attribute("stress_iterations")
+    force_kernels = _model_attribute("force_kernels")
+    multi_start = _model_attribute("multi_start")
+    multi_start_workers = _model_attribute("multi_start_workers")
+    multi_start_score = _model_attribute("multi_start_score")
+    layout_process = _model_attribute("layout_process")
+    initial_placement = _model_attribute("initial_placement")
+    profiler = _model_attribute("profiler")  # LayoutProfiler also timing paintGL, if profiling
+
     def __init__(self, parent=None):
         super(GraphRenderer, self).__init__(parent)
-        self.graph = {"vertices": [], "edges": []}  # Store graph data
-        self.vertex_positions = {}  
-        self.history = []  
-        self.redo_stack = []  
-        self.save_state()  # Save the initial state
-        self.initial_graph_state = None 
+        self.model = GraphModel(dim=3, listener=self)  # Graph, layout settings and undo history, free of Qt
         self.selected_vertices = [] 
-        self.force_iterations = 50  # Number of iterations for force-directed layout
+        self.layout_worker = None  # LayoutWorker running in the background, if any
+        self.layout_store = None  # Store whose rows match the worker's snapshots
+        self.layout_start_positions = None  # Positions when the background layout started, for undo
+        self.layout_shared = None  # SharedPositions the background layout publishes into, drawn from while it runs
+        self.layout_snapshot_every = 5  # Iterations between redraws during a background layout
+        self.buffers = GraphBuffers()  # GPU copies of positions, colours and edges; only changed rows are re-sent
         self.vertex_radius = 0.15 
+        self.pick_radius_pixels = 10  # Screen-space selection radius
+        self.vertex_index = ScreenIndex(self.pick_radius_pixels)  # Projected vertices bucketed for click picking
+        self.picking_mode = "grid"  # "grid" (projected on the CPU) or "colour" (ids drawn offscreen, respects occlusion)
+        self.colour_picker = ColourPicker()  # Offscreen id framebuffer for the "colour" picking mode
+        self.point_size = 8  # Vertex size in pixels
+        self.edge_width = 2  # Edge width in pixels
+        self.level_of_detail = "auto"  # "on", "off" or "auto" (on above lod_min_elements): cull and aggregate when drawing
+        self.lod_min_elements = 100000  # Vertices plus edges above which "auto" draws a level of detail
+        self.detail_buffers = DetailBuffers()  # GPU copy of detail_level
+        self.detail_level = None  # Culled and aggregated geometry for the current view; None once out of date
         self.viewport_size = 20  # OpenGL viewport dimension (-10 to 10)
 
         # Camera attributes
@@ -26,205 +75,220 @@ class GraphRenderer(QGLWidget):
         self.camera_rot_y = 0.0
         self.camera_distance = 20.0
         self.last_mouse_pos = None
+        self.camera_dirty = True  # Camera moved since the last frame; refreshes view_matrices
+        self.view_matrices = None  # (modelview, projection, viewport) of the last frame, used for picking
 
      # Sets the graph data to be rendered
     def set_graph(self, graph):
         """Set the graph data to be rendered."""
-        self.graph = graph
-        self.vertex_positions = graph.get("positions", {})  # Load positions
-        self.initialize_vertex_positions()
-        self.save_initial_state()  
+        self.stop_background_layout()
+        self.model.set_graph(graph)  # Vertices without positions are placed randomly
         self.update()
 
-    # Saves the current state of the graph
-    def save_state(self):
-        """Save the current state of the graph for undo/redo."""
-        self.history.append(copy.deepcopy((self.graph, self.vertex_positions)))
-        self.redo_stack.clear()  # Clear redo stack on new action
-    
     def undo(self):
         """Undo the last action."""
-        if len(self.history) > 1:
-            self.redo_stack.append(self.history.pop())
-            self.graph, self.vertex_positions = copy.deepcopy(self.history[-1])
-            print("Undo performed.")
+        self.stop_background_layout()
+        if self.model.undo() is not None:
+            self.selection_changed()  # Selected ids may have gained or lost their rows
             self.update()
-        else:
-            print("No more actions to undo.")
-    
+
     def redo(self):
         """Redo the last undone action."""
-        if self.redo_stack:
-            self.history.append(self.redo_stack.pop())
-            self.graph, self.vertex_positions = copy.deepcopy(self.history[-1])
-            print("Redo performed.")
+        self.stop_background_layout()
+        if self.model.redo() is not None:
+            self.selection_changed()
             self.update()
-        else:
-            print("No more actions to redo.")            
-    
-     # Assigns random positions to any vertices that don't have them
-    def initialize_vertex_positions(self):
-        """Randomly initialize vertex positions if not already set."""
-        for vertex in self.graph["vertices"]:
-            vertex_id = vertex["id"]
-            if vertex_id not in self.vertex_positions:
-                self.vertex_positions[vertex_id] = np.array([random.uniform(-5, 5), random.uniform(-5, 5), random.uniform(-5, 5)], dtype=float)
-        print(f"Initialized vertex positions: {self.vertex_positions}")
-
-    # Saves the current graph state
-    def save_initial_state(self):
-        """Save the initial state of the graph for resetting."""
-        self.initial_graph_state = {
-            "vertices": copy.deepcopy(self.graph["vertices"]),
-            "edges": copy.deepcopy(self.graph["edges"]),
-            "positions": copy.deepcopy(self.vertex_positions),
-        }
-        print("Initial graph state saved.")
-
-    # Resets the graph to the state saved by save_initial_state
+
+    # Records moved vertices in everything that caches positions: the GPU buffers, the picking index
+    # and the level of detail; called by the model as its listener
+    def positions_changed(self, rows=None):
+        """Mark the positions of the given rows (default: all rows) as changed."""
+        self.buffers.positions_changed(rows)
+        self.vertex_index.moved(rows)
+        self.detail_level = None
+
+    def topology_changed(self, edges=None):
+        """Mark the given edges (indices into store.edges; default: all edges) as changed."""
+        self.buffers.topology_changed(edges)
+        self.detail_level = None
+
+    def selection_changed(self):
+        """Mark the set of selected vertices as changed."""
+        self.buffers.selection_changed()
+        self.detail_level = None
+
+    # Resets the graph to the state saved when it was loaded
     def reset_graph(self):
         """Reset the graph to its initial state."""
-        if not self.initial_graph_state:
-            print("Graph has no initial state to reset to.")
-            return
-        self.graph = {
-            "vertices": copy.deepcopy(self.initial_graph_state["vertices"]),
-            "edges": copy.deepcopy(self.initial_graph_state["edges"]),
-        }
-        self.vertex_positions = copy.deepcopy(self.initial_graph_state["positions"])
-        print("Graph reset to initial state.")
-        self.update()
-        
+        self.stop_background_layout()
+        if self.model.reset_graph():
+            self.update()
 
     def add_vertex(self, position=None):
         """Add a new vertex at the given position or a random position."""
-        new_id = len(self.graph["vertices"])
-        self.graph["vertices"].append({"id": new_id})
-        if position is None:
-            pos_array = np.array([random.uniform(-7, 7), random.uniform(-7, 7), random.uniform(-7, 7)], dtype=float)
-        else:
-            # Ensure position is a numpy array with float dtype
-            pos_array = np.array(position, dtype=float)  
-        self.vertex_positions[new_id] = pos_array
-        self.save_state()  # Save the updated state
-        print(f"Added vertex: {new_id} at {position}")
+        self.stop_background_layout()
+        self.model.add_vertex(position)
         self.update()
-       
 
     def add_edge(self, start_id, end_id):
         """Add a new edge between two vertices."""
-        if start_id not in self.vertex_positions or end_id not in self.vertex_positions:
-            print(f"Cannot add edge: Vertex {start_id} or {end_id} does not exist.")
-            return
-        self.graph["edges"].append([start_id, end_id])
-        self.save_state()  # Save the updated state
-        print(f"Added edge: {start_id} -> {end_id}")
-        self.update()
-        
+        self.stop_background_layout()
+        if self.model.add_edge(start_id, end_id):
+            self.update()
 
      # Applies a force-directed layout algorithm
     def run_force_directed_algorithm(self):
         """Run a 3D force-directed layout algorithm."""
-        if not self.graph["vertices"] or not self.graph["edges"]:
-            print("Graph is empty or has no edges. Layout algorithm skipped.")
+        self.stop_background_layout()
+        if self.model.run_layout():
+            self.update()
+
+    # Runs the layout in a worker thread, redrawing from snapshots as it converges
+    def start_background_layout(self):
+        """Start the layout in a LayoutWorker so the GUI stays responsive."""
+        if self.layout_worker is not None and self.layout_worker.isRunning():
+            logger.warning("A layout is already running.")
+            return
+        if not self.store.num_vertices or not self.store.num_edges:
+            logger.warning("Graph is empty or has no edges. Layout algorithm skipped.")
             return
 
-        print("Running force-directed algorithm...")
-        vertices = self.graph["vertices"]
-        edges = self.graph["edges"]
-
-        # Constants for forces
-        k = np.sqrt(1 / len(vertices)) * 2.5  # Ideal distance between vertices (further reduced)
-        c_attract = 0.1  
-        c_repulse = 0.15  # Further reduced for 3D
-        c_center = 0.01 # Centering force constant
-
-        for iteration in range(self.force_iterations):
-            forces = {v["id"]: np.array([0.0, 0.0, 0.0]) for v in vertices}
-
-            # Calculate repulsive forces
-            for v1 in vertices:
-                for v2 in vertices:
-                    if v1["id"] != v2["id"]:
-                        pos1 = self.vertex_positions[v1["id"]]
-                        pos2 = self.vertex_positions[v2["id"]]
-                        delta = pos1 - pos2
-                        distance = np.linalg.norm(delta) + 0.01  # Avoid division by zero
-                        repulsive_force = c_repulse * (delta / distance**2)
-                        forces[v1["id"]] += repulsive_force
-
-            # Calculate attractive forces
-            for edge in edges:
-                v1_id, v2_id = edge
-                pos1 = self.vertex_positions[v1_id]
-                pos2 = self.vertex_positions[v2_id]
-                delta = pos2 - pos1
-                distance = np.linalg.norm(delta) + 0.01  
-                attractive_force = c_attract * (delta * (distance - k))
-                forces[v1_id] += attractive_force
-                forces[v2_id] -= attractive_force
-            
-            # Apply centering force
-            for v_id in forces.keys():
-                pos = self.vertex_positions[v_id]
-                forces[v_id] -= pos * c_center
+        logger.info("Running force-directed algorithm in the background...")
+        self.layout_store = self.store
+        self.layout_start_positions = self.store.positions.copy()
+        self.layout_shared = SharedPositions(self.store.num_vertices, self.store.dim)
+        self.layout_shared.publish(self.store.positions)
+        job = self.model.prepare_layout_job(self.layout_shared)
+        self.layout_worker = LayoutWorker(job, snapshot_every=self.layout_snapshot_every, parent=self,
+                                          shared=self.layout_shared)
+        self.layout_worker.snapshot.connect(self.apply_layout_snapshot)
+        self.layout_worker.layout_finished.connect(self.finish_background_layout)
+        self.layout_worker.finished.connect(self.layout_worker.deleteLater)  # Parented to the widget; free it once it stops
+        self.layout_worker.start()
+
+    def pause_background_layout(self):
+        """Pause or resume the running background layout."""
+        if self.layout_worker is None or not self.layout_worker.isRunning():
+            logger.warning("No layout is running.")
+            return
+        if self.layout_worker.is_paused():
+            self.layout_worker.resume()
+            logger.info("Layout resumed.")
+        else:
+            self.layout_worker.pause()
+            logger.info("Layout paused.")
 
-            # Update positions based on forces
-            for vertex in vertices:
-                self.vertex_positions[vertex["id"]] += forces[vertex["id"]] * 0.1  # Damping factor
+    def cancel_background_layout(self):
+        """Cancel the running background layout, keeping its current positions."""
+        if self.layout_worker is None or not self.layout_worker.isRunning():
+            logger.warning("No layout is running.")
+            return
+        self.layout_worker.cancel()
+
+    # Receives worker snapshots on the GUI thread; the snapshot itself is read from layout_shared
+    # by paintGL, without copying, so paintGL only ever sees whole snapshots
+    @pyqtSlot(object, int)
+    def apply_layout_snapshot(self, positions, iteration):
+        """Show an intermediate layout published by the worker."""
+        if self.sender() is self.layout_worker and self.store is self.layout_store:
+            self.positions_changed()
+            self.update()
 
-        print(f"Final vertex positions: {self.vertex_positions}")
+    @pyqtSlot(object, bool)
+    def finish_background_layout(self, positions, cancelled):
+        """Apply the final positions of a background layout."""
+        self.sender().shared.close()  # The worker has stopped writing and `positions` is a copy
+        if self.sender() is not self.layout_worker:
+            return  # A layout that was stopped by an edit; its result has been discarded
+        if self.store is self.layout_store:
+            self.store.positions[:] = positions
+            self.positions_changed()
+        self.record_background_layout()
+        logger.info("Layout cancelled." if cancelled else "Layout finished.")
+        logger.debug("Final vertex positions: %s", self.store.positions)
         self.update()
 
+    # Stops a running background layout before the graph is edited, keeping its progress so far
+    def stop_background_layout(self):
+        """Cancel the background layout, if any, and record the moves it has made as one undoable step."""
+        if self.layout_worker is None:
+            return
+        self.layout_worker.cancel()
+        self.pull_layout_positions()
+        self.record_background_layout()
+        logger.info("Background layout stopped.")
+
+    # Turns the positions reached by the background layout into a single history entry
+    def record_background_layout(self):
+        if self.store is self.layout_store:
+            self.model.save_moves(self.layout_start_positions)
+        self.layout_worker = None
+        self.layout_store = None
+        self.layout_start_positions = None
+        self.layout_shared = None  # Closed by finish_background_layout once the worker stops writing
+
+    # While a background layout runs, its newest snapshot lives in layout_shared and the store's
+    # positions are only brought up to date when it stops or the graph is saved
+    def drawn_positions(self):
+        """Return the positions on screen: the running layout's newest snapshot, else the store's."""
+        if self.layout_shared is not None and self.store is self.layout_store:
+            return self.layout_shared.latest()[0]
+        return self.store.positions
+
+    def pull_layout_positions(self):
+        """Copy the running layout's newest snapshot into the store."""
+        if self.layout_shared is not None and self.store is self.layout_store:
+            self.store.positions[:] = self.layout_shared.latest()[0]
+            self.positions_changed()
+
     # Prepares and returns the current graph data (vertices, edges, positions) for saving to a file
     def save_graph(self):
         """Return the graph data including positions for saving."""
-        return {
-            "vertices": self.graph["vertices"],
-            "edges": self.graph["edges"],
-            "positions": {str(k): v.tolist() for k, v in self.vertex_positions.items()},
-        }
+        self.pull_layout_positions()
+        return self.model.save_graph()
+
+    def save_binary_graph(self, file_path):
+        """Write the graph, including the running layout's newest positions, to a binary graph file."""
+        self.pull_layout_positions()
+        save_binary_graph(file_path, self.store)
 
      # Loads graph data from a dictionary 
     def load_graph(self, graph_data):
         """Load the graph data, including positions."""
+        self.stop_background_layout()
         try:
-            # Validate JSON structure
-            if "vertices" not in graph_data or "edges" not in graph_data or "positions" not in graph_data:
-                raise KeyError("The JSON file must contain 'vertices', 'edges', and 'positions' keys.")
-
-            # Load vertices, edges, and positions
-            self.graph = {
-                "vertices": graph_data["vertices"],
-                "edges": graph_data["edges"],
-            }
-            self.vertex_positions = {int(k): np.array(v, dtype=float) for k, v in graph_data["positions"].items()}
-
-            # Save initial state for reset
-            self.save_initial_state()
+            # Validates the JSON structure and loads vertices, edges, and positions
+            self.model.load_graph(graph_data)
             self.update()
-            print(f"Graph loaded successfully: {self.graph}")
 
         except KeyError as e:
-            print(f"Error loading graph: Missing key {e}")
+            logger.error("Error loading graph: Missing key %s", e)
         except ValueError as e:
-            print(f"Error loading graph: Invalid data format for positions. {e}")
+            logger.error("Error loading graph: Invalid data format for positions. %s", e)
         except Exception as e:
-            print(f"Unexpected error: {e}")
+            logger.exception("Unexpected error: %s", e)
+
+    # Shows a store that was built elsewhere, such as by the streaming loader in graph_io
+    def load_store(self, store):
+        """Replace the graph with the given GraphStore."""
+        self.stop_background_layout()
+        self.model.load_store(store)
+        self.update()
 
      # Handles the logic for selecting a vertex by its ID for edge creation
     def select_vertex_by_id(self, vertex_id):
         """Select a vertex by its ID."""
-        if vertex_id in self.vertex_positions:
-            print(f"Vertex {vertex_id} selected.")
+        if self.store.has_vertex(vertex_id):
+            logger.info("Vertex %s selected.", vertex_id)
             self.selected_vertices.append(vertex_id)
             if len(self.selected_vertices) == 2:
                 # If two vertices are selected, create an edge
                 self.add_edge(self.selected_vertices[0], self.selected_vertices[1])
                 self.selected_vertices = []  
+            self.selection_changed()
             self.update()  
         else:
-            print(f"Vertex ID {vertex_id} does not exist.")
+            logger.warning("Vertex ID %s does not exist.", vertex_id)
 
      # Processes mouse press events
     def mousePressEvent(self, event):
@@ -235,7 +299,7 @@ class GraphRenderer(QGLWidget):
             self.select_vertex_at_screen_pos(mouse_x, mouse_y)
         elif event.button() == Qt.RightButton:
             self.last_mouse_pos = event.pos()
-            print(f"Right Mouse pressed at: {event.pos()}")
+            logger.debug("Right Mouse pressed at: %s", event.pos())
         # super().mousePressEvent(event) # Avoid calling super if we handle all relevant buttons
 
     def mouseMoveEvent(self, event):
@@ -251,15 +315,16 @@ class GraphRenderer(QGLWidget):
             self.camera_rot_x = max(-90.0, min(90.0, self.camera_rot_x))
 
             self.last_mouse_pos = event.pos()
+            self.camera_dirty = True
             self.update()
-            print(f"Camera rotated to: rot_x={self.camera_rot_x}, rot_y={self.camera_rot_y}")
+            logger.debug("Camera rotated to: rot_x=%s, rot_y=%s", self.camera_rot_x, self.camera_rot_y)
         # super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
         """Handle mouse release events."""
         if event.button() == Qt.RightButton:
             self.last_mouse_pos = None
-            print("Right Mouse released.")
+            logger.debug("Right Mouse released.")
         # super().mouseReleaseEvent(event)
         
     def wheelEvent(self, event):
@@ -271,72 +336,48 @@ class GraphRenderer(QGLWidget):
             self.camera_distance += 1.0
         
         self.camera_distance = max(1.0, min(self.camera_distance, 100.0)) # Clamp zoom
+        self.camera_dirty = True
         self.update()
-        print(f"Camera distance: {self.camera_distance}")
+        logger.debug("Camera distance: %s", self.camera_distance)
 
     def select_vertex_at_screen_pos(self, mouse_x, mouse_y):
-        # Get current OpenGL matrices and viewport
-        # These calls need to be done when the context is current and matrices are set,
-        # typically within a drawing or event handling scope where paintGL has recently run
-        # or the GL context is otherwise assured.
-        modelview = glGetDoublev(GL_MODELVIEW_MATRIX)
-        projection = glGetDoublev(GL_PROJECTION_MATRIX)
-        viewport = glGetIntegerv(GL_VIEWPORT)
-
-        nearest_vertex_id = None
-        min_dist_sq = float('inf')
-        
-        # Define a screen-space selection radius (e.g., 10 pixels)
-        screen_select_radius_sq = 10**2 
-
-        for vertex_id, world_pos_np in self.vertex_positions.items():
-            if not isinstance(world_pos_np, np.ndarray) or world_pos_np.size != 3:
-                print(f"Skipping vertex {vertex_id} with invalid position: {world_pos_np}")
-                continue
-
-            world_pos = world_pos_np.tolist() # gluProject expects list or separate args
+        # Picking projects with the camera of the last frame drawn
+        if self.view_matrices is None:
+            logger.info("No vertex selected: the view has not been drawn yet.")
+            return
 
-            # Project world coordinates to screen coordinates
+        if self.picking_mode == "colour":
+            # Nearest visible vertex within the pick radius, read back from the offscreen id image
+            self.makeCurrent()
             try:
-                screen_x, screen_y, screen_z_depth = gluProject(
-                    world_pos[0], world_pos[1], world_pos[2],
-                    modelview, projection, viewport
-                )
-            except Exception as e:
-                # This can happen if matrices are singular, though unlikely in normal operation
-                print(f"Error projecting vertex {vertex_id}: {e}")
-                continue
-
-            # Check if the vertex is in front of the camera (screen_z_depth is between 0 and 1)
-            if not (0 <= screen_z_depth <= 1):
-                continue # Vertex is clipped (behind camera or too far)
-
-            # Calculate squared Euclidean distance in screen space
-            dx = screen_x - mouse_x
-            dy = screen_y - mouse_y
-            dist_sq = dx**2 + dy**2
-
-            if dist_sq < screen_select_radius_sq and dist_sq < min_dist_sq:
-                min_dist_sq = dist_sq
-                nearest_vertex_id = vertex_id
-        
+                self.sync_buffers()
+                row = self.colour_picker.pick(self.buffers, self.view_matrices, mouse_x, mouse_y,
+                                              self.pick_radius_pixels, self.point_size, self.edge_width)
+            finally:
+                self.doneCurrent()
+        else:
+            # Nearest projected vertex within the pick radius, from the screen-space grid
+            row = self.vertex_index.nearest(self.drawn_positions(), mouse_x, mouse_y, self.pick_radius_pixels)
+        nearest_vertex_id = None if row is None else int(self.store.ids[row])
+
         if nearest_vertex_id is not None:
-            print(f"Vertex {nearest_vertex_id} selected via screen projection.")
+            logger.info("Vertex %s selected via screen projection.", nearest_vertex_id)
             if nearest_vertex_id in self.selected_vertices: # Allow deselecting by clicking again
                  self.selected_vertices.remove(nearest_vertex_id)
-                 print(f"Vertex {nearest_vertex_id} deselected.")
+                 logger.info("Vertex %s deselected.", nearest_vertex_id)
             else:
                 self.selected_vertices.append(nearest_vertex_id)
             
             if len(self.selected_vertices) == 2:
                 self.add_edge(self.selected_vertices[0], self.selected_vertices[1])
                 self.selected_vertices = []  # Reset selection
+            self.selection_changed()
             self.update()
         else:
             # If no vertex was clicked, potentially clear selection
             # self.selected_vertices = [] 
             # self.update()
-            print("No vertex selected.")
+            logger.info("No vertex selected.")
 
     # Selects the vertex nearest to the given cooridnates if within radius(given)
     # def select_vertex(self, x, y):
@@ -382,6 +423,8 @@ class GraphRenderer(QGLWidget):
         """Initialize OpenGL settings."""
         glEnable(GL_DEPTH_TEST) 
         glClearColor(0.1, 0.1, 0.1, 1.0)  
+        self.buffers.create()
+        self.detail_buffers.create()
 
      # Called when the widget is resized, sets the OpenGL viewport and projection matrix
     def resizeGL(self, width, height):
@@ -391,10 +434,26 @@ class GraphRenderer(QGLWidget):
         glLoadIdentity()
         gluPerspective(55, (width / height) if height > 0 else 1, 0.1, 50.0)
         glMatrixMode(GL_MODELVIEW) # Standard practice to switch back to ModelView
+        self.camera_dirty = True
+
+    # Re-sends only the buffer ranges that changed since the last sync
+    def sync_buffers(self):
+        """Bring the GPU buffers up to date with the graph and the selection."""
+        selected_rows = [self.store.row_of[vertex_id] for vertex_id in self.selected_vertices
+                         if self.store.has_vertex(vertex_id)]
+        if self.layout_shared is None or self.store is not self.layout_store:
+            self.buffers.sync(self.store, selected_rows)
+            return
+        positions, generation = self.layout_shared.latest()
+        self.buffers.sync(self.store, selected_rows, positions)  # Straight from shared memory
+        if not self.layout_shared.intact(generation):
+            self.positions_changed()  # The layout reused the buffer during the upload; send the newest next frame
+            self.update()
 
     # Contains all OpenGL drawing calls
     def paintGL(self):
         """Render the OpenGL scene."""
+        started = time.perf_counter()
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glLoadIdentity()
 
@@ -402,26 +461,61 @@ class GraphRenderer(QGLWidget):
         glTranslatef(0.0, 0.0, -self.camera_distance)
         glRotatef(self.camera_rot_x, 1, 0, 0)
         glRotatef(self.camera_rot_y, 0, 1, 0)
+        if self.camera_dirty:
+            # Keep the matrices picking projects with; they only change with the camera
+            self.view_matrices = (glGetDoublev(GL_MODELVIEW_MATRIX), glGetDoublev(GL_PROJECTION_MATRIX),
+                                  glGetIntegerv(GL_VIEWPORT))
+            self.vertex_index.set_view(self.view_matrices)
+            self.detail_level = None
+            self.camera_dirty = False
+
+        self.colour_picker.invalidate()  # The id image is redrawn from this frame on the next colour pick
+        if self.use_level_of_detail():
+            self.draw_detail_level()
+        else:
+            self.draw_graph()
+        if self.profiler is not None:
+            glFinish()  # Wait for the GPU, so the frame time includes drawing and not just issuing calls
+            self.profiler.frame(time.perf_counter() - started)
 
-        # Draw vertices
-        glPointSize(8)
-        for vertex_id, position in self.vertex_positions.items():
-            if vertex_id in self.selected_vertices:
-                glColor3f(1.0, 0.0, 0.0)  # Red for selected vertices
-            else:
-                glColor3f(1.0, 1.0, 1.0)  # White for normal vertices
-            glBegin(GL_POINTS)
-            glVertex3f(*position)
-            glEnd()
+    # Draws every vertex and edge from the GPU buffers
+    def draw_graph(self):
+        """Draw the whole graph at full detail."""
+        self.sync_buffers()
+
+        # Draw vertices, red if selected and white otherwise
+        glPointSize(self.point_size)
+        self.buffers.draw_vertices()
 
         # Draw edges
-        glLineWidth(2)
+        glLineWidth(self.edge_width)
+        glColor3f(0.5, 0.5, 1.0)  # Blue color for edges
+        self.buffers.draw_edges()
+
+    def use_level_of_detail(self):
+        """Return whether frames draw a culled and aggregated level of detail instead of the whole graph."""
+        if self.level_of_detail == "auto":
+            return self.store.num_vertices + self.store.num_edges > self.lod_min_elements
+        return self.level_of_detail == "on"
+
+    # Draws only what the screen can resolve, rebuilding it after the graph, selection or view changed
+    def draw_detail_level(self):
+        """Draw the vertices and edges in view, with dense regions aggregated into density splats."""
+        if self.detail_level is None:
+            selected_rows = [self.store.row_of[vertex_id] for vertex_id in self.selected_vertices
+                             if self.store.has_vertex(vertex_id)]
+            positions = self.drawn_positions()
+            screen, visible_rows = self.vertex_index.rows_in_view(positions)
+            _, _, width, height = self.view_matrices[2]
+            self.detail_level = build_detail_level(positions, screen, visible_rows, self.store.edges,
+                                                   width, height, keep_rows=selected_rows)
+            self.detail_buffers.upload(self.detail_level, selected_rows)
+
+        # Full-detail vertices, red if selected, and splats shaded by how many vertices they stand for
+        glPointSize(self.point_size)
+        self.detail_buffers.draw_vertices()
+        self.detail_buffers.draw_splats()
+
+        glLineWidth(self.edge_width)
         glColor3f(0.5, 0.5, 1.0)  # Blue color for edges
-        glBegin(GL_LINES)
-        for edge in self.graph["edges"]:
-            start_id, end_id = edge
-            # Ensure positions are valid before drawing
-            if start_id in self.vertex_positions and end_id in self.vertex_positions:
-                glVertex3f(*self.vertex_positions[start_id])
-                glVertex3f(*self.vertex_positions[end_id])
-        glEnd()
\ No newline at end of file
+        self.detail_buffers.draw_edges()
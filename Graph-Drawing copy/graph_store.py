@@ -0,0 +1,203 @@
+import numpy as np
+from adjacency import CSRAdjacency
+
+# Rows allocated for an empty store before the first growth
+INITIAL_CAPACITY = 16
+
+
+# Returns a copy of `array` with room for at least `capacity` rows
+def _grow(array, capacity):
+    grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class GraphStore:
+    """Array-backed graph holding vertex ids, positions and edges in contiguous, growable arrays.
+
+    Vertices are addressed by row; `row_of` maps a vertex id to its row. Edges are stored
+    as pairs of rows in an int32 array. All arrays over-allocate and double when full, so
+    appending a vertex or an edge is amortized O(1).
+    """
+
+    def __init__(self, dim, capacity=INITIAL_CAPACITY, edge_capacity=INITIAL_CAPACITY, dtype=np.float64):
+        self.dim = dim
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._positions = np.empty((capacity, dim), dtype=dtype)
+        self._edges = np.empty((edge_capacity, 2), dtype=np.int32)
+        self.num_vertices = 0
+        self.num_edges = 0
+        self._row_of = {}  # Vertex id -> row, or None until first needed (see row_of)
+        self._adjacency = None  # Cached CSRAdjacency, built on first use and patched by appends and pops
+        self.remap = None  # For a store mapped from a file and never changed: maps the file again (see snapshot)
+
+    @property
+    def row_of(self):
+        """Dict mapping vertex id -> row; built on first use for stores adopted from arrays."""
+        if self._row_of is None:
+            self._row_of = dict(zip(self.ids.tolist(), range(self.num_vertices)))
+        return self._row_of
+
+    @property
+    def ids(self):
+        """Vertex ids, one per row."""
+        return self._ids[:self.num_vertices]
+
+    @property
+    def positions(self):
+        """(N, dim) view of the vertex positions; writes go straight into the store."""
+        return self._positions[:self.num_vertices]
+
+    @property
+    def edges(self):
+        """(E, 2) view of the edges as pairs of rows."""
+        return self._edges[:self.num_edges]
+
+    def __len__(self):
+        return self.num_vertices
+
+    def has_vertex(self, vertex_id):
+        return vertex_id in self.row_of
+
+    def position(self, vertex_id):
+        """Return the position of a vertex as a view into the store."""
+        return self._positions[self.row_of[vertex_id]]
+
+    # Id for a new vertex: the vertex count, as the renderer has always numbered vertices,
+    # or one past the largest id when loaded ids leave that number taken
+    def next_id(self):
+        if self.num_vertices not in self.row_of:
+            return self.num_vertices
+        return int(self.ids.max()) + 1
+
+    def add_vertex(self, vertex_id, position):
+        """Append a vertex and return its row."""
+        if vertex_id in self.row_of:
+            raise ValueError(f"Vertex {vertex_id} already exists.")
+        row = self.num_vertices
+        if row == len(self._ids):
+            capacity = max(INITIAL_CAPACITY, 2 * len(self._ids))
+            self._ids = _grow(self._ids, capacity)
+            self._positions = _grow(self._positions, capacity)
+        self._ids[row] = vertex_id
+        self._positions[row] = position
+        self.row_of[vertex_id] = row
+        self.num_vertices += 1
+        if self._adjacency is not None:
+            self._adjacency = self._adjacency.with_added_rows(1)
+        return row
+
+    def add_edge(self, start_id, end_id):
+        """Append an edge between two existing vertices and return its index."""
+        index = self.num_edges
+        if index == len(self._edges):
+            self._edges = _grow(self._edges, max(INITIAL_CAPACITY, 2 * len(self._edges)))
+        start, end = self.row_of[start_id], self.row_of[end_id]
+        if self._adjacency is not None:
+            start_rank = int(np.count_nonzero(self._edges[:index, 0] == start))
+            self._adjacency = self._adjacency.with_added_edge(start, end, start_rank)
+        self._edges[index] = (start, end)
+        self.num_edges += 1
+        return index
+
+    # Removal is only supported for the most recently added vertex or edge, which is all
+    # that undoing an append needs
+    def pop_vertex(self):
+        """Remove the last vertex, which must have no edges."""
+        row = self.num_vertices - 1
+        del self.row_of[int(self._ids[row])]
+        self.num_vertices -= 1
+        if self._adjacency is not None:
+            self._adjacency = self._adjacency.without_last_rows(1)
+
+    def pop_edge(self):
+        """Remove the last edge."""
+        self.num_edges -= 1
+        if self._adjacency is not None:
+            start, end = (int(row) for row in self._edges[self.num_edges])
+            start_rank = int(np.count_nonzero(self._edges[:self.num_edges, 0] == start))
+            self._adjacency = self._adjacency.without_last_edge(start, end, start_rank)
+
+    def replace_with(self, other):
+        """Make this store an independent copy of `other`, in place."""
+        copied = other.snapshot()
+        self.dim = copied.dim
+        self._ids, self._positions, self._edges = copied._ids, copied._positions, copied._edges
+        self.num_vertices, self.num_edges = copied.num_vertices, copied.num_edges
+        self._row_of = copied._row_of
+        self._adjacency = copied._adjacency
+
+    def adjacency(self):
+        """Return the CSR adjacency of the current edges, building it if needed."""
+        if self._adjacency is None:
+            self._adjacency = CSRAdjacency.from_edges(self.num_vertices, self.edges)
+        return self._adjacency
+
+    def degree(self, vertex_id):
+        return int(self.adjacency().degree(self.row_of[vertex_id]))
+
+    def neighbours(self, vertex_id):
+        """Return the ids of the neighbours of a vertex."""
+        return self.ids[self.adjacency().neighbours(self.row_of[vertex_id])]
+
+    def edge_ids(self):
+        """Return the edges as an (E, 2) array of vertex ids."""
+        return self.ids[self.edges]
+
+    def copy(self):
+        """Return an independent copy of the store, trimmed to its current size."""
+        store = GraphStore(self.dim, max(1, self.num_vertices), max(1, self.num_edges), self._positions.dtype)
+        store._ids[:self.num_vertices] = self.ids
+        store._positions[:self.num_vertices] = self.positions
+        store._edges[:self.num_edges] = self.edges
+        store.num_vertices = self.num_vertices
+        store.num_edges = self.num_edges
+        store._row_of = None if self._row_of is None else dict(self._row_of)
+        store._adjacency = self._adjacency  # Never mutated in place, so it can be shared
+        return store
+
+    # Snapshots of a freshly mapped file share its pages with the live store and other processes
+    # instead of holding a private copy; `remap` must be cleared once the store is changed
+    def snapshot(self):
+        """Return an independent copy, made by mapping the file again if `remap` is set."""
+        return self.copy() if self.remap is None else self.remap()
+
+    # Builds a store from the JSON schema ({"vertices", "edges", "positions"})
+    @classmethod
+    def from_dict(cls, graph_data, dim, dtype=np.float64):
+        """Return a store for the given graph data; vertices without a position get NaN."""
+        vertices = graph_data["vertices"]
+        edges = graph_data["edges"]
+        store = cls(dim, max(1, len(vertices)), max(1, len(edges)), dtype)
+        for vertex in vertices:
+            store.add_vertex(int(vertex["id"]), np.nan)
+        for key, position in graph_data.get("positions", {}).items():
+            row = store.row_of.get(int(key))
+            if row is not None:
+                store._positions[row] = np.asarray(position, dtype=dtype)
+        for start_id, end_id in edges:
+            store.add_edge(int(start_id), int(end_id))
+        return store
+
+    # Adopts arrays that were parsed in bulk or memory-mapped, such as by the loaders in graph_io,
+    # without copying them; they become the store's (full) buffers and `row_of` is built lazily
+    @classmethod
+    def from_arrays(cls, ids, positions, edges):
+        """Return a store over the given ids, (N, dim) positions and (E, 2) edge rows."""
+        store = cls(positions.shape[1], 0, 0, positions.dtype)
+        store._ids = np.ascontiguousarray(ids, dtype=np.int64)
+        store._positions = np.ascontiguousarray(positions)
+        store._edges = np.ascontiguousarray(edges, dtype=np.int32)
+        store.num_vertices = len(ids)
+        store.num_edges = len(edges)
+        store._row_of = None
+        return store
+
+    def to_dict(self):
+        """Return the graph in the JSON schema, with positions keyed by the string id."""
+        ids = self.ids.tolist()
+        return {
+            "vertices": [{"id": vertex_id} for vertex_id in ids],
+            "edges": self.edge_ids().tolist(),
+            "positions": {str(vertex_id): position for vertex_id, position in zip(ids, self.positions.tolist())},
+        }
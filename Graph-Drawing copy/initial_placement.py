@@ -0,0 +1,147 @@
+import numpy as np
+from adjacency import CSRAdjacency
+
+# Most LOBPCG iterations spent on the eigenvectors of one component; large sparse graphs stop here
+# with smooth but not fully converged coordinates, which is all a starting layout needs
+SPECTRAL_ITERATIONS = 200
+# The eigenvectors count as converged once every residual is below this fraction of its vector
+SPECTRAL_TOLERANCE = 1e-4
+# Components up to this many vertices are solved densely, which is faster than iterating
+SPECTRAL_DENSE_SIZE = 200
+
+
+# Rayleigh-Ritz step of LOBPCG: the `count` lowest Ritz vectors of L x = lambda D x in the span of
+# `basis`, each returned with its Laplacian image, and the part of them outside the old vectors
+def _rayleigh_ritz(basis, laplacian_basis, degrees, count):
+    gram_degree = basis.T @ (degrees[:, None] * basis)
+    gram_laplacian = basis.T @ laplacian_basis
+    # D-orthonormalize the basis, dropping directions it barely spans
+    scales, vectors = np.linalg.eigh(gram_degree)
+    kept = scales > scales.max() * 1e-10
+    transform = vectors[:, kept] / np.sqrt(scales[kept])
+    _, ritz = np.linalg.eigh(transform.T @ gram_laplacian @ transform)
+    coefficients = transform @ ritz[:, :count]
+    directions = coefficients.copy()
+    directions[:count] = 0
+    return (basis @ coefficients, laplacian_basis @ coefficients,
+            basis @ directions, laplacian_basis @ directions)
+
+
+# Koren's degree-normalized eigenvectors: the generalized problem L x = lambda D x keeps
+# low-degree vertices from being squeezed into the middle of the drawing
+def lowest_eigenvectors(adjacency, count, rng, iterations=SPECTRAL_ITERATIONS, tolerance=SPECTRAL_TOLERANCE):
+    """Return (vectors, iterations): the `count` lowest nontrivial eigenvectors of a connected graph's Laplacian.
+
+    Small graphs are solved densely (0 iterations); larger ones by LOBPCG with a degree
+    (Jacobi) preconditioner, using only sparse products with the adjacency. Columns the graph
+    is too small to have are zero.
+    """
+    degrees = adjacency.degree().astype(float)
+    n = len(degrees)
+    vectors = np.zeros((n, count))
+    count = min(count, n - 1)
+    if count <= 0:
+        return vectors, 0
+    if n <= SPECTRAL_DENSE_SIZE:
+        weights = np.zeros((n, n))
+        np.add.at(weights, (adjacency.sources, adjacency.targets), 1.0)
+        scaling = 1 / np.sqrt(degrees)
+        normalized = np.eye(n) - scaling[:, None] * weights * scaling
+        _, eigenvectors = np.linalg.eigh(normalized)
+        vectors[:, :count] = scaling[:, None] * eigenvectors[:, 1:count + 1]
+        return vectors, 0
+
+    total_degree = degrees.sum()
+
+    def laplacian(values):
+        return degrees[:, None] * values - adjacency.neighbour_sums(values)
+
+    # Removes the trivial eigenvector (the constant one) by subtracting the D-weighted mean
+    def deflate(values):
+        return values - (degrees @ values) / total_degree
+
+    # Scales every column to unit D-norm, so the Rayleigh-Ritz Gram matrices stay well conditioned
+    def normalize(values):
+        norms = np.sqrt(np.einsum("i,ij,ij->j", degrees, values, values))
+        return values / np.maximum(norms, 1e-300)
+
+    current = normalize(deflate(rng.standard_normal((n, count))))
+    current_image = laplacian(current)
+    direction = direction_image = None
+    for iteration in range(iterations):
+        scaled = degrees[:, None] * current
+        residual = current_image - scaled * np.einsum("ij,ij->j", current, current_image)
+        if (np.linalg.norm(residual, axis=0) <= tolerance * np.linalg.norm(scaled, axis=0)).all():
+            break
+        preconditioned = normalize(deflate(residual / degrees[:, None]))
+        basis = [current, preconditioned]
+        images = [current_image, laplacian(preconditioned)]
+        if direction is not None:
+            norms = np.sqrt(np.einsum("i,ij,ij->j", degrees, direction, direction))
+            norms = np.maximum(norms, 1e-300)
+            basis.append(direction / norms)
+            images.append(direction_image / norms)
+        current, current_image, direction, direction_image = _rayleigh_ritz(
+            np.hstack(basis), np.hstack(images), degrees, count)
+    else:
+        iteration = iterations
+    vectors[:, :count] = current
+    return vectors, iteration
+
+
+def spectral_positions(adjacency, dim, rng, extent, iterations=SPECTRAL_ITERATIONS):
+    """Return (positions, iterations): starting positions from the low Laplacian eigenvectors of every component.
+
+    Each component is drawn by its own `dim` lowest nontrivial eigenvectors, scaled to a box
+    whose area (or volume) share of [-extent, extent] matches its share of the vertices, and
+    centred at a random point inside it. Isolated vertices are placed uniformly at random.
+    `iterations` is the most LOBPCG iterations any component needed.
+    """
+    n = adjacency.num_rows
+    labels, num_components = adjacency.connected_components()
+    sizes = np.bincount(labels, minlength=num_components)
+    half_widths = extent * (sizes / max(n, 1)) ** (1 / dim)
+    centres = rng.uniform(-1, 1, size=(num_components, dim)) * (extent - half_widths)[:, None]
+    positions = centres[labels]
+
+    # Renumber rows component by component, so each component is one contiguous block of the CSR arrays
+    order = np.argsort(labels, kind="stable")
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    loops = adjacency.sources == adjacency.targets
+    ordered = CSRAdjacency.from_edges(n, np.stack([rank[adjacency.sources[~loops]],
+                                                   rank[adjacency.targets[~loops]]], axis=1))
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+
+    most_iterations = 0
+    for component in np.flatnonzero(sizes > 1):
+        start, stop = starts[component], starts[component + 1]
+        entries = slice(ordered.offsets[start], ordered.offsets[stop])
+        block = CSRAdjacency(ordered.offsets[start:stop + 1] - ordered.offsets[start],
+                             ordered.targets[entries] - start, ordered.sources[entries] - start)
+        vectors, used = lowest_eigenvectors(block, dim, rng, iterations=iterations)
+        most_iterations = max(most_iterations, used)
+        vectors -= vectors.mean(axis=0)
+        vectors /= np.maximum(np.abs(vectors).max(axis=0), 1e-300)
+        positions[order[start:stop]] += vectors * half_widths[component]
+    return positions, most_iterations
+
+
+# Repeats layer by layer, so chains of new vertices hanging off the placed graph are all reached
+def place_at_barycentres(adjacency, positions, missing, rng, spread):
+    """Place `missing` rows that connect to placed rows at the mean of their placed neighbours, in place.
+
+    Each placed row is jittered by a normal offset of scale `spread`, so vertices sharing the
+    same neighbours do not coincide. Returns the rows that were placed; missing rows with no
+    path to a placed row are left alone.
+    """
+    placed = ~np.asarray(missing, dtype=bool)
+    while True:
+        counts = adjacency.neighbour_sums(placed.astype(float))
+        layer = np.flatnonzero(~placed & (counts > 0))
+        if len(layer) == 0:
+            break
+        sums = adjacency.neighbour_sums(np.where(placed[:, None], positions, 0.0))
+        positions[layer] = sums[layer] / counts[layer, None] + rng.normal(scale=spread, size=(len(layer), positions.shape[1]))
+        placed[layer] = True
+    return np.flatnonzero(placed & missing)
@@ -0,0 +1,283 @@
+import time
+from contextlib import nullcontext
+import numpy as np
+from barnes_hut import barnes_hut_forces, SpatialTree
+from adjacency import CSRAdjacency
+from force_kernels import repulsive_forces, get_kernels, MAX_BLOCK_BYTES
+from spatial_index import GridIndex, REBUILD_FRACTION
+
+# Number of consecutive energy decreases after which the adaptive schedule heats back up
+ADAPTIVE_PROGRESS_STEPS = 5
+
+# Largest multiple of the base damping factor the adaptive step size may grow to
+MAX_STEP_GROWTH = 10.0
+
+# Vertices within this many ideal edge lengths (k) of a row moved by a local relayout are its
+# near field, re-evaluated every step; the rest is the far field, approximated once
+NEAR_FIELD_RADIUS = 3.0
+
+# Barnes-Hut opening angle of the far field of a local relayout
+FAR_FIELD_THETA = 0.5
+
+# The near radius follows k, which changes with every added or removed vertex; the grid of a
+# LocalField is kept until the radius is more than this factor away from its cell size
+CELL_SIZE_DRIFT = 2.0
+
+
+# Exact repulsion at `points` from `bodies`, two separate position arrays
+def _repulsion_from(points, bodies, c_repulse):
+    stacked = np.concatenate([points, bodies])
+    return repulsive_forces(stacked, c_repulse, rows=np.arange(len(points)),
+                            columns=np.arange(len(points), len(stacked)))
+
+
+class LocalField:
+    """Repulsion of the whole graph on the rows a local relayout moves, split into a near and a far field.
+
+    The near field of the moving rows is every vertex within a radius of one of them, found
+    through a GridIndex; the layout re-evaluates it exactly every step. The far field is the
+    rest of the graph, approximated by a Barnes-Hut walk from each moving row. The grid and
+    the tree are built from a snapshot of the positions and kept for later relayouts: rows
+    that moved, were appended or were removed since are corrected exactly, and both are
+    rebuilt once more than REBUILD_FRACTION of the rows changed. A relayout then costs about
+    as much as the neighbourhood it moves, plus one O(N) comparison to find what changed.
+    """
+
+    def __init__(self):
+        self.snapshot = None  # Positions the tree and the grid were built from
+        self.tree = None
+        self.grid = None
+        self.moved = self.appended = self.removed = None  # Rows changed since the snapshot, set by update()
+
+    def _build(self, positions, radius):
+        self.snapshot = positions.copy()
+        self.tree = SpatialTree(self.snapshot)
+        self.grid = GridIndex(cell_size=radius)
+        self.grid.build(self.snapshot)
+
+    # Rows whose position differs from the snapshot, rows appended since and rows removed since
+    def _changes(self, positions):
+        shared = min(len(positions), len(self.snapshot))
+        moved = np.flatnonzero(np.any(positions[:shared] != self.snapshot[:shared], axis=1))
+        self.moved, self.appended, self.removed = moved, np.arange(shared, len(positions)), np.arange(shared, len(self.snapshot))
+
+    def update(self, positions, radius):
+        """Find the rows changed since the snapshot, rebuilding the tree and grid if there are too many.
+
+        Called once per relayout; within it only the rows passed to split() may move.
+        """
+        if self.snapshot is None or self.snapshot.shape[1] != positions.shape[1] \
+                or not radius / CELL_SIZE_DRIFT <= self.grid.cell_size <= radius * CELL_SIZE_DRIFT:
+            self._build(positions, radius)
+        self._changes(positions)
+        if len(self.moved) + len(self.appended) + len(self.removed) > REBUILD_FRACTION * len(self.snapshot) + 64:
+            self._build(positions, radius)
+            self._changes(positions)
+        self.grid.moved(self.moved)  # The grid checks appended rows directly and skips removed ones itself
+
+    def split(self, positions, active, radius, c_repulse):
+        """Return (near, far_field): the rows near `active` (including it) and the far-field force on each active row."""
+        self.grid.moved(active)
+        points = positions[active]
+        near = np.union1d(self.grid.rows_near(positions, points, radius), active)
+        far_field = barnes_hut_forces(self.snapshot, c_repulse, FAR_FIELD_THETA, tree=self.tree, points=points)
+        # The tree holds the near rows and the changed rows at their snapshot positions: take those
+        # out, then add the changed rows outside the near field back at their current positions.
+        # The active rows are all near, so moving them needs no change here.
+        stale = np.union1d(np.union1d(near[near < len(self.snapshot)], self.moved), self.removed)
+        current = np.setdiff1d(np.union1d(self.moved, self.appended), near, assume_unique=True)
+        far_field -= _repulsion_from(points, self.snapshot[stale], c_repulse)
+        far_field += _repulsion_from(points, positions[current], c_repulse)
+        return near, far_field
+
+
+class ForceLayout:
+    """Vectorized force-directed layout over an (N, dim) position array and an (E, 2) edge index."""
+
+    def __init__(self, positions, edge_index, c_attract=0.1, c_repulse=0.5, c_center=0.0,
+                 k=None, damping=0.1, max_block_bytes=MAX_BLOCK_BYTES,
+                 repulsion="exact", theta=0.8, cooling="fixed", tolerance=0.0,
+                 tolerance_metric="max", initial_temperature=None, cooling_factor=0.9,
+                 active=None, adjacency=None, profiler=None, kernels=None, local_field=None):
+        self.positions = np.array(positions, dtype=float)
+        self.edge_index = np.asarray(edge_index, dtype=np.int64).reshape(-1, 2)
+        if adjacency is None:
+            adjacency = CSRAdjacency.from_edges(len(self.positions), self.edge_index)
+        self.adjacency = adjacency  # Attraction is accumulated row by row from this
+        self.c_attract = c_attract
+        self.c_repulse = c_repulse
+        self.c_center = c_center
+        if k is None:
+            k = np.sqrt(1 / max(1, len(self.positions))) * 5  # Ideal distance between vertices
+        self.k = k
+        self.damping = damping
+        self.max_block_bytes = max_block_bytes
+        if repulsion not in ("exact", "barnes_hut"):
+            raise ValueError(f"Unknown repulsion mode: {repulsion}")
+        self.repulsion = repulsion
+        self.theta = theta  # Barnes-Hut opening angle, only used when repulsion == "barnes_hut"
+        self.kernels = get_kernels(kernels)  # Exact repulsion and attraction backend (see force_kernels)
+
+        # Step-size schedule: "fixed" applies forces * damping every iteration, "adaptive"
+        # scales the step by Hu's adaptive rule and caps each vertex's move at a temperature
+        if cooling not in ("fixed", "adaptive"):
+            raise ValueError(f"Unknown cooling schedule: {cooling}")
+        if tolerance_metric not in ("max", "mean"):
+            raise ValueError(f"Unknown tolerance metric: {tolerance_metric}")
+        self.cooling = cooling
+        self.tolerance = tolerance  # Stop once the max/mean displacement falls below this
+        self.tolerance_metric = tolerance_metric
+        self.cooling_factor = cooling_factor
+
+        # Rows allowed to move; every other vertex stays pinned (None moves the whole graph)
+        self.active = None if active is None else np.unique(np.asarray(active, dtype=np.int64))
+        if self.active is not None:
+            # Pass a LocalField kept between relayouts of the same graph to reuse its tree and grid
+            self.local_field = LocalField() if local_field is None else local_field
+            self.local_field.update(self.positions, NEAR_FIELD_RADIUS * self.k)
+            self._split_local_field()
+
+        if initial_temperature is None:
+            moving = self.positions if self.active is None else self.positions[self.active]
+            extent = float(np.ptp(moving, axis=0).max()) if len(moving) else 0.0
+            initial_temperature = max(extent * 0.1, self.k)  # A tenth of the drawing, as in Fruchterman-Reingold
+        self.temperature = initial_temperature  # Longest move a vertex may make in one adaptive step
+        self.step_size = damping  # Current force-to-displacement factor of the adaptive schedule
+        self.energy = np.inf  # Sum of squared force magnitudes at the last step
+        self._progress = 0
+        self.profiler = profiler  # LayoutProfiler timing the phases of each iteration, if any
+
+    # Times the body of a `with` block as the named phase when profiling
+    def _phase(self, name):
+        return nullcontext() if self.profiler is None else self.profiler.phase(name)
+
+    # Splits the repulsion on the active rows into a near field, re-evaluated every step, and a
+    # far field that is evaluated once; split again once an active row has drifted half the near
+    # radius, since vertices outside the near field may then have come close
+    def _split_local_field(self):
+        radius = NEAR_FIELD_RADIUS * self.k
+        self._near, self._far_field = self.local_field.split(self.positions, self.active, radius, self.c_repulse)
+        self._split_positions = self.positions[self.active].copy()
+        self._split_drift = radius / 2
+
+    def _local_field_stale(self):
+        drift = self.positions[self.active] - self._split_positions
+        return bool(len(drift)) and float(np.einsum("ij,ij->i", drift, drift).max()) > self._split_drift ** 2
+
+    # Dispatches to the exact all-pairs pass or the Barnes-Hut approximation
+    def compute_repulsion(self, rows=None):
+        """Return the repulsive force on every vertex (or only on `rows`) using the configured mode."""
+        if self.repulsion == "barnes_hut":
+            return barnes_hut_forces(self.positions, self.c_repulse, self.theta, rows=rows)
+        return self.kernels.repulsion(self.positions, self.c_repulse, rows=rows, max_block_bytes=self.max_block_bytes)
+
+    # Compares the Barnes-Hut forces against the exact ones on a sample of vertices
+    def repulsion_error(self, sample_size=256, seed=0):
+        """Return relative error statistics of the current repulsion mode against exact forces."""
+        n = len(self.positions)
+        rng = np.random.default_rng(seed)
+        rows = np.arange(n) if n <= sample_size else np.sort(rng.choice(n, sample_size, replace=False))
+        exact = repulsive_forces(self.positions, self.c_repulse, self.max_block_bytes, rows=rows)
+        approx = self.compute_repulsion(rows=rows)
+        error = np.linalg.norm(approx - exact, axis=1)
+        magnitude = np.linalg.norm(exact, axis=1)
+        relative = error / np.maximum(magnitude, 1e-12)
+        return {
+            "theta": self.theta,
+            "sampled_vertices": len(rows),
+            "max_relative_error": float(relative.max()) if len(rows) else 0.0,
+            "mean_relative_error": float(relative.mean()) if len(rows) else 0.0,
+            "total_relative_error": float(np.linalg.norm(error) / max(np.linalg.norm(magnitude), 1e-12)),
+        }
+
+    # Sums every force acting on the current positions
+    def compute_forces(self):
+        """Return the net force on every vertex, or on the active rows only."""
+        if self.active is not None:
+            with self._phase("repulsion"):
+                if self._local_field_stale():
+                    self._split_local_field()
+                forces = self._far_field + self.kernels.repulsion(
+                    self.positions, self.c_repulse, rows=self.active, columns=self._near,
+                    max_block_bytes=self.max_block_bytes,
+                )
+            with self._phase("attraction"):
+                forces += self.kernels.attraction(self.adjacency, self.positions, self.c_attract, self.k, rows=self.active)
+                if self.c_center:
+                    forces -= self.positions[self.active] * self.c_center
+        else:
+            with self._phase("repulsion"):
+                forces = self.compute_repulsion()
+            with self._phase("attraction"):
+                forces += self.kernels.attraction(self.adjacency, self.positions, self.c_attract, self.k)
+                if self.c_center:
+                    forces -= self.positions * self.c_center
+        if self.profiler is not None:
+            self.profiler.count_forces(len(forces))
+        return forces
+
+    # Adjusts the step size from the change in energy, following Hu's adaptive step length:
+    # grow after several consecutive improvements, shrink (cool) whenever the energy rises.
+    # The step never drops below `damping`, so a small move always means a small force.
+    def _update_step_size(self, energy):
+        if energy < self.energy:
+            self._progress += 1
+            if self._progress >= ADAPTIVE_PROGRESS_STEPS:
+                self._progress = 0
+                self.step_size = min(self.step_size / self.cooling_factor, self.damping * MAX_STEP_GROWTH)
+        else:
+            self._progress = 0
+            self.step_size = max(self.step_size * self.cooling_factor, self.damping)
+
+    def step(self):
+        """Advance the layout by one iteration and return the applied displacement."""
+        forces = self.compute_forces()
+        with self._phase("update"):
+            energy = float(np.einsum("ij,ij->", forces, forces))
+            if self.cooling == "fixed":
+                displacement = forces * self.damping
+            else:
+                self._update_step_size(energy)
+                displacement = forces * self.step_size
+                length = np.sqrt(np.einsum("ij,ij->i", displacement, displacement))
+                too_long = length > self.temperature
+                displacement[too_long] *= (self.temperature / length[too_long])[:, None]
+            self.energy = energy
+            if self.active is None:
+                self.positions += displacement
+            else:
+                self.positions[self.active] += displacement
+        return displacement
+
+    def run(self, iterations, callback=None, callback_every=1):
+        """Run the layout for at most `iterations` iterations and return run statistics.
+
+        The run stops early once the max (or mean) vertex displacement falls below
+        `tolerance`. If given, `callback(iteration, positions)` is called every
+        `callback_every` iterations and after the last one; returning False stops the run.
+        """
+        started = time.perf_counter()
+        converged = False
+        iteration = 0
+        displacement_size = 0.0
+        for iteration in range(1, iterations + 1):
+            displacement = self.step()
+            length = np.sqrt(np.einsum("ij,ij->i", displacement, displacement))
+            if len(length):
+                displacement_size = float(length.max() if self.tolerance_metric == "max" else length.mean())
+            converged = displacement_size < self.tolerance
+            if self.profiler is not None:
+                self.profiler.end_iteration()
+            last = converged or iteration == iterations
+            if callback is not None and (iteration % callback_every == 0 or last):
+                if callback(iteration, self.positions) is False:
+                    break
+            if converged:
+                break
+        return {
+            "iterations": iteration,
+            "converged": converged,
+            "energy": self.energy,
+            "displacement": displacement_size,
+            "wall_time": time.perf_counter() - started,
+        }
@@ -0,0 +1,33 @@
+import numpy as np
+
+# Number of pivot vertices whose graph distances sampled_stress() compares the layout against
+STRESS_PIVOTS = 32
+
+
+def sampled_stress(positions, adjacency, num_pivots=STRESS_PIVOTS, seed=0):
+    """Return the normalized stress of a layout against graph distances from a sample of pivots.
+
+    For every pivot p and every vertex v reachable from it, the drawn distance |x_p - x_v| is
+    compared to the number of edges d between them, as the mean of (s * |x_p - x_v| / d - 1)^2
+    with s the scale that minimizes it, so the score does not depend on the size of the
+    drawing. 0 means every sampled distance is drawn in proportion; lower is better. The same
+    `seed` picks the same pivots, so scores of layouts of one graph are comparable.
+    """
+    positions = np.asarray(positions, dtype=float)
+    n = len(positions)
+    if n < 2:
+        return 0.0
+    pivots = np.random.default_rng(seed).choice(n, size=min(num_pivots, n), replace=False)
+    graph_distances, drawn_distances = [], []
+    for pivot in pivots:
+        hops = adjacency.bfs_distances(pivot)
+        reached = np.flatnonzero(hops > 0)
+        graph_distances.append(hops[reached])
+        drawn_distances.append(np.linalg.norm(positions[reached] - positions[pivot], axis=1))
+    graph_distances = np.concatenate(graph_distances).astype(float)
+    if len(graph_distances) == 0:
+        return 0.0
+    ratios = np.concatenate(drawn_distances) / graph_distances
+    # Minimizing sum((s * r - 1)^2) over the scale s gives s = sum(r) / sum(r^2)
+    scale = ratios.sum() / max(float(np.dot(ratios, ratios)), 1e-300)
+    return float(np.mean((scale * ratios - 1) ** 2))
@@ -0,0 +1,140 @@
+import numpy as np
+
+# Side, in pixels, of the screen cells that dense regions are aggregated into
+CELL_PIXELS = 4
+# A cell holding more vertices than this is drawn as one density splat instead of its vertices
+CELL_CAPACITY = 4
+# Edges shorter than this on screen are hidden under their end points and not drawn
+MIN_EDGE_PIXELS = 1.0
+# Above this many lines, edges are bundled between ever coarser screen cells until they fit
+MAX_LINES = 100000
+
+
+class DetailLevel:
+    """Reduced geometry for one view of the graph, as built by build_detail_level().
+
+    `points` holds, in order, the vertices drawn at full detail, one representative point per
+    splat (the mean position of the vertices it stands for) and the end points of the lines
+    that are not drawn as points: off-screen ends of edges that cross the view, or, when edges
+    are bundled, the mean position of each coarse cell. `lines` indexes into `points`.
+    """
+
+    def __init__(self, points, num_detail, splat_counts, lines, detail_rows):
+        self.points = points  # (M, dim) float32
+        self.num_detail = num_detail  # points[:num_detail] are vertices drawn as themselves
+        self.splat_counts = splat_counts  # Vertices behind each splat, for points[num_detail:num_detail + S]
+        self.lines = lines  # (L, 2) uint32 indices into points
+        self.detail_rows = detail_rows  # Store rows of the full-detail vertices
+
+    @property
+    def num_splats(self):
+        return len(self.splat_counts)
+
+    def stats(self):
+        return {"vertices": int(self.num_detail), "splats": int(self.num_splats), "edges": int(len(self.lines))}
+
+
+# Above this many possible pairs, unique lines are found by sorting rather than with a mask
+DENSE_PAIR_LIMIT = 1 << 24
+
+
+# Returns each pair of point indices once, smaller index first, without loops
+def _unique_lines(lines, num_points):
+    lines = np.sort(lines[lines[:, 0] != lines[:, 1]], axis=1)
+    keys = lines[:, 0] * num_points + lines[:, 1]
+    if num_points * num_points <= DENSE_PAIR_LIMIT:
+        present = np.zeros(num_points * num_points, dtype=bool)
+        present[keys] = True
+        keys = np.flatnonzero(present)
+    else:
+        keys.sort()
+        keys = keys[np.concatenate([[True], keys[1:] != keys[:-1]])] if len(keys) else keys
+    return np.column_stack([keys // max(num_points, 1), keys % max(num_points, 1)])
+
+
+# Groups the end points of `edges` by screen cells of `cell_pixels` and returns the mean end point
+# position of each group and the edges as unique pairs of groups. End points off the
+# (width x height) view are clamped into a one-cell border around it, so the cells stay as
+# many as fit on screen however far away an end point projects
+def _bundle_edges(positions, screen, edges, cell_pixels, width, height):
+    clamped = np.clip(screen[edges], -cell_pixels, (width + cell_pixels, height + cell_pixels))
+    cells = np.floor(clamped / cell_pixels).astype(np.int64) + 1
+    keys = cells[..., 0] * (int(np.ceil(height / cell_pixels)) + 3) + cells[..., 1]
+    used = np.zeros(keys.max() + 1, dtype=bool)
+    used[keys] = True
+    group = (np.cumsum(used) - 1)[keys]
+    num_groups = int(used.sum())
+    counts = np.bincount(group.ravel(), minlength=num_groups)
+    ends = positions[edges.ravel()]
+    means = np.column_stack([np.bincount(group.ravel(), weights=ends[:, axis], minlength=num_groups)
+                             for axis in range(positions.shape[1])]) / counts[:, None]
+    return means, _unique_lines(group, num_groups)
+
+
+def build_detail_level(positions, screen, visible_rows, edges, width, height, keep_rows=(),
+                       cell_pixels=CELL_PIXELS, cell_capacity=CELL_CAPACITY, min_edge_pixels=MIN_EDGE_PIXELS,
+                       max_lines=MAX_LINES):
+    """Return the DetailLevel to draw for the given view.
+
+    `screen` holds the (N, 2) window coordinates of all vertices (NaN where clipped) and
+    `visible_rows` the rows inside the (width x height) viewport, as found by a spatial index.
+    Vertices outside the view are culled, as are edges whose screen bounding box misses it
+    or that are shorter than `min_edge_pixels`. Visible vertices are bucketed into screen
+    cells of `cell_pixels`; sparse cells are drawn at full detail, while cells holding more
+    than `cell_capacity` vertices become a single splat, and edges between splats are merged.
+    If that still leaves more than `max_lines` lines, edges are instead bundled into one line
+    per pair of screen cells, doubling the cell size until they fit.
+    `keep_rows` (such as selected vertices) are always drawn at full detail.
+    """
+    visible_rows = np.asarray(visible_rows, dtype=np.int64)
+    columns = int(np.ceil(width / cell_pixels)) + 1
+    cells = np.floor(screen[visible_rows] / cell_pixels).astype(np.int64)
+    keys = cells[:, 0] * columns + cells[:, 1]
+    kept = np.isin(visible_rows, np.asarray(list(keep_rows), dtype=np.int64))
+    cell_keys, inverse, counts = np.unique(np.where(kept, -1, keys), return_inverse=True, return_counts=True)
+    dense = (counts > cell_capacity) & (cell_keys >= 0)
+    aggregated = dense[inverse]
+
+    # Full-detail vertices first, then one splat per dense cell at the mean of its vertices
+    detail_rows = visible_rows[~aggregated]
+    splat_of_cell = np.cumsum(dense) - 1
+    splat = splat_of_cell[inverse[aggregated]]
+    num_splats = int(dense.sum())
+    splat_counts = np.bincount(splat, minlength=num_splats)
+    splat_points = np.zeros((num_splats, positions.shape[1]))
+    for axis in range(positions.shape[1]):
+        splat_points[:, axis] = np.bincount(splat, weights=positions[visible_rows[aggregated], axis], minlength=num_splats)
+    splat_points /= np.maximum(splat_counts, 1)[:, None]
+
+    # Every vertex maps to the point that draws it: itself, its splat, or nothing if culled
+    slot = np.full(len(positions), -1, dtype=np.int64)
+    slot[detail_rows] = np.arange(len(detail_rows))
+    slot[visible_rows[aggregated]] = len(detail_rows) + splat
+
+    # Cull edges whose screen bounding box misses the view, or that are too short to see
+    ends = screen[edges]
+    with np.errstate(invalid="ignore"):
+        low, high = np.minimum(ends[:, 0], ends[:, 1]), np.maximum(ends[:, 0], ends[:, 1])
+        seen = (high[:, 0] >= 0) & (low[:, 0] <= width) & (high[:, 1] >= 0) & (low[:, 1] <= height)
+        seen &= np.hypot(*(ends[:, 0] - ends[:, 1]).T) >= min_edge_pixels
+    seen_edges = edges[seen]
+
+    # Edges leaving the view need their off-screen end points as extra line vertices
+    outside = np.unique(seen_edges[slot[seen_edges] < 0])
+    slot[outside] = len(detail_rows) + num_splats + np.arange(len(outside))
+    line_points = positions[outside]
+
+    # Edges inside one splat vanish and parallel edges between splats are drawn once
+    num_points = len(detail_rows) + num_splats + len(outside)
+    lines = _unique_lines(slot[seen_edges], num_points)
+    # Start from the first cell size at which the screen has at most sqrt(2 * max_lines) cells, too
+    # few to produce more than max_lines pairs between the cells in view
+    target = np.sqrt(width * height / np.sqrt(2 * max_lines)) / cell_pixels
+    edge_cell_pixels = cell_pixels * 2 ** max(1, int(np.ceil(np.log2(max(target, 1)))))
+    while len(lines) > max_lines and edge_cell_pixels < 2 * max(width, height):
+        line_points, lines = _bundle_edges(positions, screen, seen_edges, edge_cell_pixels, width, height)
+        lines += len(detail_rows) + num_splats
+        edge_cell_pixels *= 2
+
+    points = np.concatenate([positions[detail_rows], splat_points, line_points]).astype(np.float32)
+    return DetailLevel(points, len(detail_rows), splat_counts, lines.astype(np.uint32), detail_rows)
@@ -0,0 +1,143 @@
+import time
+from contextlib import nullcontext
+import numpy as np
+
+# Coarsening stops once a level has at most this many vertices
+MIN_COARSE_VERTICES = 50
+
+# Coarsening also stops when a matching pass shrinks the graph by less than this factor
+MIN_SHRINK_FACTOR = 0.9
+
+# Number of proposal rounds used to grow each matching towards a maximal one
+MATCHING_ROUNDS = 8
+
+
+# Grows a (near-)maximal matching by letting every vertex propose along its highest-priority free edge
+def maximal_matching(n, edge_index, rng):
+    """Return an array mapping each vertex to its matched partner, or -1 if unmatched."""
+    partner = np.full(n, -1, dtype=np.int64)
+    edges = edge_index[edge_index[:, 0] != edge_index[:, 1]]
+    for _ in range(MATCHING_ROUNDS):
+        free = (partner[edges[:, 0]] < 0) & (partner[edges[:, 1]] < 0)
+        edges = edges[free]
+        if len(edges) == 0:
+            break
+        priority = rng.random(len(edges))
+        best = np.full(n, -1.0)
+        np.maximum.at(best, edges[:, 0], priority)
+        np.maximum.at(best, edges[:, 1], priority)
+        # An edge is matched when it is the best choice of both of its endpoints
+        chosen = (best[edges[:, 0]] == priority) & (best[edges[:, 1]] == priority)
+        start, end = edges[chosen, 0], edges[chosen, 1]
+        partner[start] = end
+        partner[end] = start
+    return partner
+
+
+# Collapses matched vertex pairs into single vertices of a coarser graph
+def coarsen(n, edge_index, rng):
+    """Return (coarse_n, parent, coarse_edges) for one edge-collapse step."""
+    partner = maximal_matching(n, edge_index, rng)
+    representative = np.where((partner >= 0) & (partner < np.arange(n)), partner, np.arange(n))
+    kept, parent = np.unique(representative, return_inverse=True)
+    coarse_edges = parent[edge_index]
+    coarse_edges = coarse_edges[coarse_edges[:, 0] != coarse_edges[:, 1]]
+    coarse_edges = np.unique(np.sort(coarse_edges, axis=1), axis=0).reshape(-1, 2)
+    return len(kept), parent, coarse_edges
+
+
+class MultilevelLayout:
+    """Coarsen-layout-refine pipeline driving a force layout at every level of a graph hierarchy.
+
+    `make_layout(positions, edge_index)` must return a configured ForceLayout, so each
+    level runs the same force model as a plain layout of that level would.
+    """
+
+    def __init__(self, make_layout, coarsest_iterations=50, refine_iterations=10,
+                 min_vertices=MIN_COARSE_VERTICES, seed=None, profiler=None):
+        self.make_layout = make_layout
+        self.coarsest_iterations = coarsest_iterations
+        self.refine_iterations = refine_iterations
+        self.min_vertices = min_vertices
+        self.rng = np.random.default_rng(seed)
+        self.stats = {}
+        self.profiler = profiler  # LayoutProfiler timing the coarsening, if any
+
+    # Builds the hierarchy from the input graph down to the coarsest level
+    def build_hierarchy(self, n, edge_index):
+        """Return a list of (n, edge_index, parent) levels, finest first."""
+        levels = [(n, edge_index, None)]
+        while n > self.min_vertices:
+            coarse_n, parent, coarse_edges = coarsen(n, edge_index, self.rng)
+            if coarse_n > MIN_SHRINK_FACTOR * n:
+                break
+            levels[-1] = (n, edge_index, parent)
+            levels.append((coarse_n, coarse_edges, None))
+            n, edge_index = coarse_n, coarse_edges
+        return levels
+
+    def run(self, positions, edge_index, callback=None, callback_every=1):
+        """Lay out the graph level by level and return the final (N, dim) positions.
+
+        `callback(iteration, positions)` behaves as in ForceLayout.run, counting iterations
+        across all levels; coarse-level positions are expanded to one row per input vertex.
+        """
+        positions = np.asarray(positions, dtype=float)
+        with nullcontext() if self.profiler is None else self.profiler.phase("coarsening"):
+            levels = self.build_hierarchy(len(positions), np.asarray(edge_index, dtype=np.int64).reshape(-1, 2))
+
+            # Start every level from the centroid of the fine vertices it stands for
+            level_positions = [positions]
+            for n, _, parent in levels[:-1]:
+                fine = level_positions[-1]
+                counts = np.bincount(parent)
+                coarse = np.stack([np.bincount(parent, weights=fine[:, axis]) for axis in range(fine.shape[1])], axis=1)
+                level_positions.append(coarse / counts[:, None])
+
+        # Maps every input vertex to the vertex standing for it at each level
+        to_finest = [np.arange(len(positions))]
+        for _, _, parent in levels[:-1]:
+            to_finest.append(parent[to_finest[-1]])
+
+        current = level_positions[-1]
+        started = time.perf_counter()
+        force_evaluations = 0
+        energy = np.inf
+        completed = 0
+        cancelled = False
+        for depth in range(len(levels) - 1, -1, -1):
+            n, level_edges, parent = levels[depth]
+            if depth < len(levels) - 1:
+                # Interpolate: each fine vertex starts at its parent, with a small jitter so merged pairs separate
+                spacing = np.ptp(current, axis=0).max() / np.sqrt(len(current)) or 1.0
+                jitter = self.rng.uniform(-0.5, 0.5, size=(n, current.shape[1])) * spacing * 0.1
+                current = current[parent] + jitter
+                iterations = self.refine_iterations
+            else:
+                iterations = self.coarsest_iterations
+            layout = self.make_layout(current, level_edges)
+            if callback is None:
+                run_stats = layout.run(iterations)
+            else:
+                def level_callback(iteration, coarse_positions, mapping=to_finest[depth], offset=completed):
+                    nonlocal cancelled
+                    cancelled = callback(offset + iteration, coarse_positions[mapping]) is False
+                    return not cancelled
+
+                run_stats = layout.run(iterations, callback=level_callback, callback_every=callback_every)
+            current = layout.positions
+            force_evaluations += run_stats["iterations"] * n
+            completed += run_stats["iterations"]
+            energy = run_stats["energy"]
+            if cancelled:
+                current = current[to_finest[depth]]
+                break
+
+        self.stats = {
+            "level_sizes": [level[0] for level in levels],
+            "vertex_force_evaluations": force_evaluations,
+            "iterations": completed,
+            "energy": energy,
+            "wall_time": time.perf_counter() - started,
+        }
+        return current
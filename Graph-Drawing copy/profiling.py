@@ -0,0 +1,129 @@
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource  # Not available on Windows, where the memory high-water mark is not reported
+except ImportError:
+    resource = None
+
+# Number of recent frames that frame time statistics are taken over
+FRAME_WINDOW = 120
+
+
+# Returns the peak resident memory of this process in bytes, or None where it is unknown
+def peak_memory_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Bytes on macOS, kilobytes elsewhere
+
+
+class LayoutProfiler:
+    """Optional instrumentation of layout runs and frame drawing.
+
+    Layouts given a profiler time each phase of every iteration (repulsion, attraction,
+    position update, multilevel coarsening) and count vertex force evaluations; the renderer
+    adds the time of every paintGL. Read the numbers with snapshot() or summary(), or pass
+    `callback(profiler)` to be called after every layout iteration, from the thread running
+    the layout. Without a profiler nothing is timed and layouts pay nothing.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.frame_times = deque(maxlen=FRAME_WINDOW)  # Seconds per frame, most recent last
+        self.frames = 0  # Frames drawn since the profiler was created
+        self.start_run()
+        self.finished = self.started  # No layout has run yet
+
+    def start_run(self):
+        """Clear the phase timings and counters for a new layout run; frame times are kept."""
+        self.phases = {}  # Phase name -> [calls, total seconds, longest call in seconds]
+        self.iterations = 0
+        self.force_evaluations = 0  # Net forces computed on single vertices
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def finish_run(self):
+        """Mark the current layout run as finished, freezing its elapsed time."""
+        self.finished = time.perf_counter()
+
+    @property
+    def running(self):
+        return self.finished is None
+
+    @property
+    def elapsed(self):
+        """Seconds since the current run started, or the length of the last run once finished."""
+        return (self.finished if self.finished is not None else time.perf_counter()) - self.started
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a `with` block as one call of the named phase."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        """Record one call of the named phase that took `seconds`."""
+        totals = self.phases.setdefault(name, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += seconds
+        totals[2] = max(totals[2], seconds)
+
+    def count_forces(self, count):
+        """Record `count` vertex force evaluations."""
+        self.force_evaluations += count
+
+    def end_iteration(self):
+        """Record a completed layout iteration and notify the callback."""
+        self.iterations += 1
+        if self.callback is not None:
+            self.callback(self)
+
+    def frame(self, seconds):
+        """Record the time taken to draw one frame."""
+        self.frame_times.append(seconds)
+        self.frames += 1
+
+    def snapshot(self):
+        """Return the current numbers as a dict of plain values."""
+        elapsed = self.elapsed
+        frame_times = list(self.frame_times)
+        phases = {}
+        for name, (calls, total, longest) in list(self.phases.items()):
+            phases[name] = {"calls": calls, "total": total, "mean": total / calls, "max": longest,
+                            "share": total / elapsed if elapsed > 0 else 0.0}
+        return {
+            "running": self.running,
+            "elapsed": elapsed,
+            "iterations": self.iterations,
+            "iterations_per_second": self.iterations / elapsed if elapsed > 0 else 0.0,
+            "force_evaluations": self.force_evaluations,
+            "force_evaluations_per_second": self.force_evaluations / elapsed if elapsed > 0 else 0.0,
+            "phases": phases,
+            "peak_memory_bytes": peak_memory_bytes(),
+            "frames": self.frames,
+            "last_frame_time": frame_times[-1] if frame_times else None,
+            "mean_frame_time": sum(frame_times) / len(frame_times) if frame_times else None,
+            "max_frame_time": max(frame_times) if frame_times else None,
+        }
+
+    def summary(self):
+        """Return the current numbers as a few short lines of text, as shown in the UI overlay."""
+        stats = self.snapshot()
+        lines = ["Layout %s: %d it in %.2f s (%.1f it/s)" % (
+            "running" if stats["running"] else "done", stats["iterations"], stats["elapsed"],
+            stats["iterations_per_second"])]
+        lines.append("Forces: %.3g vertex evaluations/s" % stats["force_evaluations_per_second"])
+        for name, phase in sorted(stats["phases"].items(), key=lambda item: -item[1]["total"]):
+            lines.append("  %-12s %5.1f%%  %8.2f ms/call" % (name, 100 * phase["share"], 1000 * phase["mean"]))
+        if stats["mean_frame_time"] is not None:
+            lines.append("Frames: %.1f ms mean, %.1f ms max (last %d)" % (
+                1000 * stats["mean_frame_time"], 1000 * stats["max_frame_time"], len(self.frame_times)))
+        if stats["peak_memory_bytes"] is not None:
+            lines.append("Peak memory: %.0f MB" % (stats["peak_memory_bytes"] / 2 ** 20))
+        return "\n".join(lines)
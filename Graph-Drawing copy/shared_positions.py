@@ -0,0 +1,81 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# Header slots: the generation of the newest complete buffer, the generation being written
+# (one ahead of it while a publish is under way) and the layout iteration of the newest buffer
+_PUBLISHED, _WRITING, _ITERATION = range(3)
+_HEADER_SLOTS = 4
+
+
+class SharedPositions:
+    """(N, dim) vertex positions in a shared memory block, written by one layout and read by the renderer.
+
+    The block holds a small header and two position buffers. publish() fills the buffer that
+    does not hold the newest layout and then advances the generation counter, so latest()
+    always returns a complete layout, as a view into shared memory rather than a copy. A
+    reader that keeps a view while the writer publishes twice more can find its buffer being
+    overwritten; intact(generation) tells it so, and it should read latest() again.
+
+    Instances pickle as the name and shape of their block, so they can be passed to worker
+    processes, which attach to the same memory. The creating instance frees the block in
+    close().
+    """
+
+    def __init__(self, num_vertices, dim, name=None):
+        self.num_vertices = num_vertices
+        self.dim = dim
+        self.owner = name is None
+        size = _HEADER_SLOTS * 8 + 2 * max(num_vertices * dim, 1) * 8
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.header = np.ndarray(_HEADER_SLOTS, dtype=np.int64, buffer=self.memory.buf)
+        self.buffers = np.ndarray((2, num_vertices, dim), dtype=np.float64, buffer=self.memory.buf,
+                                  offset=_HEADER_SLOTS * 8)
+        if self.owner:
+            self.header[:] = 0
+
+    # Sent to worker processes as the block's name; the copy attaches rather than creates
+    def __reduce__(self):
+        return SharedPositions, (self.num_vertices, self.dim, self.memory.name)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    @property
+    def generation(self):
+        """Number of layouts published so far; 0 until the first publish."""
+        return int(self.header[_PUBLISHED])
+
+    @property
+    def iteration(self):
+        """Layout iteration of the newest published positions."""
+        return int(self.header[_ITERATION])
+
+    def publish(self, positions, iteration=0):
+        """Copy `positions` into the spare buffer and make it the newest; only one process may publish."""
+        generation = int(self.header[_PUBLISHED]) + 1
+        self.header[_WRITING] = generation  # Before the copy, so readers of the buffer being reused can tell
+        self.buffers[generation % 2] = positions
+        self.header[_ITERATION] = iteration
+        self.header[_PUBLISHED] = generation
+
+    def latest(self):
+        """Return (positions, generation) of the newest published layout; positions is a read-only view."""
+        generation = int(self.header[_PUBLISHED])
+        view = self.buffers[generation % 2]
+        view.flags.writeable = False
+        return view, generation
+
+    def intact(self, generation):
+        """Return whether the buffer of `generation` still holds it, that is no publish has started reusing it."""
+        return int(self.header[_WRITING]) < generation + 2
+
+    def close(self):
+        """Detach from the block, and free it if this instance created it; the instance is unusable afterwards."""
+        self.header = self.buffers = None
+        try:
+            self.memory.close()
+        except BufferError:
+            pass  # Views from latest() are still alive; the mapping goes when they do
+        if self.owner:
+            self.memory.unlink()
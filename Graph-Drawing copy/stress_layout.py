@@ -0,0 +1,184 @@
+import time
+from contextlib import nullcontext
+import numpy as np
+
+# Number of pivot vertices whose shortest-path distances place the layout
+DEFAULT_PIVOTS = 50
+
+# Stress majorization stops once a sweep lowers the stress by less than this fraction
+STRESS_TOLERANCE = 1e-4
+
+
+# Picks each pivot as far as possible from those already chosen, so they spread over the graph
+def select_pivots(adjacency, num_pivots, rng):
+    """Return (pivots, hops): up to `num_pivots` max-min pivot rows and the (N, k) hop counts from each.
+
+    Hop counts are -1 where a vertex cannot be reached from a pivot. A component without a
+    pivot is always preferred for the next one, so every component gets one while pivots
+    last; isolated vertices are never chosen.
+    """
+    n = adjacency.num_rows
+    connected = adjacency.degree() > 0
+    candidates = np.flatnonzero(connected)
+    hops = np.empty((n, min(num_pivots, len(candidates))), dtype=np.int32)
+    pivots = np.empty(hops.shape[1], dtype=np.int64)
+    nearest = np.where(connected, np.iinfo(np.int64).max, -1)  # Hops to the closest pivot so far
+    pivot = int(rng.choice(candidates)) if len(candidates) else 0
+    for index in range(hops.shape[1]):
+        pivots[index] = pivot
+        hops[:, index] = adjacency.bfs_distances(pivot)
+        reached = hops[:, index] >= 0
+        nearest[reached] = np.minimum(nearest[reached], hops[reached, index])
+        nearest[pivot] = -1
+        pivot = int(np.argmax(nearest))
+    return pivots, hops
+
+
+# Classical MDS on the pivot columns only (Brandes & Pich): O(N k^2) instead of O(N^3)
+def pivot_mds(hops, dim):
+    """Return (N, dim) positions whose distances approximate the hop counts to the pivots, in hops.
+
+    Vertices in another component than a pivot are treated as one hop beyond the farthest
+    vertex it reaches, which keeps components apart.
+    """
+    distances = hops.astype(float)
+    distances[hops < 0] = distances.max() + 1
+    squared = distances ** 2
+    centred = -0.5 * (squared - squared.mean(axis=0) - squared.mean(axis=1)[:, None] + squared.mean())
+    eigenvalues, eigenvectors = np.linalg.eigh(centred.T @ centred)
+    order = np.argsort(eigenvalues)[::-1][:dim]
+    # centred @ v_i has length s_i; rescaling by s_i^(-1/2) gives the sqrt(s_i) of classical MDS
+    scale = np.maximum(eigenvalues[order], 1e-300) ** 0.25
+    positions = np.zeros((len(hops), dim))
+    positions[:, :len(order)] = centred @ eigenvectors[:, order] / scale
+    return positions
+
+
+class PivotStressLayout:
+    """Layout by pivot MDS, refined by sparse stress majorization, in O(k (N + E)) per pass.
+
+    BFS from `num_pivots` max-min pivots gives every vertex its hop count to each pivot, and
+    pivot MDS places the vertices so their distances match those counts. Up to `iterations`
+    sweeps of sparse stress majorization (Ortmann, Klimenta & Brandes) then refine it: every
+    vertex moves to the weighted average of where its neighbours and the pivots would put it,
+    with each pivot term weighted by how many vertices of that pivot's region it stands for.
+    The result keeps the global shape of long paths and trees that a spring model folds up.
+
+    Lengths are in units of `edge_length`. Vertices no pivot reaches (isolated vertices, or
+    components beyond the first `num_pivots`) keep their input positions.
+    """
+
+    def __init__(self, num_pivots=DEFAULT_PIVOTS, iterations=100, tolerance=STRESS_TOLERANCE, edge_length=1.0,
+                 seed=None, profiler=None):
+        self.num_pivots = num_pivots
+        self.iterations = iterations
+        self.tolerance = tolerance
+        self.edge_length = edge_length
+        self.rng = np.random.default_rng(seed)
+        self.stats = {}
+        self.profiler = profiler  # LayoutProfiler timing pivot selection, MDS and each sweep, if any
+
+    def _phase(self, name):
+        return nullcontext() if self.profiler is None else self.profiler.phase(name)
+
+    # Weights the term between a vertex and a pivot d hops away by the pivot's region members within
+    # d / 2 of it, over d^2; neighbours (d = 1) are left to the edge terms
+    @staticmethod
+    def pivot_weights(hops):
+        """Return the (N, k) weights of the vertex-pivot stress terms, 0 where there is no term."""
+        reachable = np.where(hops >= 0, hops, np.iinfo(hops.dtype).max)
+        region = np.argmin(reachable, axis=1)  # The closest pivot of every vertex
+        weights = np.zeros(hops.shape)
+        for column in range(hops.shape[1]):
+            hops_to_pivot = hops[:, column]
+            region_hops = np.sort(hops_to_pivot[(region == column) & (hops_to_pivot >= 0)])
+            terms = hops_to_pivot >= 2
+            members = np.searchsorted(region_hops, hops_to_pivot[terms] / 2, side="right")
+            weights[terms, column] = members / hops_to_pivot[terms].astype(float) ** 2
+        return weights
+
+    # One Jacobi sweep of localized stress majorization; also returns the normalized stress of the
+    # positions it started from and the scale that would fit them best
+    @staticmethod
+    def sweep(positions, sources, targets, pivots, hops, weights, moving):
+        numerator = np.zeros_like(positions)
+        denominator = np.zeros(len(positions))
+        residual = fit_numerator = fit_denominator = norm = 0.0
+        terms = [(sources, positions[targets], 1.0, 1.0)]
+        terms += [(moving[column], positions[pivots[column]], hops[moving[column], column],
+                   weights[moving[column], column]) for column in range(len(pivots))]
+        for rows, anchors, lengths, term_weights in terms:
+            delta = positions[rows] - anchors
+            distance = np.sqrt(np.einsum("ij,ij->i", delta, delta)) + 1e-9
+            goal = anchors + delta * (lengths / distance)[:, None]
+            term_weights = np.broadcast_to(term_weights, distance.shape)
+            for axis in range(positions.shape[1]):
+                numerator[:, axis] += np.bincount(rows, weights=term_weights * goal[:, axis], minlength=len(positions))
+            denominator += np.bincount(rows, weights=term_weights, minlength=len(positions))
+            residual += float(np.dot(term_weights, (distance - lengths) ** 2))
+            fit_numerator += float(np.dot(term_weights, lengths * distance))
+            fit_denominator += float(np.dot(term_weights, distance ** 2))
+            norm += float(np.dot(term_weights, np.broadcast_to(lengths, distance.shape) ** 2))
+        updated = positions.copy()
+        has_terms = denominator > 0
+        updated[has_terms] = numerator[has_terms] / denominator[has_terms, None]
+        return updated, residual / max(norm, 1e-300), fit_numerator / max(fit_denominator, 1e-300)
+
+    def run(self, positions, adjacency, callback=None, callback_every=1):
+        """Lay out the graph of `adjacency` (a CSRAdjacency) and return the final (N, dim) positions.
+
+        `callback(iteration, positions)` is called with the pivot MDS layout as iteration 0,
+        then as in ForceLayout.run for the stress sweeps; returning False stops the run.
+        """
+        started = time.perf_counter()
+        positions = np.array(positions, dtype=float)
+        n, dim = positions.shape
+        with self._phase("pivots"):
+            pivots, hops = select_pivots(adjacency, self.num_pivots, self.rng)
+        placed = (hops >= 0).any(axis=1)
+        with self._phase("mds"):
+            layout = np.zeros((n, dim))
+            layout[placed] = pivot_mds(hops[placed], dim)
+            weights = self.pivot_weights(hops)
+            moving = [np.flatnonzero(weights[:, column] > 0) for column in range(len(pivots))]
+            loops = adjacency.sources == adjacency.targets
+            sources, targets = adjacency.sources[~loops], adjacency.targets[~loops]
+            # Fit the scale of the MDS layout to the stress terms before refining it
+            _, stress, scale = self.sweep(layout, sources, targets, pivots, hops, weights, moving)
+            layout *= scale
+
+        def publish(iteration):
+            positions[placed] = layout[placed] * self.edge_length
+            return callback is None or callback(iteration, positions) is not False
+
+        iteration = published = 0
+        converged = False
+        cancelled = not publish(0)
+        previous = np.inf
+        while not cancelled and iteration < self.iterations:
+            with self._phase("stress"):
+                updated, stress, _ = self.sweep(layout, sources, targets, pivots, hops, weights, moving)
+            if previous - stress < self.tolerance * previous:
+                converged = True  # The last sweep barely helped; keep the layout it started from
+                break
+            layout, previous = updated, stress
+            iteration += 1
+            if self.profiler is not None:
+                self.profiler.count_forces(n)
+                self.profiler.end_iteration()
+            if iteration % callback_every == 0:
+                cancelled = not publish(iteration)
+                published = iteration
+        if not cancelled and published != iteration:
+            publish(iteration)
+        positions[placed] = layout[placed] * self.edge_length
+
+        self.stats = {
+            "pivots": len(pivots),
+            "iterations": iteration,
+            "converged": converged,
+            "stress": self.sweep(layout, sources, targets, pivots, hops, weights, moving)[1],
+            "wall_time": time.perf_counter() - started,
+        }
+        self.stats["energy"] = self.stats["stress"]  # What the multi_start_score "energy" compares
+        return positions
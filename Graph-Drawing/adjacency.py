@@ -0,0 +1,169 @@
+import numpy as np
+
+
+# Expands row segments [starts, stops) of an index array into one flat array of positions
+def _segment_positions(starts, stops):
+    counts = stops - starts
+    total = int(counts.sum())
+    return np.repeat(starts, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+
+
+class CSRAdjacency:
+    """Compressed sparse row adjacency of an undirected graph.
+
+    Every edge (a, b) is stored in both directions, so the neighbours of row v are
+    `targets[offsets[v]:offsets[v + 1]]`. Duplicate edges and self-loops are kept,
+    matching how the edge list is treated by the force model.
+    """
+
+    def __init__(self, offsets, targets, sources=None):
+        self.offsets = offsets
+        self.targets = targets
+        # Source row of every entry, so per-entry work can be done without Python loops
+        if sources is None:
+            sources = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        self.sources = sources
+
+    # Builds the structure by stably sorting the doubled edge list by source row
+    @classmethod
+    def from_edges(cls, n, edges):
+        """Return the CSR adjacency of `n` rows for an (E, 2) array of row pairs."""
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        sources = np.concatenate([edges[:, 0], edges[:, 1]])
+        targets = np.concatenate([edges[:, 1], edges[:, 0]])
+        order = np.argsort(sources, kind="stable")
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+        return cls(offsets, targets[order])
+
+    @property
+    def num_rows(self):
+        return len(self.offsets) - 1
+
+    # Patches the structure for vertices appended without edges; the original is left untouched,
+    # since a running layout may still be reading it
+    def with_added_rows(self, count):
+        """Return a copy of the adjacency extended by `count` isolated rows."""
+        offsets = np.concatenate([self.offsets, np.full(count, self.offsets[-1])])
+        return CSRAdjacency(offsets, self.targets, self.sources)
+
+    def without_last_rows(self, count):
+        """Return a copy of the adjacency without its last `count` rows, which must have no edges."""
+        return CSRAdjacency(self.offsets[:len(self.offsets) - count], self.targets, self.sources)
+
+    # Puts the new entries where from_edges would for an edge at the end of the edge list: a row's
+    # entries as an edge start come first, then its entries as an edge end, each in edge order.
+    # Patched and rebuilt structures then sum forces in the same order, bit for bit.
+    def with_added_edge(self, start, end, start_rank):
+        """Return a copy of the adjacency with the edge (start, end) appended to the edge list.
+
+        `start_rank` is the number of earlier edges that start at `start`. Costs a copy of the
+        entry arrays instead of the sort of a rebuild.
+        """
+        entries = [self.offsets[start] + start_rank, self.offsets[end + 1]]
+        targets, sources = [end, start], [start, end]
+        if end < start:
+            # Both entries can go to the same index; np.insert keeps the given order for ties
+            entries, targets, sources = entries[::-1], targets[::-1], sources[::-1]
+        offsets = self.offsets.copy()
+        offsets[start + 1:] += 1
+        offsets[end + 1:] += 1
+        return CSRAdjacency(offsets, np.insert(self.targets, entries, targets),
+                            np.insert(self.sources, entries, sources))
+
+    def without_last_edge(self, start, end, start_rank):
+        """Return a copy of the adjacency without (start, end), the last edge of the list; undoes with_added_edge."""
+        entries = [self.offsets[start] + start_rank, self.offsets[end + 1] - 1]
+        offsets = self.offsets.copy()
+        offsets[start + 1:] -= 1
+        offsets[end + 1:] -= 1
+        return CSRAdjacency(offsets, np.delete(self.targets, entries), np.delete(self.sources, entries))
+
+    def degree(self, rows=None):
+        """Return the degree of every row, or of the given rows."""
+        degrees = np.diff(self.offsets)
+        return degrees if rows is None else degrees[rows]
+
+    def neighbours(self, row):
+        """Return the neighbour rows of a single row."""
+        return self.targets[self.offsets[row]:self.offsets[row + 1]]
+
+    def k_hop(self, seeds, hops):
+        """Return the sorted rows within `hops` edges of any seed row."""
+        reached = np.zeros(self.num_rows, dtype=bool)
+        frontier = np.unique(np.asarray(seeds, dtype=np.int64))
+        reached[frontier] = True
+        for _ in range(hops):
+            entries = _segment_positions(self.offsets[frontier], self.offsets[frontier + 1])
+            candidates = self.targets[entries]
+            frontier = np.unique(candidates[~reached[candidates]])
+            if len(frontier) == 0:
+                break
+            reached[frontier] = True
+        return np.flatnonzero(reached)
+
+    # Breadth-first search that expands the whole frontier at once
+    def bfs_distances(self, source):
+        """Return the number of edges on a shortest path from `source` to every row, or -1 where unreachable."""
+        distances = np.full(self.num_rows, -1, dtype=np.int64)
+        distances[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+        hops = 0
+        while len(frontier):
+            hops += 1
+            entries = _segment_positions(self.offsets[frontier], self.offsets[frontier + 1])
+            candidates = self.targets[entries]
+            frontier = np.unique(candidates[distances[candidates] < 0])
+            distances[frontier] = hops
+        return distances
+
+    # Hooks the root of every edge's endpoint onto the smaller of the two roots, then jumps pointers
+    # until every row points at its root; repeats until no edge joins two roots
+    def connected_components(self):
+        """Return (labels, count): the component of every row, numbered from 0 in order of each component's first row."""
+        parent = np.arange(self.num_rows)
+        while True:
+            roots_a, roots_b = parent[self.sources], parent[self.targets]
+            joining = roots_a != roots_b
+            if not joining.any():
+                break
+            np.minimum.at(parent, roots_a[joining], roots_b[joining])
+            while True:
+                grandparent = parent[parent]
+                if np.array_equal(grandparent, parent):
+                    break
+                parent = grandparent
+        roots, labels = np.unique(parent, return_inverse=True)
+        return labels, len(roots)
+
+    def neighbour_sums(self, values):
+        """Return, for every row, the sum of `values` (one row of values per graph row) over its neighbours."""
+        values = np.asarray(values, dtype=float)
+        columns = values.reshape(len(values), -1)
+        sums = np.stack([np.bincount(self.sources, weights=columns[self.targets, column], minlength=self.num_rows)
+                         for column in range(columns.shape[1])], axis=1)
+        return sums.reshape((self.num_rows,) + values.shape[1:])
+
+    # Sums the spring force of every incident edge per row, segment by segment
+    def attractive_forces(self, positions, c_attract, k, rows=None):
+        """Return the attractive force on every row (or only on `rows`) from its incident edges."""
+        dim = positions.shape[1]
+        if rows is None:
+            rows = np.arange(self.num_rows)
+            entries = None
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            entries = _segment_positions(self.offsets[rows], self.offsets[rows + 1])
+        forces = np.zeros((len(rows), dim), dtype=positions.dtype)
+        sources = self.sources if entries is None else self.sources[entries]
+        targets = self.targets if entries is None else self.targets[entries]
+        if len(targets) == 0:
+            return forces
+        delta = positions[targets] - positions[sources]
+        distance = np.sqrt(np.einsum("ij,ij->i", delta, delta)) + 0.01
+        entry_forces = c_attract * (delta * (distance - k)[:, None])
+        counts = self.degree(rows)
+        nonempty = counts > 0
+        segment_starts = np.cumsum(counts) - counts
+        forces[nonempty] = np.add.reduceat(entry_forces, segment_starts[nonempty], axis=0)
+        return forces
@@ -0,0 +1,157 @@
+import numpy as np
+
+# Deepest subdivision level of the tree; dim * MAX_DEPTH bits must fit in an int64 Morton key
+MAX_DEPTH = 20
+
+# Number of vertices whose tree walks are processed together, bounding the size of the
+# (vertex, cell) interaction frontier kept in memory
+WALK_CHUNK_SIZE = 4096
+
+
+# Interleaves the bits of integer grid coordinates into a single Morton (Z-order) key
+def morton_keys(grid_coords, depth):
+    """Return the Morton key of each row of integer grid coordinates."""
+    n, dim = grid_coords.shape
+    keys = np.zeros(n, dtype=np.int64)
+    for bit in range(depth):
+        for axis in range(dim):
+            keys |= ((grid_coords[:, axis] >> bit) & 1) << (bit * dim + axis)
+    return keys
+
+
+class SpatialTree:
+    """Quadtree (2D) or octree (3D) over a position array, stored level by level.
+
+    Each level holds its non-empty cells in Morton order, with the vertex count and
+    centre of mass of every cell, so the children of a cell are a contiguous range
+    of the next level.
+    """
+
+    def __init__(self, positions, max_depth=MAX_DEPTH):
+        n, dim = positions.shape
+        self.dim = dim
+        lower = positions.min(axis=0)
+        extent = float((positions.max(axis=0) - lower).max())
+        self.extent = extent if extent > 0 else 1.0
+        resolution = 1 << max_depth
+        grid = np.floor((positions - lower) / self.extent * resolution).astype(np.int64)
+        grid = np.clip(grid, 0, resolution - 1)
+        keys = morton_keys(grid, max_depth)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        sorted_positions = positions[order]
+
+        self.counts = []
+        self.centers = []
+        self.vertex_cell = []  # Cell index of every vertex at each level
+        self.child_start = []
+        self.child_stop = []
+        level_keys = []
+        for level in range(max_depth + 1):
+            cell_keys = sorted_keys >> (dim * (max_depth - level))
+            boundary = np.empty(n, dtype=bool)
+            boundary[0] = True
+            np.not_equal(cell_keys[1:], cell_keys[:-1], out=boundary[1:])
+            starts = np.flatnonzero(boundary)
+            counts = np.diff(np.append(starts, n))
+            cell_of_sorted = np.cumsum(boundary) - 1
+            vertex_cell = np.empty(n, dtype=np.int64)
+            vertex_cell[order] = cell_of_sorted
+            level_keys.append(cell_keys[starts])
+            self.counts.append(counts)
+            self.centers.append(np.add.reduceat(sorted_positions, starts, axis=0) / counts[:, None])
+            self.vertex_cell.append(vertex_cell)
+            if counts.max() == 1:
+                break  # Every vertex is alone in its cell; deeper levels add nothing
+
+        for level in range(len(level_keys) - 1):
+            parents, children = level_keys[level], level_keys[level + 1]
+            self.child_start.append(np.searchsorted(children, parents << dim))
+            self.child_stop.append(np.searchsorted(children, (parents + 1) << dim))
+
+    @property
+    def depth(self):
+        return len(self.counts)
+
+    # Side length of the cells at the given level
+    def cell_size(self, level):
+        return self.extent / (1 << level)
+
+
+# Expands (vertex, cell) pairs into (vertex, child cell) pairs for the next level
+def _expand(vertices, cells, child_start, child_stop):
+    starts = child_start[cells]
+    counts = child_stop[cells] - starts
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(vertices, counts), np.repeat(starts, counts) + offsets
+
+
+# Approximates the all-pairs repulsion of force_kernels.repulsive_forces with a tree walk
+def barnes_hut_forces(positions, c_repulse, theta, rows=None, tree=None, chunk_size=WALK_CHUNK_SIZE, points=None):
+    """Return approximate repulsive forces using a Barnes-Hut tree with opening angle theta.
+
+    A cell is treated as a single body at its centre of mass when its size divided
+    by its distance from the vertex is below theta; theta == 0 gives exact forces.
+    With `points`, an (M, dim) array of places that are not vertices of the tree, the
+    forces at those points from every vertex are returned instead, and `rows` is ignored.
+    """
+    n, dim = positions.shape
+    if points is None:
+        rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.int64)
+        points = positions[rows]
+    else:
+        rows = None
+    forces = np.zeros((len(points), dim), dtype=positions.dtype)
+    if n == 0 or len(points) == 0:
+        return forces
+    if tree is None:
+        tree = SpatialTree(positions)  # Rebuilt on every call, since positions move each iteration
+    last_level = tree.depth - 1
+
+    for chunk_start in range(0, len(points), chunk_size):
+        chunk_points = points[chunk_start:chunk_start + chunk_size]
+        chunk_rows = None if rows is None else rows[chunk_start:chunk_start + chunk_size]
+        # Frontier of pairs (index into chunk_points, cell index) still to be resolved
+        vertices = np.arange(len(chunk_points))
+        cells = np.zeros(len(chunk_points), dtype=np.int64)
+        for level in range(tree.depth):
+            if len(vertices) == 0:
+                break
+            vertex_points = chunk_points[vertices]
+            counts = tree.counts[level][cells].astype(positions.dtype)
+            centers = tree.centers[level][cells]
+            if chunk_rows is None:
+                contains_self = np.zeros(len(vertices), dtype=bool)
+            else:
+                contains_self = tree.vertex_cell[level][chunk_rows[vertices]] == cells
+            if level == last_level:
+                # Cells that still hold several vertices are taken as a single body;
+                # the vertex's own cell is corrected to exclude the vertex itself
+                accept = ~(contains_self & (counts == 1))
+                own = contains_self & accept
+                centers = centers.copy()
+                centers[own] = (centers[own] * counts[own, None] - vertex_points[own]) / (counts[own, None] - 1)
+                counts = counts - own
+            else:
+                delta = vertex_points - centers
+                distance = np.sqrt(np.einsum("ij,ij->i", delta, delta))
+                far = tree.cell_size(level) < theta * distance
+                accept = ~contains_self & (far | (counts == 1))
+
+            delta = vertex_points[accept] - centers[accept]
+            distance = np.sqrt(np.einsum("ij,ij->i", delta, delta)) + 0.01  # Same softening as the exact pass
+            contribution = c_repulse * delta * (counts[accept] / distance**2)[:, None]
+            for axis in range(dim):
+                forces[chunk_start:chunk_start + len(chunk_points), axis] += np.bincount(
+                    vertices[accept], weights=contribution[:, axis], minlength=len(chunk_points)
+                )
+
+            if level == last_level:
+                break
+            # A vertex alone in its own cell needs no further work; everything else opens up
+            open_cell = ~accept & ~(contains_self & (counts == 1))
+            vertices, cells = _expand(
+                vertices[open_cell], cells[open_cell], tree.child_start[level], tree.child_stop[level]
+            )
+    return forces
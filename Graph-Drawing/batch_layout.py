@@ -0,0 +1,182 @@
+"""Lay out graph files offline, in parallel, without Qt or a display.
+
+    python3 batch_layout.py graphs/*.json more/*.gbin -o laid_out/ --workers 8 --mode multilevel
+    python3 batch_layout.py huge.gbin --format binary --mode stress --pivots 100
+
+Each input (a JSON or binary graph file, or a glob of them; JSON files may leave out
+"positions") is loaded, laid out with the
+same GraphModel the GUI uses and written to the output directory as
+<name>.layout.json (or .layout.gbin with --format binary). Files are processed by a pool of
+worker processes; per-file timings and the overall throughput are logged.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from force_kernels import DEFAULT_KERNELS
+from graph_io import load_graph_file, save_binary_graph, BINARY_EXTENSION
+from graph_model import GraphModel
+from stress_layout import DEFAULT_PIVOTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIM = 2  # Dimension of the layouts this app draws
+
+
+def expand_inputs(patterns):
+    """Return the files matching the given paths or glob patterns, in order and without duplicates."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logger.warning("No files match %s", pattern)
+        paths.extend(match for match in matches if match not in paths)
+    return paths
+
+
+def output_path(path, output_dir, output_format):
+    """Return where the layout of `path` is written: <name>.layout.json or .layout.gbin."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    extension = BINARY_EXTENSION if output_format == "binary" else ".json"
+    return os.path.join(output_dir or os.path.dirname(path), name + ".layout" + extension)
+
+
+def layout_file(path, output, dim, settings, seed=None):
+    """Load, lay out and save one graph file; returns a dict of sizes and timings in seconds.
+
+    Runs in a worker process. `settings` maps GraphModel layout attributes (such as
+    layout_mode or force_iterations) to the values to use.
+    """
+    started = time.perf_counter()
+    model = GraphModel(dim, seed=seed, keep_history=False)
+    for name, value in settings.items():
+        setattr(model, name, value)
+    model.load_store(load_graph_file(path, dim, require_positions=False))  # Missing positions are placed by initial_placement
+    loaded = time.perf_counter()
+    model.run_layout()
+    laid_out = time.perf_counter()
+    if output.endswith(BINARY_EXTENSION):
+        save_binary_graph(output, model.store)
+    else:
+        with open(output, "w") as file:
+            json.dump(model.save_graph(), file)
+    saved = time.perf_counter()
+    return {
+        "path": path,
+        "output": output,
+        "vertices": model.store.num_vertices,
+        "edges": model.store.num_edges,
+        "load_time": loaded - started,
+        "layout_time": laid_out - loaded,
+        "save_time": saved - laid_out,
+        "total_time": saved - started,
+        "layout_stats": model.last_layout_stats,  # Includes the seeds and scores of --starts
+    }
+
+
+def run_batch(paths, output_dir, output_format, dim, settings, workers, seed=None):
+    """Lay out every file in `paths` with `workers` processes; returns (results, failures).
+
+    Results are dicts from layout_file(), in completion order; failures are (path, message) pairs.
+    """
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    jobs = [(path, output_path(path, output_dir, output_format)) for path in paths]
+    results, failures = [], []
+
+    def report(path, get_result):
+        try:
+            result = get_result()
+        except Exception as e:
+            failures.append((path, str(e)))
+            logger.error("%s: failed: %s", path, e)
+            return
+        results.append(result)
+        logger.info("%s: %d vertices, %d edges; load %.3f s, layout %.3f s, save %.3f s -> %s",
+                    path, result["vertices"], result["edges"], result["load_time"],
+                    result["layout_time"], result["save_time"], result["output"])
+
+    if workers <= 1:
+        for path, output in jobs:
+            report(path, lambda: layout_file(path, output, dim, settings, seed))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(layout_file, path, output, dim, settings, seed): path for path, output in jobs}
+            for future in as_completed(futures):
+                report(futures[future], future.result)
+    return results, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lay out graph files offline, in parallel, without a display.")
+    parser.add_argument("inputs", nargs="+", help="graph files (.json or %s) or glob patterns" % BINARY_EXTENSION)
+    parser.add_argument("-o", "--output-dir", help="directory for the results (default: next to each input)")
+    parser.add_argument("--format", choices=("json", "binary"), default="json", help="output format")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--dim", type=int, choices=(2, 3), default=DEFAULT_DIM, help="layout dimension")
+    parser.add_argument("--mode", choices=("force", "multilevel", "stress"), default="force", help="layout mode")
+    parser.add_argument("--iterations", type=int, default=200, help="maximum layout iterations")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="convergence tolerance")
+    parser.add_argument("--cooling", choices=("adaptive", "fixed"), default="adaptive", help="step control")
+    parser.add_argument("--repulsion", choices=("exact", "barnes_hut"), default="exact", help="repulsion mode")
+    parser.add_argument("--theta", type=float, default=0.8, help="Barnes-Hut opening angle")
+    parser.add_argument("--pivots", type=int, default=DEFAULT_PIVOTS, help="pivot vertices of --mode stress")
+    parser.add_argument("--stress-iterations", type=int, default=100,
+                        help="stress majorization sweeps of --mode stress (0: pivot MDS only)")
+    parser.add_argument("--kernels", choices=("numpy", "numba", "auto"), default=DEFAULT_KERNELS,
+                        help="force kernel backend (numba falls back to numpy when not installed)")
+    parser.add_argument("--starts", type=int, default=1,
+                        help="lay out from this many seeded random starts and keep the best")
+    parser.add_argument("--score", choices=("stress", "energy"), default="stress", help="how --starts picks the best")
+    parser.add_argument("--placement", choices=("random", "spectral"), default="random",
+                        help="starting positions of vertices that have none")
+    parser.add_argument("--seed", type=int, help="seed for the positions of vertices that have none, and of --starts")
+    parser.add_argument("--log-level", default=os.environ.get("GRAPH_LOG_LEVEL", "INFO"), help="logging level")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if logging.getLogger().getEffectiveLevel() > logging.DEBUG:
+        # Per-file lines come from this module; the model's own summaries would repeat them
+        logging.getLogger("graph_model").setLevel(logging.WARNING)
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        logger.error("No input files.")
+        return 2
+    settings = {
+        "layout_mode": args.mode,
+        "force_iterations": args.iterations,
+        "layout_tolerance": args.tolerance,
+        "layout_cooling": args.cooling,
+        "repulsion_mode": args.repulsion,
+        "barnes_hut_theta": args.theta,
+        "stress_pivots": args.pivots,
+        "stress_iterations": args.stress_iterations,
+        "force_kernels": args.kernels,
+        "multi_start": args.starts,
+        "multi_start_score": args.score,
+        "initial_placement": args.placement,
+    }
+    if min(args.workers, len(paths)) > 1:
+        settings["multi_start_workers"] = 1  # Files already keep every CPU busy; run each file's starts in turn
+
+    started = time.perf_counter()
+    results, failures = run_batch(paths, args.output_dir, args.format, args.dim, settings,
+                                  min(args.workers, len(paths)), args.seed)
+    elapsed = time.perf_counter() - started
+    vertices = sum(result["vertices"] for result in results)
+    edges = sum(result["edges"] for result in results)
+    logger.info("Laid out %d of %d files in %.2f s with %d workers: %.2f files/s, %.0f vertices/s, %.0f edges/s",
+                len(results), len(paths), elapsed, min(args.workers, len(paths)), len(results) / elapsed,
+                vertices / elapsed, edges / elapsed)
+    for path, message in failures:
+        logger.error("Failed: %s: %s", path, message)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
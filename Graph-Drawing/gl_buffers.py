@@ -0,0 +1,296 @@
+import numpy as np
+from OpenGL.GL import *
+
+# Dirty rows closer together than this are re-sent as one glBufferSubData range
+MERGE_GAP_ROWS = 64
+# Above this many separate ranges, the bounding range is re-sent instead
+MAX_RANGES = 32
+
+SELECTED_COLOUR = (255, 0, 0)  # Red for selected vertices
+VERTEX_COLOUR = (255, 255, 255)  # White for normal vertices
+SPLAT_DIMMEST = 0.35  # Brightness of the sparsest density splat, relative to VERTEX_COLOUR
+
+
+class _DirtyRows:
+    """Rows of a buffer that changed since the last upload; `all` means re-send everything."""
+
+    def __init__(self):
+        self.all = True
+        self.rows = []
+
+    def mark(self, rows=None):
+        if rows is None:
+            self.all = True
+            self.rows = []
+        elif not self.all:
+            self.rows.append(np.asarray(rows, dtype=np.int64).ravel())
+
+    def clear(self):
+        self.all = False
+        self.rows = []
+
+    def ranges(self, count):
+        """Return the dirty rows below `count` as merged [start, stop) ranges."""
+        if self.all:
+            return [(0, count)] if count else []
+        if not self.rows:
+            return []
+        rows = np.unique(np.concatenate(self.rows))
+        rows = rows[rows < count]
+        if len(rows) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(rows) > MERGE_GAP_ROWS)
+        if len(breaks) >= MAX_RANGES:
+            return [(int(rows[0]), int(rows[-1]) + 1)]
+        starts = np.concatenate([rows[:1], rows[breaks + 1]])
+        stops = np.concatenate([rows[breaks], rows[-1:]]) + 1
+        return list(zip(starts.tolist(), stops.tolist()))
+
+
+class _Buffer:
+    """One GL buffer object of fixed-width rows that grows by doubling, like GraphStore's arrays."""
+
+    def __init__(self, target, dtype, width, usage):
+        self.target = target
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.usage = usage
+        self.id = None
+        self.capacity = 0
+        self.count = 0
+        self.dirty = _DirtyRows()
+
+    @property
+    def row_bytes(self):
+        return self.dtype.itemsize * self.width
+
+    def create(self):
+        self.id = glGenBuffers(1)
+        self.reset()
+
+    # Forgets the uploaded contents, so the next sync reallocates and re-sends every row
+    def reset(self, width=None):
+        self.width = width or self.width
+        self.capacity = 0
+        self.dirty.mark()
+
+    # Sends the dirty rows of `array` with glBufferSubData, reallocating only when it outgrows the buffer
+    def sync(self, array):
+        count = len(array)
+        glBindBuffer(self.target, self.id)
+        if count > self.capacity:
+            self.capacity = max(count, 2 * self.capacity, 16)
+            glBufferData(self.target, self.capacity * self.row_bytes, None, self.usage)
+            self.dirty.mark()
+        for start, stop in self.dirty.ranges(count):
+            data = np.ascontiguousarray(array[start:stop], dtype=self.dtype)
+            glBufferSubData(self.target, start * self.row_bytes, data.nbytes, data)
+        glBindBuffer(self.target, 0)
+        self.dirty.clear()
+        self.count = count
+
+
+# Draws `count` points starting at `first`, each in its own colour from `colours`
+def _draw_points(positions, colours, dim, first, count):
+    if count == 0:
+        return
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_COLOR_ARRAY)
+    glBindBuffer(GL_ARRAY_BUFFER, positions.id)
+    glVertexPointer(dim, GL_FLOAT, 0, None)
+    glBindBuffer(GL_ARRAY_BUFFER, colours.id)
+    glColorPointer(colours.width, GL_UNSIGNED_BYTE, 0, None)
+    glDrawArrays(GL_POINTS, first, count)
+    glDisableClientState(GL_COLOR_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+
+# Draws the row pairs in `indices` as lines between `positions`, in the current colour
+def _draw_lines(positions, indices, dim):
+    if indices.count == 0:
+        return
+    glBindBuffer(GL_ARRAY_BUFFER, positions.id)
+    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, indices.id)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(dim, GL_FLOAT, 0, None)
+    glDrawElements(GL_LINES, 2 * indices.count, GL_UNSIGNED_INT, None)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+
+class GraphBuffers:
+    """Vertex, colour and index buffer objects holding the graph geometry on the GPU.
+
+    Positions are kept as float32 in a vertex buffer, per-vertex colours as RGB bytes in a
+    colour buffer and the edges as uint32 row pairs in an index buffer, so a frame draws all
+    vertices with one glDrawArrays call and all edges with one glDrawElements call.
+
+    Changes are tracked separately for positions, topology and selection, down to the rows
+    involved, and sync() patches only those ranges with glBufferSubData: moving a few
+    vertices re-sends a few rows, an added edge one index pair, and a selection change only
+    the colour entries of the vertices whose selection state flipped.
+
+    A fourth buffer holds each vertex's row encoded as a colour, for colour-ID picking; it is
+    only filled the first time draw_vertex_ids() is called.
+    """
+
+    def __init__(self):
+        self.positions = _Buffer(GL_ARRAY_BUFFER, np.float32, 2, GL_DYNAMIC_DRAW)
+        self.colours = _Buffer(GL_ARRAY_BUFFER, np.uint8, 3, GL_DYNAMIC_DRAW)
+        self.indices = _Buffer(GL_ELEMENT_ARRAY_BUFFER, np.uint32, 2, GL_STATIC_DRAW)
+        self.id_colours = _Buffer(GL_ARRAY_BUFFER, np.uint8, 4, GL_STATIC_DRAW)
+        self.selection_dirty = True
+        self.selected_rows = set()  # Rows currently coloured as selected on the GPU
+        self.store = None  # Store the buffers were last synced from
+        self.dim = 2
+
+    def create(self):
+        """Allocate the buffer objects; needs a current GL context (call from initializeGL)."""
+        for buffer in (self.positions, self.colours, self.indices, self.id_colours):
+            buffer.create()
+        self.selection_dirty = True
+
+    def positions_changed(self, rows=None):
+        """Mark the positions of the given rows (default: all rows) as changed."""
+        self.positions.dirty.mark(rows)
+
+    def topology_changed(self, edges=None):
+        """Mark the given edges (indices into store.edges; default: all edges) as changed."""
+        self.indices.dirty.mark(edges)
+
+    def selection_changed(self):
+        """Mark the set of selected vertices as changed."""
+        self.selection_dirty = True
+
+    # Uploads whatever was marked as changed; a different store is always re-sent in full
+    def sync(self, store, selected_rows, positions=None):
+        """Bring the GPU buffers up to date with `store` and the selected rows.
+
+        `positions` replaces store.positions as the source of vertex positions, such as the
+        shared buffer of a running background layout.
+        """
+        if store is not self.store:
+            self.positions.reset(width=store.dim)
+            self.colours.reset()
+            self.indices.reset()
+            self.id_colours.reset()
+            self.selection_dirty = True
+            self.store = store
+            self.dim = store.dim
+        if store.num_vertices > self.colours.count:
+            self.colours.dirty.mark(np.arange(self.colours.count, store.num_vertices))
+        if self.selection_dirty:
+            selected_rows = set(selected_rows)
+            self.colours.dirty.mark(sorted(selected_rows ^ self.selected_rows))
+            self.selected_rows = selected_rows
+            self.selection_dirty = False
+        self.positions.sync(store.positions if positions is None else positions)
+        self.indices.sync(store.edges)
+        self.colours.sync(_ColourRows(store.num_vertices, self.selected_rows))
+
+    def draw_vertices(self):
+        """Draw every vertex as a point in its own colour."""
+        _draw_points(self.positions, self.colours, self.dim, 0, self.positions.count)
+
+    # Row colours never change, so after the first call only appended rows are sent
+    def draw_vertex_ids(self):
+        """Draw every vertex as a point coloured with its row + 1 (see decode_vertex_ids), for picking."""
+        if self.positions.count == 0:
+            return
+        if self.positions.count > self.id_colours.count:
+            self.id_colours.dirty.mark(np.arange(self.id_colours.count, self.positions.count))
+        self.id_colours.sync(_IdColourRows(self.positions.count))
+        _draw_points(self.positions, self.id_colours, self.dim, 0, self.positions.count)
+
+    def draw_edges(self):
+        """Draw every edge as a line in the current colour."""
+        _draw_lines(self.positions, self.indices, self.dim)
+
+
+class DetailBuffers:
+    """Buffer objects holding a level_of_detail.DetailLevel: culled vertices, density splats and merged edges.
+
+    A detail level is rebuilt as a whole whenever the graph or the view changes, so it is
+    re-sent in full, into buffers that only reallocate when a level outgrows them.
+    """
+
+    def __init__(self):
+        self.points = _Buffer(GL_ARRAY_BUFFER, np.float32, 2, GL_DYNAMIC_DRAW)
+        self.colours = _Buffer(GL_ARRAY_BUFFER, np.uint8, 3, GL_DYNAMIC_DRAW)
+        self.lines = _Buffer(GL_ELEMENT_ARRAY_BUFFER, np.uint32, 2, GL_DYNAMIC_DRAW)
+        self.num_detail = 0
+        self.num_splats = 0
+        self.dim = 2
+
+    def create(self):
+        """Allocate the buffer objects; needs a current GL context (call from initializeGL)."""
+        for buffer in (self.points, self.colours, self.lines):
+            buffer.create()
+
+    def upload(self, level, selected_rows):
+        """Send a DetailLevel, colouring selected vertices and shading splats by how many vertices they hold."""
+        colours = np.zeros((len(level.points), 3), dtype=np.uint8)
+        colours[:level.num_detail] = VERTEX_COLOUR
+        colours[:level.num_detail][np.isin(level.detail_rows, list(selected_rows))] = SELECTED_COLOUR
+        if level.num_splats:
+            density = np.log(level.splat_counts) / np.log(max(level.splat_counts.max(), 2))
+            brightness = SPLAT_DIMMEST + (1 - SPLAT_DIMMEST) * density
+            colours[level.num_detail:level.num_detail + level.num_splats] = brightness[:, None] * VERTEX_COLOUR
+        if level.points.shape[1] != self.points.width:
+            self.points.reset(width=level.points.shape[1])
+        for buffer, array in ((self.points, level.points), (self.colours, colours), (self.lines, level.lines)):
+            buffer.dirty.mark()
+            buffer.sync(array)
+        self.num_detail, self.num_splats, self.dim = level.num_detail, level.num_splats, level.points.shape[1]
+
+    def draw_vertices(self):
+        """Draw the vertices kept at full detail."""
+        _draw_points(self.points, self.colours, self.dim, 0, self.num_detail)
+
+    def draw_splats(self):
+        """Draw one point per aggregated region, brighter where it stands for more vertices."""
+        _draw_points(self.points, self.colours, self.dim, self.num_detail, self.num_splats)
+
+    def draw_edges(self):
+        """Draw the culled and merged edges in the current colour."""
+        _draw_lines(self.points, self.lines, self.dim)
+
+
+class _ColourRows:
+    """Array-like view of the vertex colours, built only for the row ranges being uploaded."""
+
+    def __init__(self, count, selected_rows):
+        self.count = count
+        self.selected = np.fromiter(selected_rows, dtype=np.int64, count=len(selected_rows))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, rows):
+        start, stop, _ = rows.indices(self.count)
+        colours = np.empty((stop - start, 3), dtype=np.uint8)
+        colours[:] = VERTEX_COLOUR
+        selected = self.selected[(self.selected >= start) & (self.selected < stop)]
+        colours[selected - start] = SELECTED_COLOUR
+        return colours
+
+
+class _IdColourRows:
+    """Array-like view of the picking colours: row r is drawn as the RGBA bytes of r + 1, 0 meaning no vertex."""
+
+    def __init__(self, count):
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, rows):
+        start, stop, _ = rows.indices(self.count)
+        return np.arange(start + 1, stop + 1, dtype="<u4").view(np.uint8).reshape(-1, 4)
+
+
+def decode_vertex_ids(pixels):
+    """Return the rows encoded in (..., 4) RGBA pixels read back from draw_vertex_ids(), -1 where there is none."""
+    return np.ascontiguousarray(pixels, dtype=np.uint8).view("<u4")[..., 0].astype(np.int64) - 1
@@ -0,0 +1,481 @@
+import codecs
+import json
+import os
+import re
+from functools import partial
+import numpy as np
+from graph_store import GraphStore
+
+# Bytes read from the file per refill of the parse buffer
+CHUNK_SIZE = 4 * 1024 * 1024
+# Characters kept buffered ahead of the parse position; a single vertex, edge or position
+# entry longer than this is rejected
+MAX_ELEMENT_CHARS = 64 * 1024
+
+_WHITESPACE = re.compile(r"\s*")
+_KEY = re.compile(r'"((?:[^"\\]|\\.)*)"\s*:')
+_NUMBER = r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?"
+# Runs of well-formed elements, each followed by a comma, matched in one pass over the buffer
+_VERTEX_RUN = re.compile(r'(?:\s*\{\s*"id"\s*:\s*-?\d+\s*\}\s*,)*')
+_EDGE_RUN = re.compile(r"(?:\s*\[\s*-?\d+\s*,\s*-?\d+\s*\]\s*,)*")
+# Tokens of a value being skipped: strings, brackets, and anything else up to the next of those
+_SKIP_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}]|[^"\[\]{}]+')
+_DECODER = json.JSONDecoder()
+# Punctuation (and the "id" key) blanked out of a validated run so that only numbers remain
+_PUNCTUATION = str.maketrans('[]{}:,"id', " " * 9)
+
+
+class GraphFormatError(ValueError):
+    """Raised when a graph file does not follow the vertices/edges/positions schema."""
+
+
+class _Cancelled(Exception):
+    pass
+
+
+# Run pattern for position entries `"id": [x, y(, z)]` with exactly `dim` coordinates
+def _position_run(dim):
+    coordinates = r"\s*,\s*".join([_NUMBER] * dim)
+    return re.compile(r'(?:\s*"-?\d+"\s*:\s*\[\s*' + coordinates + r"\s*\]\s*,)*")
+
+
+class _Column:
+    """Growable array that appends blocks of rows, doubling its capacity when full."""
+
+    def __init__(self, tail, dtype, capacity=1024):
+        self.data = np.empty((capacity,) + tail, dtype=dtype)
+        self.size = 0
+
+    def extend(self, rows):
+        end = self.size + len(rows)
+        if end > len(self.data):
+            grown = np.empty((max(end, 2 * len(self.data)),) + self.data.shape[1:], dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = rows
+        self.size = end
+
+    def array(self):
+        return self.data[:self.size]
+
+
+class _IdLookup:
+    """Maps vertex ids to rows with a sorted copy of the ids, without a per-vertex dict."""
+
+    def __init__(self, ids):
+        # Ids numbered consecutively in row order, as this application writes them, map by offset
+        self.size = len(ids)
+        self.first = int(ids[0]) if len(ids) else 0
+        self.consecutive = bool(np.array_equal(ids, np.arange(self.first, self.first + len(ids))))
+        if self.consecutive:
+            return
+        self.order = np.argsort(ids, kind="stable")
+        self.sorted_ids = ids[self.order]
+        duplicate = np.flatnonzero(self.sorted_ids[1:] == self.sorted_ids[:-1])
+        if len(duplicate):
+            raise GraphFormatError(f"Vertex {self.sorted_ids[duplicate[0]]} already exists.")
+
+    def rows(self, keys):
+        """Return the rows of `keys` and a mask of the keys that are vertex ids."""
+        if self.consecutive:
+            rows = keys - self.first
+            found = (rows >= 0) & (rows < self.size)
+            return np.where(found, rows, 0), found
+        if len(self.sorted_ids) == 0:
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+        index = np.minimum(np.searchsorted(self.sorted_ids, keys), len(self.sorted_ids) - 1)
+        return self.order[index], self.sorted_ids[index] == keys
+
+
+class _StreamingGraphParser:
+    """Pull parser for the graph JSON schema that reads the file in chunks.
+
+    Runs of vertices, edges and positions are matched with one regex per buffer and
+    converted to arrays in bulk; anything the fast patterns do not cover (extra vertex
+    keys, NaN coordinates, ...) falls back to decoding that single element. When the
+    vertices come first, as in files written by this application, edges and positions
+    are resolved to rows as they are read, so a dangling edge is rejected on the spot.
+    """
+
+    def __init__(self, file, total_bytes, dim, progress=None, require_positions=True):
+        self.file = file
+        self.require_positions = require_positions
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.total_bytes = max(1, total_bytes)
+        self.bytes_read = 0
+        self.progress = progress
+        self.dim = dim
+        self.buf = ""
+        self.pos = 0
+        self.base = 0  # File offset (in characters) of buf[0], for error messages
+        self.eof = False
+        self.position_run = _position_run(dim)
+        self.ids = None
+        self.lookup = None
+        self.positions = None
+        self.edge_rows = _Column((2,), np.int32)
+        self.pending_edges = _Column((2,), np.int64)
+        self.pending_keys = _Column((), np.int64)
+        self.pending_coordinates = _Column((dim,), np.float64)
+
+    # --- Buffer handling ---
+
+    def fill(self):
+        """Buffer at least MAX_ELEMENT_CHARS characters past the parse position, unless at the end."""
+        while not self.eof and len(self.buf) - self.pos < MAX_ELEMENT_CHARS:
+            chunk = self.file.read(CHUNK_SIZE)
+            self.bytes_read += len(chunk)
+            try:
+                text = self.decoder.decode(chunk, final=not chunk)
+            except UnicodeDecodeError:
+                raise GraphFormatError(f"File is not valid UTF-8 (near byte {self.bytes_read})")
+            self.eof = not chunk
+            self.base += self.pos
+            self.buf = self.buf[self.pos:] + text
+            self.pos = 0
+            if self.progress is not None and self.progress(self.bytes_read / self.total_bytes) is False:
+                raise _Cancelled()
+
+    def error(self, message):
+        return GraphFormatError(f"{message} (at character {self.base + self.pos})")
+
+    def skip_whitespace(self):
+        self.fill()
+        self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+
+    def peek(self):
+        self.skip_whitespace()
+        return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            found = self.buf[self.pos:self.pos + 1] or "end of file"
+            raise self.error(f"Expected '{char}' but found '{found}'")
+        self.pos += 1
+
+    # Consumes ',' and returns True, or consumes `close` and returns False
+    def separator(self, close):
+        char = self.peek()
+        if char not in (",", close):
+            raise self.error(f"Expected ',' or '{close}'")
+        self.pos += 1
+        return char == ","
+
+    def key(self):
+        self.skip_whitespace()
+        match = _KEY.match(self.buf, self.pos)
+        if match is None:
+            raise self.error("Expected an object key")
+        self.pos = match.end()
+        return json.loads(f'"{match.group(1)}"')
+
+    # Decodes one small JSON value; MAX_ELEMENT_CHARS of lookahead guarantees it is complete
+    def value(self):
+        self.skip_whitespace()
+        try:
+            value, end = _DECODER.raw_decode(self.buf, self.pos)
+        except json.JSONDecodeError as e:
+            raise self.error(f"Invalid JSON value: {e.msg}")
+        if end >= len(self.buf) and not self.eof:
+            raise self.error(f"Value longer than {MAX_ELEMENT_CHARS} characters")
+        self.pos = end
+        return value
+
+    # Skips a value of any size, such as an unknown top-level key, without decoding it
+    def skip_value(self):
+        if self.peek() not in ("[", "{"):
+            self.value()
+            return
+        depth = 0
+        while True:
+            self.fill()
+            match = _SKIP_TOKEN.match(self.buf, self.pos)
+            if match is None:
+                raise self.error("Unterminated value")
+            self.pos = match.end()
+            token = match.group()
+            if token in ("[", "{"):
+                depth += 1
+            elif token in ("]", "}"):
+                depth -= 1
+                if depth == 0:
+                    return
+
+    # Matches a run of comma-terminated elements at the parse position and returns its text
+    def run(self, pattern):
+        self.fill()
+        end = pattern.match(self.buf, self.pos).end()
+        text = self.buf[self.pos:end]
+        self.pos = end
+        return text
+
+    # --- Schema ---
+
+    def parse(self):
+        """Parse the whole file and return a GraphStore."""
+        self.expect("{")
+        seen = set()
+        if self.peek() == "}":
+            self.pos += 1
+        else:
+            while True:
+                key = self.key()
+                if key in seen:
+                    raise self.error(f"Duplicate key '{key}'")
+                seen.add(key)
+                if key == "vertices":
+                    self.parse_vertices()
+                elif key == "edges":
+                    self.parse_edges()
+                elif key == "positions":
+                    self.parse_positions()
+                else:
+                    self.skip_value()
+                if not self.separator("}"):
+                    break
+        if self.peek():
+            raise self.error("Unexpected data after the graph object")
+        required = {"vertices", "edges", "positions"} if self.require_positions else {"vertices", "edges"}
+        if not required <= seen:
+            raise GraphFormatError("The JSON file must contain 'vertices', 'edges', and 'positions' keys.")
+        return self.build()
+
+    def parse_vertices(self):
+        ids = _Column((), np.int64)
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+        else:
+            while True:
+                text = self.run(_VERTEX_RUN)
+                if text:
+                    ids.extend(np.array(text.translate(_PUNCTUATION).split(), dtype=np.int64))
+                    continue
+                vertex = self.value()
+                try:
+                    ids.extend([int(vertex["id"])])
+                except (KeyError, TypeError, ValueError):
+                    raise self.error("Each vertex must be an object with an integer 'id'")
+                if not self.separator("]"):
+                    break
+        self.ids = ids.array()
+        self.lookup = _IdLookup(self.ids)
+        self.positions = np.full((len(self.ids), self.dim), np.nan)
+        self.resolve_pending()
+
+    def parse_edges(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            text = self.run(_EDGE_RUN)
+            if text:
+                self.add_edges(np.array(text.translate(_PUNCTUATION).split(), dtype=np.int64).reshape(-1, 2))
+                continue
+            edge = self.value()
+            try:
+                if len(edge) != 2:
+                    raise ValueError
+                pair = np.array([[int(edge[0]), int(edge[1])]], dtype=np.int64)
+            except (TypeError, ValueError):
+                raise self.error("Each edge must be a pair of vertex ids")
+            self.add_edges(pair)
+            if not self.separator("]"):
+                break
+
+    def parse_positions(self):
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            text = self.run(self.position_run)
+            if text:
+                numbers = text.translate(_PUNCTUATION).split()
+                keys = np.array(numbers[::self.dim + 1], dtype=np.int64)
+                del numbers[::self.dim + 1]
+                self.add_positions(keys, np.array(numbers, dtype=np.float64).reshape(-1, self.dim))
+                continue
+            key = self.key()
+            position = self.value()
+            try:
+                coordinates = np.asarray(position, dtype=np.float64)
+                if coordinates.shape != (self.dim,):
+                    raise ValueError
+                vertex_id = np.array([int(key)], dtype=np.int64)
+            except (TypeError, ValueError):
+                raise self.error(f"Position of vertex '{key}' must be a list of {self.dim} numbers")
+            self.add_positions(vertex_id, coordinates[None, :])
+            if not self.separator("}"):
+                break
+
+    # --- Arrays ---
+
+    def add_edges(self, pairs):
+        if self.lookup is None:
+            self.pending_edges.extend(pairs)
+            return
+        rows, found = self.lookup.rows(pairs)
+        if not found.all():
+            missing = pairs[~found][0]
+            raise GraphFormatError(f"Edge refers to a vertex that does not exist: {missing}")
+        self.edge_rows.extend(rows)
+
+    # Positions of ids that are not vertices are ignored, as GraphStore.from_dict does
+    def add_positions(self, keys, coordinates):
+        if self.lookup is None:
+            self.pending_keys.extend(keys)
+            self.pending_coordinates.extend(coordinates)
+            return
+        rows, found = self.lookup.rows(keys)
+        self.positions[rows[found]] = coordinates[found]
+
+    # Resolves edges and positions that were read before the vertices
+    def resolve_pending(self):
+        if self.pending_edges.size:
+            self.add_edges(self.pending_edges.array())
+        if self.pending_keys.size:
+            self.add_positions(self.pending_keys.array(), self.pending_coordinates.array())
+        self.pending_edges = self.pending_keys = self.pending_coordinates = None
+
+    def build(self):
+        if len(self.ids) >= np.iinfo(np.int32).max:
+            raise GraphFormatError("Too many vertices for 32-bit edge rows.")
+        return GraphStore.from_arrays(self.ids, self.positions, self.edge_rows.array())
+
+
+def load_json_graph(path, dim, progress=None, require_positions=True):
+    """Stream a graph JSON file into a GraphStore without loading the whole document.
+
+    `progress(fraction)` is called after every chunk read; returning False cancels the
+    load, in which case None is returned. Raises GraphFormatError for malformed input.
+    With `require_positions` False the "positions" key may be left out; vertices without
+    a position get NaN either way.
+    """
+    with open(path, "rb") as file:
+        parser = _StreamingGraphParser(file, os.fstat(file.fileno()).st_size, dim, progress, require_positions)
+        try:
+            return parser.parse()
+        except _Cancelled:
+            return None
+
+
+# --- Binary format ---
+#
+# A 64-byte header followed by the ids (int64), positions (float64, row-major) and edge rows
+# (int32 pairs) as raw little-endian blocks, each starting on a 64-byte boundary. The blocks
+# are memory-mapped on load, so nothing is parsed and unmodified pages stay shared with the
+# page cache (and with any other process that maps the same file).
+
+BINARY_MAGIC = b"GRAPHBIN"
+BINARY_VERSION = 1
+BINARY_EXTENSION = ".gbin"
+_HEADER = np.dtype([
+    ("magic", "S8"), ("version", "<u4"), ("dim", "<u4"), ("num_vertices", "<u8"), ("num_edges", "<u8"),
+])
+_HEADER_SIZE = 64
+_ALIGNMENT = 64
+_IDS_DTYPE = np.dtype("<i8")
+_POSITIONS_DTYPE = np.dtype("<f8")
+_EDGES_DTYPE = np.dtype("<i4")
+
+
+# Byte offsets of the id, position and edge blocks, and the end of the file
+def _binary_layout(dim, num_vertices, num_edges):
+    def align(offset):
+        return -(-offset // _ALIGNMENT) * _ALIGNMENT
+    ids = _HEADER_SIZE
+    positions = align(ids + num_vertices * _IDS_DTYPE.itemsize)
+    edges = align(positions + num_vertices * dim * _POSITIONS_DTYPE.itemsize)
+    return ids, positions, edges, edges + num_edges * 2 * _EDGES_DTYPE.itemsize
+
+
+def is_binary_graph(path):
+    """Return True if the file starts with the binary graph header."""
+    with open(path, "rb") as file:
+        return file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def save_binary_graph(path, store):
+    """Write a GraphStore to `path` in the binary format."""
+    header = np.zeros(1, dtype=_HEADER)
+    header[0] = (BINARY_MAGIC, BINARY_VERSION, store.dim, store.num_vertices, store.num_edges)
+    blocks = [
+        np.ascontiguousarray(store.ids, dtype=_IDS_DTYPE),
+        np.ascontiguousarray(store.positions, dtype=_POSITIONS_DTYPE),
+        np.ascontiguousarray(store.edges, dtype=_EDGES_DTYPE),
+    ]
+    # Write to a new file and rename it into place: the file being replaced may be mapped
+    # by the current graph, and rewriting it in place would change that graph under it
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(header.tobytes().ljust(_HEADER_SIZE, b"\0"))
+        for offset, block in zip(_binary_layout(store.dim, store.num_vertices, store.num_edges), blocks):
+            file.write(b"\0" * (offset - file.tell()))
+            block.tofile(file)
+    os.replace(temporary, path)
+
+
+# Maps the blocks of an open binary graph file copy-on-write into a store. The file object, not
+# the path, is kept for remapping: saving over the path renames a new file into place
+def _map_binary_graph(file, dim, num_vertices, num_edges):
+    ids_at, positions_at, edges_at, _ = _binary_layout(dim, num_vertices, num_edges)
+
+    def block(offset, dtype, shape):
+        if shape[0]:
+            return np.memmap(file, dtype=dtype, mode="c", offset=offset, shape=shape)
+        return np.empty(shape, dtype=dtype)
+
+    store = GraphStore.from_arrays(block(ids_at, _IDS_DTYPE, (num_vertices,)),
+                                   block(positions_at, _POSITIONS_DTYPE, (num_vertices, dim)),
+                                   block(edges_at, _EDGES_DTYPE, (num_edges, 2)))
+    store.remap = partial(_map_binary_graph, file, dim, num_vertices, num_edges)
+    return store
+
+
+def load_binary_graph(path, dim, mmap=True):
+    """Open a binary graph file as a GraphStore.
+
+    With `mmap` the blocks are memory-mapped copy-on-write: edits and layouts change the
+    store but never the file. Raises GraphFormatError for a bad header or truncated file.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        raw = file.read(_HEADER_SIZE)
+    if len(raw) < _HEADER_SIZE or raw[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise GraphFormatError("Not a binary graph file.")
+    header = np.frombuffer(raw[:_HEADER.itemsize], dtype=_HEADER)[0]
+    if header["version"] != BINARY_VERSION:
+        raise GraphFormatError(f"Unsupported binary graph version {header['version']}.")
+    if header["dim"] != dim:
+        raise GraphFormatError(f"The file holds a {header['dim']}D graph, expected {dim}D.")
+    num_vertices, num_edges = int(header["num_vertices"]), int(header["num_edges"])
+    ids_at, positions_at, edges_at, end = _binary_layout(dim, num_vertices, num_edges)
+    if size < end:
+        raise GraphFormatError(f"The file is truncated: {size} bytes, expected {end}.")
+
+    def block(offset, dtype, shape):
+        return np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+    if mmap:
+        store = _map_binary_graph(open(path, "rb"), dim, num_vertices, num_edges)
+    else:
+        store = GraphStore.from_arrays(block(ids_at, _IDS_DTYPE, (num_vertices,)),
+                                       block(positions_at, _POSITIONS_DTYPE, (num_vertices, dim)),
+                                       block(edges_at, _EDGES_DTYPE, (num_edges, 2)))
+    edges = store.edges
+    if num_edges and (edges.min() < 0 or edges.max() >= num_vertices):
+        raise GraphFormatError("An edge refers to a row outside the vertex block.")
+    return store
+
+
+def load_graph_file(path, dim, progress=None, require_positions=True):
+    """Load a graph in either format, telling them apart by the file header.
+
+    JSON files are streamed with `progress` reported as in load_json_graph; binary files
+    are memory-mapped, which is immediate. Returns None if the load was cancelled.
+    """
+    if is_binary_graph(path):
+        return load_binary_graph(path, dim)
+    return load_json_graph(path, dim, progress, require_positions)
@@ -1,6 +1,15 @@
-from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QApplication, QPushButton, QFileDialog, QInputDialog
+from PyQt5.QtWidgets import QMainWindow, QVBoxLayout, QWidget, QApplication, QPushButton, QFileDialog, QInputDialog, QProgressDialog, QLabel
+from PyQt5.QtCore import Qt, QTimer
 from graph_renderer import GraphRenderer
+from graph_io import load_graph_file, GraphFormatError, BINARY_EXTENSION
+from profiling import LayoutProfiler
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds between refreshes of the profiler overlay
+PROFILER_REFRESH_MS = 250
 
 
 class GraphUI(QMainWindow):
@@ -25,6 +34,12 @@ class GraphUI(QMainWindow):
         layout_button = QPushButton("Run Layout Algorithm")
         layout_button.clicked.connect(self.run_layout_algorithm)
 
+        pause_layout_button = QPushButton("Pause/Resume Layout")
+        pause_layout_button.clicked.connect(self.pause_layout_algorithm)
+
+        cancel_layout_button = QPushButton("Cancel Layout")
+        cancel_layout_button.clicked.connect(self.cancel_layout_algorithm)
+
         reset_button = QPushButton("Reset Graph")
         reset_button.clicked.connect(self.reset_graph)
 
@@ -39,14 +54,32 @@ class GraphUI(QMainWindow):
         redo_button = QPushButton("Redo")  # Redo button
         redo_button.clicked.connect(self.redo)
 
+        profiler_button = QPushButton("Show Profiler")
+        profiler_button.setCheckable(True)
+        profiler_button.toggled.connect(self.toggle_profiler)
+
+        # Layout and frame timings drawn over the top-left corner of the view while profiling
+        self.profiler_overlay = QLabel(self.gl_widget)
+        self.profiler_overlay.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 160); color: white; font-family: monospace; padding: 4px;")
+        self.profiler_overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.profiler_overlay.move(8, 8)
+        self.profiler_overlay.hide()
+        self.profiler_timer = QTimer(self)
+        self.profiler_timer.setInterval(PROFILER_REFRESH_MS)
+        self.profiler_timer.timeout.connect(self.update_profiler_overlay)
+
         layout.addWidget(add_vertex_button)
         layout.addWidget(add_edge_button)
         layout.addWidget(layout_button)
+        layout.addWidget(pause_layout_button)
+        layout.addWidget(cancel_layout_button)
         layout.addWidget(reset_button)
         layout.addWidget(load_file_button)
         layout.addWidget(save_file_button)
         layout.addWidget(undo_button) 
         layout.addWidget(redo_button)  
+        layout.addWidget(profiler_button)
 
         # Set the layout for the central widget
         self.setCentralWidget(central_widget)
@@ -62,58 +95,86 @@ class GraphUI(QMainWindow):
             self.gl_widget.select_vertex_by_id(vertex_id)
 
     def run_layout_algorithm(self):
-        """Run the force-directed layout algorithm."""
-        self.gl_widget.run_force_directed_algorithm()
+        """Run the force-directed layout algorithm in the background."""
+        self.gl_widget.start_background_layout()
+
+    def pause_layout_algorithm(self):
+        """Pause or resume the running layout."""
+        self.gl_widget.pause_background_layout()
+
+    def cancel_layout_algorithm(self):
+        """Cancel the running layout."""
+        self.gl_widget.cancel_background_layout()
 
     def reset_graph(self):
         """Reset the graph to its initial state."""
         self.gl_widget.reset_graph()
 
     def load_graph_from_file(self):
-        """Load a graph from a JSON file."""
+        """Load a graph from a JSON or binary graph file."""
         options = QFileDialog.Options()
          # Open a dialog to get the file path for loading
         file_path, _ = QFileDialog.getOpenFileName(
             self,
             "Open Graph File",
             "",
-            "JSON Files (*.json);;All Files (*)",
+            f"Graph Files (*.json *{BINARY_EXTENSION});;JSON Files (*.json);;Binary Graph Files (*{BINARY_EXTENSION});;All Files (*)",
             options=options
         )
         if file_path:   # Proceed if a file path was selected
+            progress = QProgressDialog("Loading graph...", "Cancel", 0, 1000, self)
+            progress.setWindowModality(Qt.WindowModal)
+            progress.setMinimumDuration(500)  # Only shown for files that take a while
             try:
-                with open(file_path, 'r') as file:
-                    graph_data = json.load(file)
-
-                # Pass the loaded JSON data to the renderer
-                self.gl_widget.load_graph(graph_data)
-                print(f"Graph loaded successfully from {file_path}")
-
-            except json.JSONDecodeError as e:
-                print(f"Error: Invalid JSON file format. {e}")
+                # Binary files are memory-mapped; JSON is streamed straight into arrays, keeping the dialog responsive
+                store = load_graph_file(file_path, dim=2, progress=lambda fraction: self.report_progress(progress, fraction))
+                if store is None:
+                    logger.info("Loading cancelled.")
+                    return
+
+                # Pass the loaded graph to the renderer
+                self.gl_widget.load_store(store)
+                logger.info("Graph loaded successfully from %s", file_path)
+
+            except GraphFormatError as e:
+                logger.error("Invalid graph file format. %s", e)
             except FileNotFoundError:
-                print("Error: File not found.")
+                logger.error("File not found.")
             except Exception as e:
-                print(f"Unexpected error: {e}")
+                logger.exception("Unexpected error: %s", e)
+            finally:
+                progress.close()
+
+    # Updates the load progress dialog; returns False once the user has cancelled
+    def report_progress(self, progress, fraction):
+        progress.setValue(int(fraction * 1000))
+        QApplication.processEvents()
+        return not progress.wasCanceled()
 
     def save_graph_to_file(self):
-        """Save the current graph to a JSON file."""
+        """Save the current graph to a JSON file, or a binary graph file if that format is chosen."""
         options = QFileDialog.Options()
-        file_path, _ = QFileDialog.getSaveFileName(
+        file_path, selected_filter = QFileDialog.getSaveFileName(
             self,
             "Save Graph File",
             "",
-            "JSON Files (*.json);;All Files (*)",
+            f"JSON Files (*.json);;Binary Graph Files (*{BINARY_EXTENSION});;All Files (*)",
             options=options
         )
         if file_path:
             try:
+                if file_path.endswith(BINARY_EXTENSION) or selected_filter.startswith("Binary"):
+                    if not file_path.endswith(BINARY_EXTENSION):
+                        file_path += BINARY_EXTENSION
+                    self.gl_widget.save_binary_graph(file_path)
+                    logger.info("Graph saved successfully to %s", file_path)
+                    return
                 graph_data = self.gl_widget.save_graph()
                 with open(file_path, 'w') as file:
                     json.dump(graph_data, file, indent=4) # Save JSON data to the file with indentation
-                print(f"Graph saved successfully to {file_path}")
+                logger.info("Graph saved successfully to %s", file_path)
             except Exception as e:
-                print(f"Error saving graph: {e}")
+                logger.exception("Error saving graph: %s", e)
 
     def undo(self):
         """Undo the last action."""
@@ -123,10 +184,35 @@ class GraphUI(QMainWindow):
         """Redo the last undone action."""
         self.gl_widget.redo()
 
+    def toggle_profiler(self, enabled):
+        """Start or stop profiling layouts and frames, with an overlay of the numbers."""
+        self.gl_widget.profiler = LayoutProfiler() if enabled else None
+        if enabled:
+            self.update_profiler_overlay()
+            self.profiler_overlay.show()
+            self.profiler_timer.start()
+        else:
+            self.profiler_timer.stop()
+            self.profiler_overlay.hide()
+        self.gl_widget.update()
+
+    # Refreshes the overlay text from the profiler; a layout started while profiling is timed phase by phase
+    def update_profiler_overlay(self):
+        profiler = self.gl_widget.profiler
+        if profiler is None:
+            return
+        self.profiler_overlay.setText(profiler.summary())
+        self.profiler_overlay.adjustSize()
+
 # Main execution block
 if __name__ == "__main__":
+    import os
     import sys
 
+    # Summaries at INFO by default; GRAPH_LOG_LEVEL=DEBUG adds per-event and per-vertex detail
+    logging.basicConfig(level=os.environ.get("GRAPH_LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
     app = QApplication(sys.argv)
     main_window = GraphUI()
     main_window.resize(800, 600)
@@ -0,0 +1,156 @@
+import zlib
+from collections import deque
+import numpy as np
+
+# Default upper bound on the memory held by the undo and redo stacks together
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class AddVertex:
+    """A vertex appended to the store; undone by removing the last vertex."""
+
+    def __init__(self, vertex_id, position):
+        self.vertex_id = vertex_id
+        self.position = np.array(position, dtype=float)
+        self.nbytes = self.position.nbytes + 64
+
+    def undo(self, store):
+        store.pop_vertex()
+
+    def redo(self, store):
+        store.add_vertex(self.vertex_id, self.position)
+
+
+class AddEdge:
+    """An edge appended to the store; undone by removing the last edge."""
+
+    nbytes = 64
+
+    def __init__(self, start_id, end_id):
+        self.start_id = start_id
+        self.end_id = end_id
+
+    def undo(self, store):
+        store.pop_edge()
+
+    def redo(self, store):
+        store.add_edge(self.start_id, self.end_id)
+
+
+class MovePositions:
+    """Positions of some rows changed, stored as a compressed XOR of the before/after bits.
+
+    XOR-ing the same mask twice restores the original bits, so one mask serves both undo and
+    redo. Small moves leave the sign, exponent and leading mantissa bits unchanged, which
+    makes the mask compress well.
+    """
+
+    def __init__(self, rows, before, after):
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.shape = (len(self.rows), before.shape[1])
+        mask = np.ascontiguousarray(before, dtype=np.float64).view(np.uint64) ^ \
+            np.ascontiguousarray(after, dtype=np.float64).view(np.uint64)
+        self.mask = zlib.compress(mask.tobytes(), 1)
+        self.nbytes = len(self.mask) + self.rows.nbytes + 64
+
+    # Records only the rows whose positions actually differ
+    @classmethod
+    def between(cls, before, after, rows=None):
+        """Return the move from `before` to `after` (arrays of the given rows), or None if nothing moved."""
+        rows = np.arange(len(before)) if rows is None else np.asarray(rows, dtype=np.int64)
+        changed = np.any(before != after, axis=1)
+        if not changed.any():
+            return None
+        return cls(rows[changed], before[changed], after[changed])
+
+    def _toggle(self, store):
+        mask = np.frombuffer(zlib.decompress(self.mask), dtype=np.uint64).reshape(self.shape)
+        current = np.ascontiguousarray(store.positions[self.rows], dtype=np.float64)
+        store.positions[self.rows] = (current.view(np.uint64) ^ mask).view(np.float64)
+
+    def undo(self, store):
+        self._toggle(store)
+
+    def redo(self, store):
+        self._toggle(store)
+
+
+class ReplaceGraph:
+    """The whole graph was replaced (load or reset); keeps both versions."""
+
+    def __init__(self, before, after):
+        self.before = before.snapshot()
+        self.after = after.snapshot()
+        # Stores mapped from a file hold no memory of their own
+        self.nbytes = sum(
+            store.ids.nbytes + store.positions.nbytes + store.edges.nbytes
+            for store in (self.before, self.after) if store.remap is None
+        )
+
+    def undo(self, store):
+        store.replace_with(self.before)
+
+    def redo(self, store):
+        store.replace_with(self.after)
+
+
+class CompoundCommand:
+    """Several commands recorded as one user action, undone in reverse order."""
+
+    def __init__(self, commands):
+        self.commands = [command for command in commands if command is not None]
+        self.nbytes = sum(command.nbytes for command in self.commands)
+
+    def undo(self, store):
+        for command in reversed(self.commands):
+            command.undo(store)
+
+    def redo(self, store):
+        for command in self.commands:
+            command.redo(store)
+
+
+class History:
+    """Undo/redo stacks of commands, bounded by the memory the commands hold."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.undo_stack = deque()
+        self.redo_stack = []
+        self.nbytes = 0
+
+    def push(self, command):
+        """Record a new action; clears the redo stack and evicts the oldest entries over the cap."""
+        if command is None:
+            return
+        self.nbytes -= sum(entry.nbytes for entry in self.redo_stack)
+        self.redo_stack.clear()  # Clear redo stack on new action
+        self.undo_stack.append(command)
+        self.nbytes += command.nbytes
+        while self.nbytes > self.max_bytes and len(self.undo_stack) > 1:
+            self.nbytes -= self.undo_stack.popleft().nbytes
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.nbytes = 0
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self, store):
+        """Revert the most recent action on `store` and return its command."""
+        command = self.undo_stack.pop()
+        command.undo(store)
+        self.redo_stack.append(command)
+        return command
+
+    def redo(self, store):
+        """Re-apply the most recently undone action on `store` and return its command."""
+        command = self.redo_stack.pop()
+        command.redo(store)
+        self.undo_stack.append(command)
+        return command
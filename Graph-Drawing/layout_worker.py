@@ -0,0 +1,65 @@
+from PyQt5.QtCore import QThread, QMutex, QWaitCondition, pyqtSignal
+
+
+class LayoutWorker(QThread):
+    """Runs a layout job off the GUI thread and publishes position snapshots while it converges.
+
+    The job is a callable `job(callback, callback_every)` returning the final (N, dim)
+    positions, such as ForceLayout.run or MultilevelLayout.run bound to their arrays.
+    Snapshots are copies, so the renderer never shares an array with the running layout,
+    unless the job publishes into `shared` (a SharedPositions, see
+    GraphModel.prepare_layout_job): then they are read-only views of its newest buffer,
+    passed on without copying.
+    """
+
+    snapshot = pyqtSignal(object, int)  # (positions copy or shared view, iterations completed)
+    layout_finished = pyqtSignal(object, bool)  # (final positions, cancelled)
+
+    def __init__(self, job, snapshot_every=5, parent=None, shared=None):
+        super(LayoutWorker, self).__init__(parent)
+        self.job = job
+        self.snapshot_every = snapshot_every
+        self.shared = shared  # SharedPositions the job publishes into, if any; freed by whoever created it
+        self._mutex = QMutex()
+        self._resume = QWaitCondition()
+        self._paused = False
+        self._cancelled = False
+
+    def run(self):
+        """Run the layout job in the worker thread."""
+        positions = self.job(self._on_iteration, self.snapshot_every)
+        self.layout_finished.emit(positions.copy(), self._cancelled)
+
+    # Called by the layout every `snapshot_every` iterations
+    def _on_iteration(self, iteration, positions):
+        self.snapshot.emit(positions if self.shared is not None else positions.copy(), iteration)
+        self._mutex.lock()
+        try:
+            while self._paused and not self._cancelled:
+                self._resume.wait(self._mutex)
+            return not self._cancelled
+        finally:
+            self._mutex.unlock()
+
+    def pause(self):
+        """Pause the layout at its next snapshot."""
+        self._mutex.lock()
+        self._paused = True
+        self._mutex.unlock()
+
+    def resume(self):
+        """Resume a paused layout."""
+        self._mutex.lock()
+        self._paused = False
+        self._resume.wakeAll()
+        self._mutex.unlock()
+
+    def cancel(self):
+        """Stop the layout at its next snapshot, keeping the positions reached so far."""
+        self._mutex.lock()
+        self._cancelled = True
+        self._resume.wakeAll()
+        self._mutex.unlock()
+
+    def is_paused(self):
+        return self._paused
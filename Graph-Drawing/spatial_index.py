@@ -0,0 +1,243 @@
+import numpy as np
+
+# Bits per axis of a packed grid cell key; cells beyond this range are clamped to the border
+CELL_BITS = 21
+# The grid is rebuilt once more than this fraction of the points have moved since the last build
+REBUILD_FRACTION = 0.05
+
+
+# Packs integer cell coordinates (N, dim) into one int64 key per row
+def _cell_keys(cells):
+    offset = 1 << (CELL_BITS - 1)
+    cells = np.clip(cells + offset, 0, (1 << CELL_BITS) - 1)
+    keys = np.zeros(len(cells), dtype=np.int64)
+    for axis in range(cells.shape[1]):
+        keys = (keys << CELL_BITS) | cells[:, axis]
+    return keys
+
+
+class GridIndex:
+    """Uniform grid over a set of points for nearest-point queries within a radius.
+
+    Points are bucketed by cell and the rows kept sorted by cell key, so a query only
+    binary-searches the cells its radius overlaps, O(log N) each, instead of scanning all
+    points. Moved points are tracked incrementally: their stale grid entries are skipped and
+    their current positions checked directly, until enough have moved to rebuild the grid.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.sorted_keys = None  # Cell key of every indexed row, ascending
+        self.order = None  # Rows in the order of sorted_keys
+        self.built = 0  # Number of rows when the grid was built
+        self.stale = None  # Rows whose grid entry is out of date
+        self.dirty_rows = set()
+
+    def invalidate(self):
+        """Drop the grid; it is rebuilt on the next query."""
+        self.sorted_keys = None
+
+    def moved(self, rows=None):
+        """Record that the points at `rows` (default: all points) changed."""
+        if rows is None:
+            self.invalidate()
+        elif self.sorted_keys is not None:
+            rows = np.asarray(rows, dtype=np.int64).ravel()
+            rows = rows[rows < self.built]
+            self.stale[rows] = True
+            self.dirty_rows.update(rows.tolist())
+
+    # Missing (NaN) points get an arbitrary cell; they never pass a distance test
+    def _point_keys(self, points):
+        scaled = np.nan_to_num(points / self.cell_size, nan=0.0, posinf=0.0, neginf=0.0)
+        return _cell_keys(np.floor(np.clip(scaled, -(1 << CELL_BITS), 1 << CELL_BITS)).astype(np.int64))
+
+    def build(self, points):
+        keys = self._point_keys(points)
+        self.order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[self.order]
+        self.built = len(points)
+        self.stale = np.zeros(len(points), dtype=bool)
+        self.dirty_rows = set()
+
+    # Rebuilds the grid once too many rows have moved or been appended to check them directly
+    def _refresh(self, points):
+        count = len(points)
+        if self.sorted_keys is None or len(self.dirty_rows) > REBUILD_FRACTION * self.built + 64 \
+                or count - self.built > REBUILD_FRACTION * self.built + 64:
+            self.build(points)
+
+    # Rows that are not (correctly) in the grid: moved since the build, or appended after it
+    def _unindexed_rows(self, count):
+        extra = np.fromiter((row for row in self.dirty_rows if row < count), dtype=np.int64)
+        return np.concatenate([extra, np.arange(self.built, count)])
+
+    # Indexed rows in the cells whose key lies in [start_keys[i], stop_keys[i]] for some i
+    def _rows_in_key_ranges(self, start_keys, stop_keys, count):
+        starts = np.searchsorted(self.sorted_keys, start_keys, side="left")
+        stops = np.searchsorted(self.sorted_keys, stop_keys, side="right")
+        lengths = np.maximum(stops - starts, 0)
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        rows = self.order[offsets + np.arange(lengths.sum())]
+        return rows[~self.stale[rows] & (rows < count)]
+
+    def nearest(self, points, center, radius):
+        """Return the row of the point nearest to `center` within `radius`, or None.
+
+        `points` is the current (N, dim) array; rows appended since the last build and rows
+        reported through moved() are checked directly.
+        """
+        count = len(points)
+        self._refresh(points)
+        center = np.asarray(center, dtype=np.float64)
+        low = np.floor((center - radius) / self.cell_size).astype(np.int64)
+        high = np.floor((center + radius) / self.cell_size).astype(np.int64)
+        cells = np.stack(np.meshgrid(*[np.arange(a, b + 1) for a, b in zip(low, high)], indexing="ij"), -1)
+        keys = _cell_keys(cells.reshape(-1, len(center)))
+        candidates = np.concatenate([self._rows_in_key_ranges(keys, keys, count), self._unindexed_rows(count)])
+        if len(candidates) == 0:
+            return None
+        distances = np.sqrt(((points[candidates] - center) ** 2).sum(axis=1))
+        best = np.argmin(np.where(distances <= radius, distances, np.inf))
+        return int(candidates[best]) if distances[best] <= radius else None
+
+    def rows_near(self, points, centers, radius):
+        """Return the sorted rows of the points within `radius` of any of the (M, dim) `centers`.
+
+        Each center reads the cells its radius overlaps, so the cost grows with the number of
+        centers and the points around them, not with N.
+        """
+        count = len(points)
+        self._refresh(points)
+        dim = points.shape[1]
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, dim)
+        low = np.floor((centers - radius) / self.cell_size).astype(np.int64)
+        high = np.floor((centers + radius) / self.cell_size).astype(np.int64)
+        span = int((high - low).max(initial=0)) + 1
+        steps = np.stack(np.meshgrid(*[np.arange(span)] * dim, indexing="ij"), -1).reshape(-1, dim)
+        # One (center, cell) pair for every cell of every center's box
+        owners = np.repeat(np.arange(len(centers)), len(steps))
+        keys = _cell_keys((low[:, None, :] + steps[None, :, :]).reshape(-1, dim))
+
+        # Expands the (center, cell) pairs into (center, row) pairs through rows sorted by cell key
+        def pairs(sorted_keys, order):
+            starts = np.searchsorted(sorted_keys, keys, side="left")
+            lengths = np.searchsorted(sorted_keys, keys, side="right") - starts
+            offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+            return np.repeat(owners, lengths), order[offsets + np.arange(lengths.sum())]
+
+        pair_owners, rows = pairs(self.sorted_keys, self.order)
+        indexed = ~self.stale[rows] & (rows < count)
+        extra = self._unindexed_rows(count)
+        extra_keys = self._point_keys(points[extra])
+        extra_order = np.argsort(extra_keys, kind="stable")
+        extra_owners, extra_rows = pairs(extra_keys[extra_order], extra[extra_order])
+        pair_owners = np.concatenate([pair_owners[indexed], extra_owners])
+        rows = np.concatenate([rows[indexed], extra_rows])
+        delta = points[rows] - centers[pair_owners]
+        return np.unique(rows[np.einsum("ij,ij->i", delta, delta) <= radius * radius])
+
+    def rows_in_box(self, points, low, high):
+        """Return the rows of the points inside the box [low, high], in no particular order.
+
+        Cells are keyed with the last axis varying fastest, so the cells of the box along that
+        axis form one contiguous run of sorted keys and each run costs a single pair of binary
+        searches; when the box is much larger than the grid's extent it is simply filtered.
+        """
+        count = len(points)
+        self._refresh(points)
+        low, high = np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64)
+        low_cell = np.floor(np.clip(low / self.cell_size, -(1 << CELL_BITS), 1 << CELL_BITS)).astype(np.int64)
+        high_cell = np.floor(np.clip(high / self.cell_size, -(1 << CELL_BITS), 1 << CELL_BITS)).astype(np.int64)
+        runs = np.prod(high_cell[:-1] - low_cell[:-1] + 1)
+        if runs > len(self.sorted_keys):
+            candidates = np.arange(count)
+        else:
+            prefixes = np.stack(np.meshgrid(*[np.arange(a, b + 1) for a, b in zip(low_cell[:-1], high_cell[:-1])],
+                                            indexing="ij"), -1).reshape(-1, len(low) - 1)
+            first = np.column_stack([prefixes, np.full(len(prefixes), low_cell[-1])])
+            last = np.column_stack([prefixes, np.full(len(prefixes), high_cell[-1])])
+            # Disjoint: stale rows are skipped in the grid and rows past `built` were never in it
+            candidates = np.concatenate([self._rows_in_key_ranges(_cell_keys(first), _cell_keys(last), count),
+                                         self._unindexed_rows(count)])
+        inside = np.all((points[candidates] >= low) & (points[candidates] <= high), axis=1)
+        return candidates[inside]
+
+
+def project_to_screen(points, modelview, projection, viewport):
+    """Project (N, 3) world points to window coordinates like gluProject, for all points at once.
+
+    `modelview` and `projection` are the column-major matrices returned by glGetDoublev.
+    Returns (N, 3) window x, y and depth; points behind the camera get NaN.
+    """
+    homogeneous = np.hstack([points, np.ones((len(points), 1))])
+    clip = homogeneous @ np.asarray(modelview) @ np.asarray(projection)
+    w = clip[:, 3:4]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ndc = np.where(w > 0, clip[:, :3] / w, np.nan)
+    x, y, width, height = np.asarray(viewport, dtype=np.float64)
+    return np.column_stack([x + width * (ndc[:, 0] + 1) / 2, y + height * (ndc[:, 1] + 1) / 2, (ndc[:, 2] + 1) / 2])
+
+
+class ScreenIndex:
+    """GridIndex over vertices projected to the screen, for picking in a 3D view.
+
+    The projection is vectorized and cached: a camera change re-projects every vertex on the
+    next pick, while moved vertices are re-projected individually.
+    """
+
+    def __init__(self, radius_pixels):
+        self.grid = GridIndex(cell_size=radius_pixels)
+        self.view = None  # (modelview, projection, viewport) the cache was projected with
+        self.screen = None  # (N, 2) window coordinates, NaN for vertices outside the depth range
+        self.dirty_rows = set()
+
+    def set_view(self, view):
+        """Re-project everything with new camera matrices on the next pick."""
+        self.view = view
+        self.screen = None
+        self.grid.invalidate()
+
+    def moved(self, rows=None):
+        """Record that the vertices at `rows` (default: all vertices) moved."""
+        if rows is None:
+            self.screen = None
+            self.grid.invalidate()
+        elif self.screen is not None:
+            self.dirty_rows.update(np.asarray(rows, dtype=np.int64).ravel().tolist())
+
+    def _project(self, positions):
+        projected = project_to_screen(positions, *self.view)
+        projected[~((projected[:, 2] >= 0) & (projected[:, 2] <= 1))] = np.nan  # Clipped by near/far planes
+        return projected[:, :2]
+
+    def screen_positions(self, positions):
+        """Return the (N, 2) window coordinates of `positions`, NaN where clipped; needs a view."""
+        if self.screen is None:
+            self.screen = self._project(positions)
+            self.dirty_rows = set()
+            self.grid.invalidate()
+        if len(positions) != len(self.screen):
+            grown = np.full((len(positions), 2), np.nan)
+            kept = min(len(positions), len(self.screen))
+            grown[:kept] = self.screen[:kept]
+            self.dirty_rows.update(range(kept, len(positions)))
+            self.screen = grown
+        rows = np.array(sorted(row for row in self.dirty_rows if row < len(positions)), dtype=np.int64)
+        if len(rows):
+            self.screen[rows] = self._project(positions[rows])
+            self.grid.moved(rows)
+        self.dirty_rows = set()
+        return self.screen
+
+    def nearest(self, positions, x, y, radius):
+        """Return the row of the vertex nearest to window point (x, y) within `radius` pixels, or None."""
+        if self.view is None or len(positions) == 0:
+            return None
+        return self.grid.nearest(self.screen_positions(positions), (x, y), radius)
+
+    def rows_in_view(self, positions):
+        """Return the window coordinates of all vertices and the rows of those inside the viewport."""
+        screen = self.screen_positions(positions)
+        x, y, width, height = np.asarray(self.view[2], dtype=np.float64)
+        return screen, self.grid.rows_in_box(screen, (x, y), (x + width, y + height))